@@ -0,0 +1,3 @@
+from .metrics import router as metrics_router
+from .health import router as health_router
+from .profiles import router as profiles_router
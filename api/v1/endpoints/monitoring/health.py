@@ -0,0 +1,19 @@
+from fastapi import APIRouter, status
+from fastapi.responses import ORJSONResponse
+
+from core.health import readiness
+
+
+router = APIRouter()
+
+
+# liveness: the process is up and its event loop answers; never touches the DB, so a DB outage does not restart workers
+@router.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+
+@router.get("/readyz", include_in_schema=False)
+async def readyz():
+    result = await readiness.run()
+    return ORJSONResponse(result, status_code=status.HTTP_200_OK if result["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE)
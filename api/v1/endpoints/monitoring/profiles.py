@@ -0,0 +1,27 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from api.v1.models.user.user_auth import User
+from auth.auth_bearer import get_admin
+from core.config import Settings, get_settings
+from core.profiling import list_profiles, profile_path
+
+
+router = APIRouter()
+
+
+@router.get("/admin/v1/profiles", response_model=List[str])
+def profiles(admin: User = Depends(get_admin), settings: Settings = Depends(get_settings)):
+    # newest first; each id is also returned as X-Profile-Id on the profiled response
+    return list_profiles(settings)
+
+
+@router.get("/admin/v1/profiles/{profile_id}", response_class=PlainTextResponse)
+def profile(profile_id: str, admin: User = Depends(get_admin), settings: Settings = Depends(get_settings)):
+    path = profile_path(settings, profile_id)
+    try:
+        with open(path) as f:
+            return PlainTextResponse(f.read(), headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'})
+    except (TypeError, FileNotFoundError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
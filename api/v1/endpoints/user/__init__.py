@@ -1,2 +1,6 @@
 from .user_auth import router as user_router
 from .google_auth import router as google_router
+from .login_audit import router as login_audit_router
+from .user_stats import router as user_stats_router
+from .user_search import router as user_search_router
+from .bulk_users import router as bulk_users_router
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import SQLAlchemyError
+
+from api.v1.models.user.user_auth import User
+from api.v1.schemas import BulkStatusUpdate, BulkUserResult, BulkUserSelection
+from auth.auth_bearer import get_admin
+from core import user_bulk
+
+
+router = APIRouter()
+
+
+def _selection(selection: BulkUserSelection) -> dict:
+    # an empty filter would select every user; ask for it explicitly by organization instead
+    if not selection.user_ids and not selection.organization_name:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Provide user_ids or organization_name.")
+    return {"user_ids": selection.user_ids or None, "organization_name": selection.organization_name}
+
+
+@router.post("/users/v1/bulk/status", response_model=BulkUserResult, status_code=status.HTTP_200_OK)
+async def bulk_update_status(data: BulkStatusUpdate, admin: User = Depends(get_admin)):
+    selection = _selection(data)
+    # the calling admin is never part of the selection, so nobody locks themselves out
+    try:
+        result = await run_in_threadpool(user_bulk.set_status, data.status, exclude=admin.user_id, **selection)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error occurred.")
+    return BulkUserResult(matched=result.matched, changed=result.changed)
+
+
+@router.post("/users/v1/bulk/delete", response_model=BulkUserResult, status_code=status.HTTP_200_OK)
+async def bulk_delete_users(data: BulkUserSelection, admin: User = Depends(get_admin)):
+    selection = _selection(data)
+    try:
+        result = await run_in_threadpool(user_bulk.delete_users, exclude=admin.user_id, **selection)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error occurred.")
+    return BulkUserResult(matched=result.matched, changed=result.changed)
@@ -1,4 +1,3 @@
-import os
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import RedirectResponse
 from google_auth_oauthlib.flow import Flow
@@ -8,48 +7,67 @@ from db.session import get_db
 from api.v1.models.user.user_auth import User
 from datetime import datetime
 from auth.auth_handler import signJWT
-from dotenv import load_dotenv
+from core.config import Settings, get_settings
+from api.v1.schemas import GoogleLoginResponse, LoginStatusEnum, LoginTypeEnum
+from core import events
+from core.audit import record_login
+from core.resilience import ProviderUnavailable, guarded_call
+from core.user_filter import user_filter
 import logging
 import json
 
 from utils.validators import generate_next_user_id
 
-load_dotenv()
-
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
-
 SCOPES = ["https://www.googleapis.com/auth/userinfo.email", 
           "https://www.googleapis.com/auth/userinfo.profile", 
           "openid"]
 
 router = APIRouter()
 
-client_secrets = {
-    "web": {
-        "client_id": GOOGLE_CLIENT_ID,
-        "project_id": os.getenv("GOOGLE_PROJECT_ID", ""),  
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_secret": GOOGLE_CLIENT_SECRET,
-        "redirect_uris": [GOOGLE_REDIRECT_URI],
+def get_client_secrets(settings: Settings) -> dict:
+    return {
+        "web": {
+            "client_id": settings.GOOGLE_CLIENT_ID,
+            "project_id": settings.GOOGLE_PROJECT_ID,
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+            "client_secret": settings.GOOGLE_CLIENT_SECRET,
+            "redirect_uris": [settings.GOOGLE_REDIRECT_URI],
+        }
     }
-}
+
+# network failures and 5xx count against the circuit; a rejected code does not
+GOOGLE_OUTAGES = (requests.ConnectionError, requests.Timeout, requests.HTTPError)
+
+
+def exchange_code(timeout: float, flow: Flow, code: str):
+    flow.fetch_token(code=code, timeout=timeout)
+    return flow.credentials
+
+
+def fetch_userinfo(timeout: float, access_token: str):
+    response = requests.get(
+        "https://www.googleapis.com/oauth2/v3/userinfo",
+        headers={"Authorization": f"Bearer {access_token}"},
+        timeout=timeout,
+    )
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response
 
 @router.get("/auth/v1/google/login")
-async def google_login():
+async def google_login(settings: Settings = Depends(get_settings)):
     try:
         flow = Flow.from_client_config(
-            client_secrets,
+            get_client_secrets(settings),
             scopes=SCOPES,
-            redirect_uri=GOOGLE_REDIRECT_URI
+            redirect_uri=settings.GOOGLE_REDIRECT_URI
         )
 
         authorization_url, state = flow.authorization_url(
@@ -64,8 +82,8 @@ async def google_login():
         logger.error(f"Error initiating Google OAuth flow: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to initiate Google login: {str(e)}")
 
-@router.get("/v1/auth/google/callback")
-async def google_callback(request: Request, db: Session = Depends(get_db)):
+@router.get("/v1/auth/google/callback", response_model=GoogleLoginResponse)
+async def google_callback(request: Request, db: Session = Depends(get_db), settings: Settings = Depends(get_settings)):
     try:
         code = request.query_params.get("code")
         if not code:
@@ -73,18 +91,17 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Missing authorization code")
 
         flow = Flow.from_client_config(
-            client_secrets,
+            get_client_secrets(settings),
             scopes=SCOPES,
-            redirect_uri=GOOGLE_REDIRECT_URI
+            redirect_uri=settings.GOOGLE_REDIRECT_URI
         )
 
-        flow.fetch_token(code=code)
-        credentials = flow.credentials
-
-        userinfo_response = requests.get(
-            "https://www.googleapis.com/oauth2/v3/userinfo",
-            headers={"Authorization": f"Bearer {credentials.token}"}
-        )
+        try:
+            credentials = await guarded_call("google:token", exchange_code, settings.GOOGLE_TIMEOUT_SECONDS, flow, code, trips=GOOGLE_OUTAGES)
+            userinfo_response = await guarded_call("google:userinfo", fetch_userinfo, settings.GOOGLE_TIMEOUT_SECONDS, credentials.token, trips=GOOGLE_OUTAGES)
+        except (ProviderUnavailable, *GOOGLE_OUTAGES) as e:
+            logger.error(f"Google is unavailable: {e}")
+            raise HTTPException(status_code=503, detail="Google sign-in is temporarily unavailable. Please try again later.")
         
         if userinfo_response.status_code != 200:
             logger.error(f"Failed to get user info: {userinfo_response.text}")
@@ -123,8 +140,10 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
                 is_verified=True if is_email_verified else False
             )
             db.add(new_user)
+            events.publish(db, events.GOOGLE_SIGNUP, {**events.user_payload(new_user), "provider_user_id": google_user_id})
             db.commit()
             db.refresh(new_user)
+            user_filter.add(new_user.email, new_user.phone_number)
             user = new_user
             
             try:
@@ -144,6 +163,7 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
                 logger.error(f"Error creating social auth record: {str(e)}")
 
         token, exp = signJWT(user.user_id, user.user_type)
+        record_login(request, user.user_id, LoginTypeEnum.google, LoginStatusEnum.success)
 
         return {
             "msg": "Google login successful",
@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from api.v1.models.user.user_auth import LoginAudit, User
+from api.v1.schemas import LoginAuditOut
+from auth.auth_bearer import get_admin, get_current_user
+from db.routing import get_read_db
+
+
+router = APIRouter()
+
+
+def fetch_login_audit(db: Session, user_id: str, limit: int, before: Optional[datetime]) -> list:
+    # newest first, paged by login_time so each page is a range scan on ix_login_audit_user_time
+    query = db.query(LoginAudit).filter(LoginAudit.user_id == user_id)
+    if before is not None:
+        query = query.filter(LoginAudit.login_time < before)
+    try:
+        return query.order_by(LoginAudit.login_time.desc(), LoginAudit.id.desc()).limit(limit).all()
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error occurred.")
+
+
+@router.get("/users/v1/me/login-audit", response_model=List[LoginAuditOut])
+def my_login_audit(
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[datetime] = Query(None, description="return entries older than this login_time"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    return fetch_login_audit(db, current_user.user_id, limit, before)
+
+
+@router.get("/users/v1/{user_id}/login-audit", response_model=List[LoginAuditOut])
+def user_login_audit(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[datetime] = Query(None, description="return entries older than this login_time"),
+    admin: User = Depends(get_admin),
+    db: Session = Depends(get_read_db),
+):
+    return fetch_login_audit(db, user_id, limit, before)
@@ -1,28 +1,40 @@
-from dotenv import load_dotenv
+from core.config import Settings, get_settings
 from core.phone_config import send_otp_sms
 from utils.validators import generate_next_user_id, validate_email, validate_password_strength, validate_phone_number, validate_username
-from datetime import datetime, time, timedelta
+from datetime import datetime, time, timedelta, timezone
+from email.utils import format_datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status,Form
+from urllib.parse import urlencode
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status,Form
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
 from api.v1.schemas import LoginUser, RegisterUser,OTPVerify, ALLUser, StatusEnum, UpdateUser,ForgotPassword,OTPVerifyPreRegister, UserType
+from api.v1.schemas import LoginStatusEnum, LoginTypeEnum
+from api.v1.schemas import ALL_USERS_ADAPTER, LoginOTPVerifiedResponse, MessageResponse, MsgResponse, RegisterResponse
+from auth.auth_bearer import DISABLED_STATUSES
 from auth.auth_handler import signJWT
+from auth.password_hasher import hash_password, needs_rehash, verify_password
+from auth.reset_token import create_reset_token, decode_reset_token, matches_password
+from core import events
+from core.audit import record_login
 from core.Email_config import send_email, send_otp_email
+from core.metrics import OTP_EVENTS
+from core.table_versions import USERS, etag, etag_matches, read_version
+from core.user_filter import user_filter
+from db.routing import get_read_db
 from db.session import get_db
+from db.sharding import shard_router
 from api.v1.models.user.user_auth import OTP, User
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import or_, and_
 import random
 import re
-import os
-import bcrypt
 import pytz
 import phonenumbers
 
 
 router = APIRouter()
-load_dotenv()
 
 utc_now = pytz.utc.localize(datetime.utcnow())
 ist_now = utc_now.astimezone(pytz.timezone('Asia/Kolkata'))
@@ -30,11 +42,25 @@ ist_now = utc_now.astimezone(pytz.timezone('Asia/Kolkata'))
 def generate_otp():
     return str(random.randint(1000, 9999))
 
+
+def rehash_password(user_id: str, password: str, old_hash: str):
+    db = shard_router.session()
+    try:
+        # only replace the hash we verified; a concurrent password reset wins
+        db.query(User).filter(User.user_id == user_id, User.password_hash == old_hash).update(
+            {User.password_hash: hash_password(password)}, synchronize_session=False
+        )
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+    finally:
+        db.close()
+
    
-@router.post("/auth/v1/pre-register/email-verification", status_code=status.HTTP_200_OK)
-async def pre_register(email: str, db: Session = Depends(get_db)):
+@router.post("/auth/v1/pre-register/email-verification", response_model=MsgResponse, status_code=status.HTTP_200_OK)
+async def pre_register(email: str, db: Session = Depends(get_db), read_db: Session = Depends(get_read_db), settings: Settings = Depends(get_settings)):
     try:
-        existing_user = db.query(User).filter(User.email == email).first()
+        existing_user = read_db.query(User).filter(User.email == email).first()
         if existing_user:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT,  detail="Email already registered")
 
@@ -44,7 +70,7 @@ async def pre_register(email: str, db: Session = Depends(get_db)):
 
         otp = generate_otp()
         now = datetime.utcnow()
-        expiry = now + timedelta(minutes=5)
+        expiry = now + timedelta(minutes=settings.OTP_EXPIRE_MINUTES)
 
         otp_entry = db.query(OTP).filter(and_(
                 OTP.email == email,
@@ -73,6 +99,7 @@ async def pre_register(email: str, db: Session = Depends(get_db)):
             db.add(otp_entry)
 
         db.commit()
+        OTP_EVENTS.labels("register", "issued").inc()
 
         await send_otp_email(email, otp, purpose="Registration")
 
@@ -87,8 +114,8 @@ async def pre_register(email: str, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Unexpected error occurred, please try again.")
 
-@router.post("/auth/v1/pre-register/verify-otp", status_code=status.HTTP_200_OK)
-async def verify_otp(data:OTPVerifyPreRegister, db: Session = Depends(get_db)):
+@router.post("/auth/v1/pre-register/verify-otp", response_model=MsgResponse, status_code=status.HTTP_200_OK)
+async def verify_otp(data:OTPVerifyPreRegister, db: Session = Depends(get_db), settings: Settings = Depends(get_settings)):
     try:
         email_validation = validate_email(data.email)
         if not email_validation["valid"]:
@@ -105,18 +132,20 @@ async def verify_otp(data:OTPVerifyPreRegister, db: Session = Depends(get_db)):
         if otp_entry.expired_at < datetime.utcnow():
             raise HTTPException(status_code=status.HTTP_410_GONE, detail="OTP has expired")
         
-        max_attempts = int(os.getenv("PRE_REGISTER_MAX_OTP_ATTEMPT_COUNT", 3))
-        if (otp_entry.attempt_count or 0) >= max_attempts:
+        if (otp_entry.attempt_count or 0) >= settings.PRE_REGISTER_MAX_OTP_ATTEMPT_COUNT:
             raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="You have attempted OTP verification too many times. Please try again later.")
 
         if otp_entry.otp_code != data.otp_code:
             otp_entry.attempt_count = (otp_entry.attempt_count or 0) + 1
             db.commit()
+            OTP_EVENTS.labels("register", "failed").inc()
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid OTP")
 
         otp_entry.is_verified = True
         otp_entry.attempt_count = otp_entry.attempt_count or 0
+        events.publish(db, events.EMAIL_VERIFIED, {"email": otp_entry.email})
         db.commit()
+        OTP_EVENTS.labels("register", "verified").inc()
 
         return {"msg": "OTP verified and email is now verified. You can now proceed with registration."}
 
@@ -130,7 +159,7 @@ async def verify_otp(data:OTPVerifyPreRegister, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Unexpected error occurred please try again")
 
    
-@router.post("/auth/v1/register", status_code=status.HTTP_200_OK)
+@router.post("/auth/v1/register", response_model=RegisterResponse, status_code=status.HTTP_200_OK)
 def register(
     user_name: str = Form(...),
     user_email: EmailStr = Form(...),
@@ -138,7 +167,8 @@ def register(
     organization_name: str = Form(None),
     user_password: str = Form(...),
     confirm_password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings)
 ):
     try:
         otp_entry = db.query(OTP).filter(OTP.email == user_email, OTP.is_verified == True).first()
@@ -170,7 +200,7 @@ def register(
         
         user_id=generate_next_user_id(db=db)
 
-        hashed_password = bcrypt.hashpw(user_password.encode(), bcrypt.gensalt()).decode()
+        hashed_password = hash_password(user_password)
 
         new_user = User(
             user_id=user_id,
@@ -186,8 +216,10 @@ def register(
         )
 
         db.add(new_user)
+        events.publish(db, events.USER_REGISTERED, events.user_payload(new_user))
         db.commit()
         db.refresh(new_user)
+        user_filter.add(new_user.email, new_user.phone_number)
 
         return {"message": "Registration successful","new_user": new_user.email,}
 
@@ -201,20 +233,21 @@ def register(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Unexpected error occurred please try again")
 
 
-@router.post("/auth/v1/login")
-async def login(user: LoginUser, db: Session = Depends(get_db)):
+@router.post("/auth/v1/login", response_model=MessageResponse)
+async def login(user: LoginUser, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db), settings: Settings = Depends(get_settings)):
     try:
         login_input = user.email_or_phone
+        known = user_filter.might_exist(login_input)
 
         if validate_email(login_input)["valid"]:
-            user_db = db.query(User).filter(User.email == login_input).first()
+            user_db = db.query(User).filter(User.email == login_input).first() if known else None
             email_or_phone = "email"
             otp_entry_data = {
                 "email": login_input,
                 "phone_number": None
             }
         elif validate_phone_number(login_input)["valid"]:
-            user_db = db.query(User).filter(User.phone_number == login_input).first()
+            user_db = db.query(User).filter(User.phone_number == login_input).first() if known else None
             email_or_phone = "phone"
             otp_entry_data = {
                 "email": None,
@@ -223,23 +256,36 @@ async def login(user: LoginUser, db: Session = Depends(get_db)):
         else:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid email or phone format.")
 
+        login_type = LoginTypeEnum.email if email_or_phone == "email" else LoginTypeEnum.phone
         if not user_db:
+            if known:
+                user_filter.record_false_positive()
+            record_login(request, None, login_type, LoginStatusEnum.failed)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist. Please register.")
 
-        if not bcrypt.checkpw(user.password.encode('utf-8'), user_db.password_hash.encode('utf-8')):
+        # hashing is deliberately slow; keep it off the event loop
+        if not await run_in_threadpool(verify_password, user.password, user_db.password_hash):
+            record_login(request, user_db.user_id, login_type, LoginStatusEnum.failed)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Passwords")
 
+        if user_db.status in DISABLED_STATUSES:
+            record_login(request, user_db.user_id, login_type, LoginStatusEnum.locked)
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Account is {user_db.status.value}")
+
+        if needs_rehash(user_db.password_hash):
+            background_tasks.add_task(rehash_password, user_db.user_id, user.password, user_db.password_hash)
+
         otp = generate_otp()
         now = datetime.utcnow()
-        expiry = now + timedelta(minutes=5)
+        expiry = now + timedelta(minutes=settings.OTP_EXPIRE_MINUTES)
 
+        # match only the identifier the OTP is sent to; comparing the other one with None would be IS NULL and
+        # pick up another user's pending login OTP
+        recipient = OTP.email == login_input if email_or_phone == "email" else OTP.phone_number == login_input
         existing_otp = db.query(OTP).filter(
             OTP.purpose == "login",
             OTP.is_verified == False,
-            (
-                (OTP.email == otp_entry_data["email"]) |
-                (OTP.phone_number == otp_entry_data["phone_number"])
-            ),
+            recipient,
             OTP.status == "active"
         ).order_by(OTP.generated_at.desc()).first()
 
@@ -262,12 +308,13 @@ async def login(user: LoginUser, db: Session = Depends(get_db)):
             db.add(new_otp)
 
         db.commit()
+        OTP_EVENTS.labels("login", "issued").inc()
 
         if email_or_phone == "email":
             await send_otp_email(user_db.email, otp, purpose="login")
             return {"message": "OTP sent successfully to your email"}
         else:
-            sms_sent = send_otp_sms(user_db.phone_number, otp)
+            sms_sent = await send_otp_sms(user_db.phone_number, otp)
             if sms_sent:
                 return {"message": "OTP sent successfully to your phone"}
             else:
@@ -283,14 +330,16 @@ async def login(user: LoginUser, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Unexpected error occurred, please try again.")
 
 
-@router.post("/auth/v1/verify-login-otp", status_code=status.HTTP_200_OK)
-def verify_otp(data: OTPVerify, db: Session = Depends(get_db)):
+@router.post("/auth/v1/verify-login-otp", response_model=LoginOTPVerifiedResponse, status_code=status.HTTP_200_OK)
+def verify_otp(data: OTPVerify, request: Request, db: Session = Depends(get_db), settings: Settings = Depends(get_settings)):
     try:
         login_input = data.email_or_phone
 
         if validate_email(login_input)["valid"]:
             user_db = db.query(User).filter(User.email == login_input).first()
+            login_type = LoginTypeEnum.email
         else:
+            login_type = LoginTypeEnum.phone
             try:
                 parsed_phone = phonenumbers.parse(login_input, None)
                 if phonenumbers.is_valid_number(parsed_phone):
@@ -330,22 +379,29 @@ def verify_otp(data: OTPVerify, db: Session = Depends(get_db)):
             otp_entry.otp_code = None
             otp_entry.status = "expired"
             db.commit()
+            OTP_EVENTS.labels("login", "expired").inc()
+            record_login(request, user_db.user_id, login_type, LoginStatusEnum.failed)
             raise HTTPException(status_code=400, detail="OTP has expired")
         
-        max_attempts = int(os.getenv("LOGIN_MAX_OTP_ATTEMPT_COUNT", 3))
         if otp_entry.otp_code != data.otp_code:
             otp_entry.attempt_count = (otp_entry.attempt_count or 0) + 1
-            if otp_entry.attempt_count >= max_attempts:
+            if otp_entry.attempt_count >= settings.LOGIN_MAX_OTP_ATTEMPT_COUNT:
                 otp_entry.status = "frozen"
             db.commit()
 
             if otp_entry.status == "frozen":
+                OTP_EVENTS.labels("login", "frozen").inc()
+                record_login(request, user_db.user_id, login_type, LoginStatusEnum.locked)
                 raise HTTPException(status_code=status.HTTP_423_LOCKED, detail="Too many failed attempts. Please try again.")
+            OTP_EVENTS.labels("login", "failed").inc()
+            record_login(request, user_db.user_id, login_type, LoginStatusEnum.failed)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid OTP")
 
         otp_entry.is_verified = True
         otp_entry.status = "used"
         db.commit()
+        OTP_EVENTS.labels("login", "verified").inc()
+        record_login(request, user_db.user_id, login_type, LoginStatusEnum.success)
 
         token, exp = signJWT(user_db.user_id, user_db.user_type)
 
@@ -365,8 +421,8 @@ def verify_otp(data: OTPVerify, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Unexpected error occurred. Please try again.")
     
 
-@router.post("/auth/v1/forgot-password/send-link")
-async def send_forgot_password_email(email: str, db: Session = Depends(get_db)):
+@router.post("/auth/v1/forgot-password/send-link", response_model=MessageResponse)
+async def send_forgot_password_email(email: str, db: Session = Depends(get_read_db), settings: Settings = Depends(get_settings)):
 
     email_validation = validate_email(email)
     if not email_validation["valid"]:
@@ -376,12 +432,14 @@ async def send_forgot_password_email(email: str, db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User with this email does not exist")
 
-    reset_link = f"https://021b-2405-201-37-21d9-5198-9ec5-664-4a64.ngrok-free.app/api/auth/v1/forgot-password"
+    token = create_reset_token(user.user_id, user.password_hash)
+    reset_link = f"{settings.PASSWORD_RESET_URL}?{urlencode({'token': token})}"
 
     email_body = f"""
     <h3>Password Reset Request</h3>
     <p>Click the link below to reset your password:</p>
     <p><a href="{reset_link}" target="_blank">Reset Password</a></p>
+    <p>This link expires in {settings.PASSWORD_RESET_TOKEN_EXPIRE_MINUTES} minutes and can only be used once.</p>
     """
 
     try:
@@ -395,17 +453,19 @@ async def send_forgot_password_email(email: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to send email.")
     
 
-@router.post("/auth/v1/forgot-password", response_model=None)
-async def reset_password(data: ForgotPassword, db: Session = Depends(get_db)):
+@router.post("/auth/v1/forgot-password", response_model=MessageResponse)
+async def reset_password(data: ForgotPassword, db: Session = Depends(get_db), settings: Settings = Depends(get_settings)):
     try:
-        email_validation = validate_email(data.email)
-        if not email_validation["valid"]:
-            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=email_validation["message"])
-            
-        user_db = db.query(User).filter(User.email == data.email).first()
-        if not user_db:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found with this email")
+        # signature and expiry are checked before touching the DB
+        decoded = decode_reset_token(data.token)
+        if decoded is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid or expired reset link")
+        user_id, fingerprint = decoded
 
+        user_db = db.query(User).filter(User.user_id == user_id).first()
+        # the fingerprint stops matching once the password changes, so a used link cannot be replayed
+        if not user_db or not matches_password(fingerprint, user_db.password_hash):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid or expired reset link")
 
         password_validation = validate_password_strength(data.new_password)
         if not password_validation["valid"]:
@@ -414,9 +474,16 @@ async def reset_password(data: ForgotPassword, db: Session = Depends(get_db)):
         if data.new_password != data.confirm_password:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Passwords do not match")
 
-        hashed_password = bcrypt.hashpw(data.new_password.encode(), bcrypt.gensalt()).decode()
-        user_db.password_hash = hashed_password
+        hashed_password = await run_in_threadpool(hash_password, data.new_password)
+        # conditional on the hash the token was checked against, so two concurrent uses cannot both succeed
+        updated = db.query(User).filter(User.user_id == user_id, User.password_hash == user_db.password_hash).update(
+            {User.password_hash: hashed_password}, synchronize_session=False
+        )
+        if not updated:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid or expired reset link")
         
+        events.publish(db, events.PASSWORD_RESET, {"user_id": user_id, "email": user_db.email})
         db.commit()
         
         return {"message": "Password has been reset successfully. You can now login with your new password."}
@@ -431,25 +498,24 @@ async def reset_password(data: ForgotPassword, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Unexpected error occurred. Please try again.")
     
     
-@router.get("/users/v1/all-users", status_code=status.HTTP_200_OK)
-def get_all_users(db: Session = Depends(get_db)):
+@router.get("/users/v1/all-users", response_model=List[ALLUser], status_code=status.HTTP_200_OK)
+def get_all_users(request: Request, db: Session = Depends(get_read_db)):
     
     try:
-        users = db.query(User).all()
-        return [
-            {
-                "user_id": user.user_id,
-                "username": user.username,
-                "email": user.email,
-                "phone_number": user.phone_number,
-                "user_type": user.user_type,
-                "is_verified": user.is_verified,
-                "organization_name": user.organization_name,
-                "status": user.status,
-                "created_at": user.created_at,
-            }
-            for user in users
-        ]
+        # dashboards poll this; an unchanged listing costs one primary-key read and a 304. The version is read before
+        # the rows, so a write landing in between only makes the next poll fetch again
+        version, updated_at = read_version(db, USERS)
+        headers = {"ETag": etag(version, updated_at), "Cache-Control": "no-cache"}
+        if updated_at is not None:
+            headers["Last-Modified"] = format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        # only the listed columns, read as plain rows instead of hydrating full User objects
+        columns = [getattr(User, name) for name in ALLUser.model_fields]
+        users = db.query(*columns).all()
+        body = ALL_USERS_ADAPTER.dump_json(ALL_USERS_ADAPTER.validate_python(users, from_attributes=True))
+        return Response(content=body, media_type="application/json", headers=headers)
 
     except SQLAlchemyError:
         db.rollback()
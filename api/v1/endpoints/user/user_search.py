@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from api.v1.models.user.user_auth import User
+from api.v1.schemas import ALLUser
+from auth.auth_bearer import get_admin
+from core.user_search import search_users
+from db.routing import get_read_db
+from db.session import api_response
+
+
+router = APIRouter()
+
+
+@router.get("/users/v1/search", status_code=status.HTTP_200_OK)
+def search(
+    q: str = Query(..., min_length=1, max_length=255, description="email or username prefix, or part of an organization name"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    admin: User = Depends(get_admin),
+    db: Session = Depends(get_read_db),
+):
+    # email matches first, then username, then organization; see core.user_search for the ranking
+    try:
+        users = search_users(db, q, limit, offset)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error occurred.")
+    data = [ALLUser.model_validate(user).model_dump() for user in users]
+    return api_response(status.HTTP_200_OK, data=data, message="Search results", count=len(data))
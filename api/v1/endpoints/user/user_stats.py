@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from api.v1.models.user.user_auth import User
+from auth.auth_bearer import get_admin
+from core.user_stats import read_stats
+from db.routing import get_read_db
+from db.session import api_response
+
+
+router = APIRouter()
+
+
+@router.get("/users/v1/stats", status_code=status.HTTP_200_OK)
+def user_stats(
+    signup_days: int = Query(30, ge=1, le=366, description="how many of the most recent signup days to include"),
+    admin: User = Depends(get_admin),
+    db: Session = Depends(get_read_db),
+):
+    # served from the rollup counters in core.user_stats; never counts the user table
+    try:
+        stats = read_stats(db, signup_days)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error occurred.")
+    total = stats.pop("total")
+    return api_response(status.HTTP_200_OK, data=stats, message="User statistics", total=total, count=len(stats["signup_day"]))
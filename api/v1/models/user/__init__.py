@@ -1,2 +1,2 @@
-from .user_auth import User, OTP
+from .user_auth import User, OTP, LoginAudit
 from .google_auth import SocialAuth 
\ No newline at end of file
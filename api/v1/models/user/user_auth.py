@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Enum, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db.session import Base
@@ -9,14 +9,14 @@ from api.v1.schemas import StatusEnum, TenantTypeEnum,LoginTypeEnum, LoginStatus
 class User(Base):
     __tablename__ = 'user'
     user_id = Column(String(10), primary_key=True, unique=True, index=True, nullable=False)
-    username = Column(String(255))
+    username = Column(String(255), index=True)
     email = Column(String(255), unique=True)
     phone_number = Column(String(255))
-    organization_name = Column(String(255))
+    organization_name = Column(String(255), index=True)
     password_hash = Column(String(255))
     status = Column(Enum(StatusEnum))
     user_type = Column(String(255))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     is_verified = Column(Boolean, default=False)
     #is_login_without_otp = Column(Boolean, default=False)
 
@@ -91,16 +91,79 @@ class OTP(Base):
 #     menu = relationship("FrontEndMenu")
 
 
-# class LoginAudit(Base):
-#     __tablename__ = 'login_audit'
-#     id = Column(Integer, primary_key=True)
-#     user_id = Column(String, ForeignKey('user.user_id'))
-#     login_time = Column(DateTime, default=datetime.utcnow)
-#     login_type = Column(Enum(LoginTypeEnum))
-#     status = Column(Enum(LoginStatusEnum))
-#     ip_address = Column(String)
-
-#     user = relationship("User", back_populates="login_audits")
+# append-only; rows are written in batches by core.audit, never through the ORM unit of work
+class LoginAudit(Base):
+    __tablename__ = 'login_audit'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String(10), ForeignKey('user.user_id'), nullable=True)
+    login_time = Column(DateTime, default=datetime.utcnow, nullable=False)
+    login_type = Column(Enum(LoginTypeEnum))
+    status = Column(Enum(LoginStatusEnum))
+    ip_address = Column(String(45))
+
+    __table_args__ = (Index("ix_login_audit_user_time", "user_id", "login_time"),)
+
+
+# dashboard rollups maintained by core.user_stats: ("status", "active") -> number of active users, and so on
+class UserStat(Base):
+    __tablename__ = 'user_stats'
+    dimension = Column(String(32), primary_key=True)
+    value = Column(String(64), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# change counters maintained by core.table_versions: ("user", 42) -> the user listing has changed 42 times
+class TableVersion(Base):
+    __tablename__ = 'table_version'
+    name = Column(String(32), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+
+# id counters on the primary; see utils.validators.generate_next_user_id
+class IdSequence(Base):
+    __tablename__ = 'id_sequence'
+    name = Column(String(32), primary_key=True)
+    value = Column(Integer, nullable=False)
+
+
+# responses to requests sent with an Idempotency-Key; see core.idempotency
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_key'
+    key = Column(String(64), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    # null while the first request is still running
+    status = Column(Integer)
+    headers = Column(JSON)
+    body = Column(LargeBinary)
+    claimed_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# one row per fleet-wide background job; see core.leases
+class WorkerLease(Base):
+    __tablename__ = 'worker_lease'
+    name = Column(String(64), primary_key=True)
+    owner = Column(String(128))
+    leased_until = Column(DateTime)
+
+
+# transactional outbox of user lifecycle events, delivered to webhooks by core.events
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_event'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_type = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+# per-subscriber delivery position; the lease keeps one worker delivering to a subscriber at a time
+class WebhookCursor(Base):
+    __tablename__ = 'webhook_cursor'
+    subscriber = Column(String(255), primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String(128))
+    leased_until = Column(DateTime)
 
 
 # class PasswordHistory(Base):
@@ -1,5 +1,5 @@
 import enum
-from pydantic import BaseModel, EmailStr, constr
+from pydantic import BaseModel, ConfigDict, EmailStr, TypeAdapter, constr
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -16,6 +16,7 @@ class TenantTypeEnum(str, Enum):
 
 class LoginTypeEnum(str, Enum):
     email = "email"
+    phone = "phone"
     google = "google"
     admin = "admin"
 
@@ -67,10 +68,22 @@ class OTPVerify(BaseModel):
     otp_code: str
 
 class ForgotPassword(BaseModel):
-    email: str
+    token: str
     new_password: str
     confirm_password: str
 
+# admin bulk operations: user_ids, organization_name or both (then both must match)
+class BulkUserSelection(BaseModel):
+    user_ids: Optional[List[str]] = None
+    organization_name: Optional[str] = None
+
+class BulkStatusUpdate(BulkUserSelection):
+    status: StatusEnum
+
+class BulkUserResult(BaseModel):
+    matched: int
+    changed: int
+
 
 class RegisterUserResponse(BaseModel):
     message: str
@@ -87,34 +100,62 @@ class LoginResponse(BaseModel):
 
 class UserOut(RegisterUser):
     created_at: datetime
-    class Config:
-        orm_mode = True
+
+    model_config = ConfigDict(from_attributes=True)
         
 class ALLUser(BaseModel):
-    user_id: int
-    username: str
-    email: str
+    user_id: str
+    username: Optional[str]
+    email: Optional[str]
     phone_number: Optional[str]
-    status: Optional[str]
     user_type: Optional[str]
-    created_at: datetime
-    is_verified: bool
+    is_verified: Optional[bool]
+    organization_name: Optional[str]
+    status: Optional[StatusEnum]
+    created_at: Optional[datetime]
+
+    model_config = ConfigDict(from_attributes=True)
+
 
-    class Config:
-        orm_mode = True
+# built once: validating and dumping straight to JSON bytes skips a dict per row
+ALL_USERS_ADAPTER = TypeAdapter(List[ALLUser])
+
+
+class MessageResponse(BaseModel):
+    message: str
+
+class MsgResponse(BaseModel):
+    msg: str
+
+class RegisterResponse(BaseModel):
+    message: str
+    new_user: str
+
+class LoginOTPVerifiedResponse(BaseModel):
+    msg: str
+    email: str
+    token: str
+
+class GoogleLoginResponse(BaseModel):
+    msg: str
+    token: str
+    username: Optional[str]
+    email: str
+    user_type: Optional[str]
+    created_at: Optional[datetime]
+    expires_at: float
 
 # LoginAudit
 class LoginAuditBase(BaseModel):
-    user_id: str
+    user_id: Optional[str]
     login_type: LoginTypeEnum
     status: LoginStatusEnum
-    ip_address: str
+    ip_address: Optional[str]
 
 class LoginAuditOut(LoginAuditBase):
     id: int
     login_time: datetime
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # PasswordHistory
@@ -123,8 +164,7 @@ class PasswordHistoryOut(BaseModel):
     user_id: str
     password_hash: str
     changed_at: datetime
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # OTP
@@ -136,8 +176,7 @@ class OTPOut(BaseModel):
     is_verified: bool
     generated_at: datetime
     expired_at: datetime
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # SocialAuth
@@ -149,5 +188,4 @@ class SocialAuthOut(BaseModel):
     access_token: str
     refresh_token: str
     expiry_token: str
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
@@ -4,9 +4,12 @@ from auth.auth_handler import decodeJWT
 from db.session import get_db
 from sqlalchemy.orm import Session
 from typing import Optional
-from api.v1.models.user import User, UserMFA, UserSession
+from api.v1.models.user import User
+from api.v1.schemas import StatusEnum
 from jwt import PyJWTError
 
+DISABLED_STATUSES = (StatusEnum.locked, StatusEnum.inactive)
+
 
 # user_ops = User()
 
@@ -35,6 +38,14 @@ class JWTBearer(HTTPBearer):
             return False
 
 
+def require_enabled(user: User) -> User:
+    # the user row is read from the primary on every authenticated request, so locking or deactivating it revokes
+    # issued tokens at once; a lagging replica would keep them valid until it caught up
+    if user.status in DISABLED_STATUSES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Account is {user.status.value}")
+    return user
+
+
 def get_user_id_from_token(token: str = Depends(JWTBearer())):
     payload = decodeJWT(token)
 
@@ -49,7 +60,7 @@ def get_admin(user_id: int = Depends(get_user_id_from_token), db: Session = Depe
         raise HTTPException(status_code=404, detail="User not found")
     if user.user_type != "admin":
         raise HTTPException(status_code=403, detail="You are not authorized to perform this action")
-    return user
+    return require_enabled(user)
 
 
 
@@ -59,7 +70,7 @@ def get_admin_or_teacher(user_id: int = Depends(get_user_id_from_token), db: Ses
         raise HTTPException(status_code=404, detail="User not found")
     if user.user_type not in ["teacher", "admin"]:
         raise HTTPException(status_code=403, detail="You are not authorized to perform this action")
-    return user
+    return require_enabled(user)
 
 
 def get_current_user(token: str = Depends(JWTBearer()), db: Session = Depends(get_db)) -> Optional[User]:
@@ -80,7 +91,7 @@ def get_current_user(token: str = Depends(JWTBearer()), db: Session = Depends(ge
                 detail="User not found",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return user
+        return require_enabled(user)
     except PyJWTError:
         raise HTTPException(
             status_code=401,
@@ -3,11 +3,9 @@ from __future__ import annotations
 import time
 from typing import Any
 import jwt
-from decouple import config
 from jwt import PyJWTError
 
-JWT_SECRET = config('secret')
-JWT_ALGORITHM = config('algorithm')
+from core.config import get_settings
 
 
 def token_response(token: str):
@@ -17,20 +15,22 @@ def token_response(token: str):
 
 
 def signJWT(user_id: str, user_type: str) -> tuple[Any, float]:
-    expiration_time = time.time() + 1 * 24 * 60 * 60
+    settings = get_settings()
+    expiration_time = time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
     payload = {
         "user_id": user_id,
         "user_type": user_type,
         "exp": expiration_time
     }
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    token = jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
     return token, expiration_time
 
 
 def decodeJWT(token: str) -> Any | None:
+    settings = get_settings()
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        decoded_token = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
         if decoded_token.get("exp") and decoded_token["exp"] < time.time():
             return None
             # Check if the necessary claims are present
@@ -0,0 +1,196 @@
+import logging
+import statistics
+import time
+from typing import Optional
+import bcrypt
+
+from core.config import Settings, get_settings, on_settings_reload
+from core.metrics import PASSWORD_HASH_DURATION
+from core.tracing import start_span
+
+try:
+    import argon2
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:  # argon2-cffi is only needed when PASSWORD_HASH_ALGORITHM=argon2id
+    argon2 = None
+
+_argon2_verifier = argon2.PasswordHasher() if argon2 is not None else None
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+ARGON2_PREFIX = "$argon2id$"
+_CALIBRATION_PASSWORD = b"calibration-Passw0rd!"
+
+
+class PasswordHasher:
+    def __init__(self):
+        # (algorithm, bcrypt rounds, argon2 hasher), replaced in one assignment so readers never see a mix
+        self._state: Optional[tuple] = None
+
+    @property
+    def algorithm(self) -> Optional[str]:
+        return self._state[0] if self._state else None
+
+    #------------------------------------------------- configuration -------------------------------------------------
+
+    def configure(self, settings: Settings, calibrate: Optional[bool] = None) -> None:
+        calibrate = settings.PASSWORD_HASH_CALIBRATE if calibrate is None else calibrate
+        algorithm = settings.PASSWORD_HASH_ALGORITHM.lower()
+
+        if algorithm == "bcrypt":
+            rounds = self._calibrate_bcrypt(settings) if calibrate else settings.BCRYPT_ROUNDS
+            self._state = ("bcrypt", rounds, None)
+            logger.info(f"Password hashing: bcrypt, cost {rounds}")
+        elif algorithm == "argon2id":
+            if argon2 is None:
+                raise RuntimeError("PASSWORD_HASH_ALGORITHM=argon2id requires the argon2-cffi package")
+            time_cost = self._calibrate_argon2(settings) if calibrate else settings.ARGON2_TIME_COST
+            hasher = self._argon2_hasher(settings, time_cost)
+            self._state = ("argon2id", None, hasher)
+            logger.info(
+                f"Password hashing: argon2id, t={time_cost} m={settings.ARGON2_MEMORY_COST_KIB}KiB "
+                f"p={settings.ARGON2_PARALLELISM}"
+            )
+        else:
+            raise ValueError(f"Unsupported PASSWORD_HASH_ALGORITHM: {settings.PASSWORD_HASH_ALGORITHM}")
+
+    def _current(self) -> tuple:
+        if self._state is None:
+            self.configure(get_settings(), calibrate=False)
+        return self._state
+
+    @staticmethod
+    def _argon2_hasher(settings: Settings, time_cost: int):
+        return argon2.PasswordHasher(
+            time_cost=time_cost,
+            memory_cost=settings.ARGON2_MEMORY_COST_KIB,
+            parallelism=settings.ARGON2_PARALLELISM,
+            type=argon2.Type.ID,
+        )
+
+    @staticmethod
+    def _median_seconds(func, samples: int = 3) -> float:
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def _calibrate_bcrypt(self, settings: Settings) -> int:
+        # every extra round doubles the work, so one measurement at the floor predicts the rest
+        floor = settings.BCRYPT_MIN_ROUNDS
+        salt = bcrypt.gensalt(rounds=floor)
+        elapsed = self._median_seconds(lambda: bcrypt.hashpw(_CALIBRATION_PASSWORD, salt))
+        budget = settings.PASSWORD_HASH_TARGET_MS / 1000
+
+        rounds = floor
+        while rounds < settings.BCRYPT_MAX_ROUNDS and elapsed * 2 ** (rounds + 1 - floor) <= budget:
+            rounds += 1
+        logger.info(f"bcrypt cost {floor} took {elapsed * 1000:.1f} ms; using cost {rounds} for a {settings.PASSWORD_HASH_TARGET_MS:.0f} ms budget")
+        return rounds
+
+    def _calibrate_argon2(self, settings: Settings) -> int:
+        # argon2 time scales roughly linearly with time_cost at a fixed memory cost
+        probe = self._argon2_hasher(settings, 1)
+        elapsed = self._median_seconds(lambda: probe.hash(_CALIBRATION_PASSWORD))
+        budget = settings.PASSWORD_HASH_TARGET_MS / 1000
+        time_cost = int(budget / elapsed) if elapsed > 0 else settings.ARGON2_MAX_TIME_COST
+        time_cost = max(settings.ARGON2_MIN_TIME_COST, min(settings.ARGON2_MAX_TIME_COST, time_cost))
+        logger.info(f"argon2id t=1 took {elapsed * 1000:.1f} ms; using t={time_cost} for a {settings.PASSWORD_HASH_TARGET_MS:.0f} ms budget")
+        return time_cost
+
+    #------------------------------------------------- hashing -------------------------------------------------
+
+    def hash(self, password: str) -> str:
+        algorithm, rounds, argon2_hasher = self._current()
+        with start_span("password.hash", algorithm=algorithm), PASSWORD_HASH_DURATION.labels("hash").time():
+            if algorithm == "argon2id":
+                return argon2_hasher.hash(password)
+            return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+    def verify(self, password: str, hashed: Optional[str]) -> bool:
+        # hashes we cannot parse (e.g. the GOOGLE_AUTH placeholder) never match
+        if not hashed:
+            return False
+        with start_span("password.verify"), PASSWORD_HASH_DURATION.labels("verify").time():
+            if hashed.startswith(BCRYPT_PREFIXES):
+                try:
+                    return bcrypt.checkpw(password.encode(), hashed.encode())
+                except ValueError:
+                    return False
+            if hashed.startswith(ARGON2_PREFIX) and argon2 is not None:
+                try:
+                    # parameters come from the hash itself, so any argon2 instance can verify it
+                    return _argon2_verifier.verify(hashed, password)
+                except (VerificationError, InvalidHashError):
+                    return False
+        return False
+
+    def needs_rehash(self, hashed: Optional[str]) -> bool:
+        # only upgrade: a hash at or above the current cost is left alone so calibration jitter
+        # between workers does not cause rehash churn
+        algorithm, rounds, current = self._current()
+        if not hashed:
+            return False
+        if algorithm == "bcrypt":
+            if not hashed.startswith(BCRYPT_PREFIXES):
+                return hashed.startswith(ARGON2_PREFIX)
+            try:
+                return int(hashed.split("$")[2]) < rounds
+            except (IndexError, ValueError):
+                return False
+        if hashed.startswith(BCRYPT_PREFIXES):
+            return True
+        if not hashed.startswith(ARGON2_PREFIX):
+            return False
+        try:
+            stored = argon2.extract_parameters(hashed)
+        except InvalidHashError:
+            return False
+        return (
+            stored.time_cost < current.time_cost
+            or stored.memory_cost < current.memory_cost
+            or stored.parallelism != current.parallelism
+        )
+
+    def describe(self) -> dict:
+        algorithm, rounds, argon2_hasher = self._current()
+        if algorithm == "argon2id":
+            return {
+                "algorithm": "argon2id",
+                "time_cost": argon2_hasher.time_cost,
+                "memory_cost_kib": argon2_hasher.memory_cost,
+                "parallelism": argon2_hasher.parallelism,
+            }
+        return {"algorithm": "bcrypt", "rounds": rounds}
+
+
+password_hasher = PasswordHasher()
+
+
+def hash_password(password: str) -> str:
+    return password_hasher.hash(password)
+
+
+def verify_password(password: str, hashed: Optional[str]) -> bool:
+    return password_hasher.verify(password, hashed)
+
+
+def needs_rehash(hashed: Optional[str]) -> bool:
+    return password_hasher.needs_rehash(hashed)
+
+
+_HASHING_SETTINGS = (
+    "PASSWORD_HASH_ALGORITHM", "PASSWORD_HASH_TARGET_MS", "PASSWORD_HASH_CALIBRATE",
+    "BCRYPT_ROUNDS", "BCRYPT_MIN_ROUNDS", "BCRYPT_MAX_ROUNDS",
+    "ARGON2_TIME_COST", "ARGON2_MIN_TIME_COST", "ARGON2_MAX_TIME_COST",
+    "ARGON2_MEMORY_COST_KIB", "ARGON2_PARALLELISM",
+)
+
+
+@on_settings_reload
+def _reconfigure_hasher(old: Settings, new: Settings) -> None:
+    if any(getattr(old, name) != getattr(new, name) for name in _HASHING_SETTINGS):
+        password_hasher.configure(new)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+from core.config import get_settings
+
+# Password reset tokens are checked without a DB table: the signature covers the user, an expiry and a
+# fingerprint of the password hash at issue time. Resetting the password changes the hash, which makes every
+# outstanding token for that user (including the one just used) invalid.
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _key() -> bytes:
+    # separate from the JWT signing key so a reset token can never be replayed as an access token
+    return hashlib.sha256(b"password-reset:" + get_settings().JWT_SECRET.encode()).digest()
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_key(), payload, hashlib.sha256).digest()
+
+
+def password_fingerprint(password_hash: str) -> str:
+    # keyed, so the token never reveals anything about the hash itself
+    return _b64encode(hmac.new(_key(), password_hash.encode(), hashlib.sha256).digest()[:12])
+
+
+def create_reset_token(user_id: str, password_hash: str, expires_in: Optional[float] = None) -> str:
+    if expires_in is None:
+        expires_in = get_settings().PASSWORD_RESET_TOKEN_EXPIRE_MINUTES * 60
+    expires_at = int(time.time() + expires_in)
+    payload = f"{user_id}:{expires_at}:{password_fingerprint(password_hash)}".encode()
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def decode_reset_token(token: str) -> Optional[tuple[str, str]]:
+    # returns (user_id, fingerprint) for an authentic, unexpired token; the caller still compares the fingerprint
+    try:
+        encoded_payload, encoded_signature = token.split(".")
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+        user_id, expires_at, fingerprint = payload.decode().rsplit(":", 2)
+        expires_at = int(expires_at)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    if expires_at < time.time():
+        return None
+    return user_id, fingerprint
+
+
+def matches_password(fingerprint: str, password_hash: str) -> bool:
+    return hmac.compare_digest(fingerprint, password_fingerprint(password_hash))
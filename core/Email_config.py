@@ -10,59 +10,82 @@ from dotenv import load_dotenv
 import os
 from datetime import datetime, timedelta, timezone
 
+from functools import partial
 
-load_dotenv()
+from core.config import get_settings
+from core.metrics import observe_notification
+from core.resilience import call_with_failover
 
 
 ######################################################################################################################
                 # For sending Email
 #######################################################################################################################
 
-async def send_email(subject, email_to, body):
-    # Set up the SMTP server
-    smtp_server = os.getenv("smtp_server_name")
-    smtp_port = os.getenv("smtp_port_name")
-    smtp_username = os.getenv("smtp_username_name")  
-    smtp_password = os.getenv("smtp_password_name") 
-    try:
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
+def build_email_message(sender, email_to, subject, body) -> str:
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = email_to
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg.as_string()
+
+
+def _send_smtp(timeout, provider, smtp_server, smtp_port, smtp_username, smtp_password, email_to, subject, body):
+    with observe_notification("email", provider):
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=timeout)
         server.starttls()  
         server.login(smtp_username, smtp_password)  
         
-        msg = MIMEMultipart()
-        msg['From'] = smtp_username
-        msg['To'] = email_to
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
-
-        server.sendmail(smtp_username, email_to, msg.as_string())
+        message = build_email_message(smtp_username, email_to, subject, body)
+        server.sendmail(smtp_username, email_to, message)
         server.quit()
 
+
+def email_providers(settings) -> list:
+    providers = [("smtp", partial(_send_smtp, provider="smtp", smtp_server=settings.SMTP_SERVER, smtp_port=settings.SMTP_PORT,
+                                  smtp_username=settings.SMTP_USER, smtp_password=settings.SMTP_PASSWORD))]
+    if settings.SMTP_FALLBACK_SERVER:
+        providers.append(("smtp_fallback", partial(_send_smtp, provider="smtp_fallback", smtp_server=settings.SMTP_FALLBACK_SERVER,
+                                                   smtp_port=settings.SMTP_FALLBACK_PORT, smtp_username=settings.SMTP_FALLBACK_USER,
+                                                   smtp_password=settings.SMTP_FALLBACK_PASSWORD)))
+    return providers
+
+
+async def send_email(subject, email_to, body):
+    # runs off the event loop, bounded by SMTP_TIMEOUT_SECONDS and the request budget, failing over to the second relay
+    settings = get_settings()
+    try:
+        await call_with_failover("email", email_providers(settings), settings.SMTP_TIMEOUT_SECONDS,
+                                 email_to=email_to, subject=subject, body=body)
     except Exception as e:
         
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
 ############################################################################################################
 
-async def send_otp_email(user_email: str, otp_code: str, purpose:str):
-
+def build_otp_email(otp_code: str, purpose: str) -> tuple:
+    expire_minutes = get_settings().OTP_EXPIRE_MINUTES
     utc_now = datetime.now(timezone.utc)  
-    expiry_time_utc = utc_now + timedelta(minutes=5)
+    expiry_time_utc = utc_now + timedelta(minutes=expire_minutes)
     formatted_expiry = expiry_time_utc.strftime('%d %b %Y')
 
     body = f"""
     <h3>OTP Verification for {purpose} process</h3>
     <p>Your One-Time Password (OTP):</p>
     <h2 style="color: #2e6c80;">{otp_code}</h2>
-    <p>This OTP is valid for only 5 minutes (<b>{formatted_expiry}</b>) .</p>
+    <p>This OTP is valid for only {expire_minutes} minutes (<b>{formatted_expiry}</b>) .</p>
     <p style="color: #cc0000;"><strong>Do not share this OTP with anyone.</strong> It is confidential and only intended for you.</p>
     
     """
+    return f"Your OTP Code for {purpose}", body
+
+
+async def send_otp_email(user_email: str, otp_code: str, purpose:str):
 
+    subject, body = build_otp_email(otp_code, purpose)
     try:
         await send_email(
-            subject=f"Your OTP Code for {purpose}",
+            subject=subject,
             email_to=user_email,
             body=body
         )
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from starlette.requests import Request
+
+from api.v1.models.user.user_auth import LoginAudit
+from api.v1.schemas import LoginStatusEnum, LoginTypeEnum
+from core.config import Settings, get_settings, on_settings_reload
+from core.metrics import AUDIT_EVENTS, AUDIT_FLUSH_DURATION
+from db import session as db_session
+
+logger = logging.getLogger(__name__)
+
+DROP_LOG_INTERVAL_SECONDS = 60
+
+
+class LoginAuditTrail:
+    def __init__(self, capacity: int, batch_size: int, flush_interval: float):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._events = deque()
+        self._ready = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # losing audit events must not go unnoticed: counted, logged and reported by /readyz
+        self.dropped = 0
+        self.last_dropped_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    #------------------------------------------------- producers -------------------------------------------------
+
+    def record(self, user_id: Optional[str], login_type: LoginTypeEnum, status: LoginStatusEnum, ip_address: Optional[str]) -> None:
+        # never blocks the request: a full buffer sheds its oldest event instead
+        event = {
+            "user_id": user_id,
+            "login_type": login_type,
+            "status": status,
+            "ip_address": ip_address,
+            "login_time": datetime.utcnow(),
+        }
+        with self._ready:
+            if len(self._events) >= self.capacity:
+                self._events.popleft()
+                self._dropped(1)
+            self._events.append(event)
+            if len(self._events) >= self.batch_size:
+                self._ready.notify()
+        AUDIT_EVENTS.labels("queued").inc()
+
+    def _dropped(self, count: int) -> None:
+        # called with the buffer lock held; logs once per burst rather than once per event
+        now = time.monotonic()
+        if self.last_dropped_at is None or now - self.last_dropped_at >= DROP_LOG_INTERVAL_SECONDS:
+            logger.error(f"Login audit buffer full ({self.capacity} events): dropping the oldest events")
+        self.dropped += count
+        self.last_dropped_at = now
+        AUDIT_EVENTS.labels("dropped").inc(count)
+
+    def dropped_within(self, seconds: float) -> bool:
+        return self.last_dropped_at is not None and time.monotonic() - self.last_dropped_at < seconds
+
+    #------------------------------------------------- flushing -------------------------------------------------
+
+    def _take_batch(self) -> list:
+        with self._ready:
+            count = min(self.batch_size, len(self._events))
+            return [self._events.popleft() for _ in range(count)]
+
+    def _requeue(self, batch: list) -> None:
+        # put a failed batch back at the front, keeping newer events if there is no longer room
+        with self._ready:
+            room = self.capacity - len(self._events)
+            if room < len(batch):
+                self._dropped(len(batch) - max(room, 0))
+                batch = batch[len(batch) - max(room, 0):]
+            self._events.extendleft(reversed(batch))
+
+    def _write_rows(self, batch: list) -> tuple:
+        # a batch the database refused outright: written one by one so only the bad rows are left out.
+        # Returns (written, False) when a transient error cut it short; the rest is back in the queue
+        written = 0
+        for index, event in enumerate(batch):
+            try:
+                try:
+                    with db_session.engine.begin() as conn:
+                        conn.execute(insert(LoginAudit), [event])
+                except IntegrityError as e:
+                    if event["user_id"] is None:
+                        raise
+                    # the user is gone, or lives on another shard; keep the attempt without the link
+                    logger.warning(f"Login audit event for unknown user {event['user_id']} stored without it: {e}")
+                    with db_session.engine.begin() as conn:
+                        conn.execute(insert(LoginAudit), [{**event, "user_id": None}])
+            except IntegrityError as e:
+                AUDIT_EVENTS.labels("rejected").inc()
+                logger.error(f"Dropping a login audit event the database rejects: {e}")
+                continue
+            except SQLAlchemyError as e:
+                AUDIT_EVENTS.labels("failed").inc(len(batch) - index)
+                logger.error(f"Writing login audit events failed, will retry: {e}")
+                self._requeue(batch[index:])
+                return written, False
+            written += 1
+        AUDIT_EVENTS.labels("written").inc(written)
+        return written, True
+
+    def flush(self) -> int:
+        written = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return written
+            start = time.perf_counter()
+            try:
+                with db_session.engine.begin() as conn:
+                    conn.execute(insert(LoginAudit), batch)
+            except IntegrityError:
+                # permanent for at least one row; requeueing the whole batch would retry it forever
+                count, ok = self._write_rows(batch)
+                written += count
+                if not ok:
+                    return written
+                continue
+            except SQLAlchemyError as e:
+                AUDIT_EVENTS.labels("failed").inc(len(batch))
+                logger.error(f"Writing {len(batch)} login audit events failed, will retry: {e}")
+                self._requeue(batch)
+                return written
+            AUDIT_FLUSH_DURATION.observe(time.perf_counter() - start)
+            AUDIT_EVENTS.labels("written").inc(len(batch))
+            written += len(batch)
+            if len(batch) < self.batch_size:
+                return written
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._ready:
+                if len(self._events) < self.batch_size:
+                    self._ready.wait(self.flush_interval)
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="login-audit-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._ready:
+            self._ready.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+
+login_audit = LoginAuditTrail(
+    get_settings().AUDIT_BUFFER_CAPACITY,
+    get_settings().AUDIT_BATCH_SIZE,
+    get_settings().AUDIT_FLUSH_INTERVAL_SECONDS,
+)
+
+
+def record_login(request: Request, user_id: Optional[str], login_type: LoginTypeEnum, status: LoginStatusEnum) -> None:
+    # behind a proxy the server resolves X-Forwarded-For into request.client (see SERVER_FORWARDED_ALLOW_IPS)
+    ip_address = request.client.host if request.client else None
+    login_audit.record(user_id, login_type, status, ip_address)
+
+
+@on_settings_reload
+def _resize_audit_trail(old: Settings, new: Settings) -> None:
+    login_audit.capacity = new.AUDIT_BUFFER_CAPACITY
+    login_audit.batch_size = new.AUDIT_BATCH_SIZE
+    login_audit.flush_interval = new.AUDIT_FLUSH_INTERVAL_SECONDS
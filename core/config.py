@@ -1,66 +1,428 @@
 import os
-from pydantic_settings import BaseSettings
-from functools import lru_cache
+import signal
+import logging
+import threading
+from typing import Callable, List, Optional
+from dotenv import load_dotenv
+from pydantic import AliasChoices, Field, field_validator, model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+logger = logging.getLogger(__name__)
+
+ENV_FILE = ".env"
+# only ever good enough for local development; production refuses to start with it
+DEVELOPMENT_JWT_SECRET = "development_secret_key"
+
+load_dotenv(ENV_FILE)
+
+
+def _split_urls(value: str) -> List[str]:
+    return [url.strip() for url in value.split(",") if url.strip()]
 
 
 class Settings(BaseSettings):
-    APP_NAME: str = "FastAPI OTP Auth"
+    model_config = SettingsConfigDict(env_file=ENV_FILE, case_sensitive=True, extra="ignore", frozen=True)
+
+    APP_NAME: str = "WOFR Backend"
     API_V1_STR: str = "/api/v1"
     API_V2_STR: str = "/api/v2"
-    
-    SECRET_KEY: str = os.getenv("SECRET_KEY", "development_secret_key")
-    ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
-    
-    OTP_EXPIRE_MINUTES: int = 10
-    
-    DB_HOST: str = "localhost"
-    DB_PORT: str = "5432"
-    DB_USER: str = "postgres"
-    DB_PASSWORD: str = "postgres"
-    DB_NAME: str = "fastapi_auth"
-    
-    SMTP_SERVER: str = "smtp.example.com"
-    SMTP_PORT: int = 587
-    SMTP_USER: str = "noreply@example.com"
-    SMTP_PASSWORD: str = "your_password"
-    
-    ENVIRONMENT: str = os.getenv("dev", "prod")
-    
+
+    ENVIRONMENT: str = "dev"
+    DEBUG: bool = False
+
+    # --------------------------------------------- server ---------------------------------------------
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8001
+    # 0 sizes the pool from the CPU limit (cgroup quota when running in a container)
+    SERVER_WORKERS: int = 0
+    SERVER_WORKERS_PER_CPU: float = 1.0
+    SERVER_MAX_WORKERS: int = 16
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_SECONDS: int = 5
+    SERVER_TIMEOUT_SECONDS: int = 60
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    # recycle workers after this many requests (with jitter) to bound slow leaks; 0 disables
+    SERVER_MAX_REQUESTS: int = 0
+    SERVER_MAX_REQUESTS_JITTER: int = 0
+    SERVER_LIMIT_CONCURRENCY: Optional[int] = None
+    SERVER_FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+
+    # --------------------------------------------- database ---------------------------------------------
+    DEV_DATABASE_URL: Optional[str] = None
+    PROD_DATABASE_URL: Optional[str] = None
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: int = 30
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    SLOW_QUERY_MS: float = 200.0
+    QUERY_BUDGET_PER_REQUEST: int = 10
+    N_PLUS_ONE_THRESHOLD: int = 5
+
+    # --------------------------------------------- cors ---------------------------------------------
+    # comma-separated exact origins ("*" allows any, refused in production with credentials on);
+    # CORS_ALLOW_ORIGIN_REGEX adds e.g. preview deployments
+    CORS_ALLOW_ORIGINS: str = "*"
+    CORS_ALLOW_ORIGIN_REGEX: Optional[str] = None
+    CORS_ALLOW_CREDENTIALS: bool = True
+    CORS_ALLOW_METHODS: str = "*"
+    CORS_ALLOW_HEADERS: str = "*"
+    # browsers cap this (Chromium at 2 hours), so higher values buy nothing
+    CORS_MAX_AGE_SECONDS: int = 7200
+
+    # --------------------------------------------- tracing ---------------------------------------------
+    # needs opentelemetry-sdk; a sampled upstream traceparent is always followed, new traces use the ratio
+    TRACING_ENABLED: bool = False
+    TRACING_SERVICE_NAME: str = "wofr-backend"
+    TRACING_SAMPLE_RATIO: float = 0.1
+    TRACING_EXPORTER: str = "file"  # file | otlp | console | none
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+
+    # --------------------------------------------- profiling ---------------------------------------------
+    # admins profile a request with "X-Profile: 1"; the sample rate profiles random requests as well
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_INTERVAL_MS: float = 2.0
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_FILES: int = 200
+
+    # --------------------------------------------- read replicas ---------------------------------------------
+    # comma-separated; when empty every read goes to the primary
+    DEV_REPLICA_DATABASE_URLS: str = ""
+    PROD_REPLICA_DATABASE_URLS: str = ""
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = 5.0
+    # after a write, that client's reads stay on the primary for this long
+    READ_YOUR_WRITES_SECONDS: float = 10.0
+
+    # --------------------------------------------- sharding ---------------------------------------------
+    # comma-separated databases that hold user and otp rows next to the primary, which is always shard "0";
+    # when empty nothing is sharded
+    DEV_SHARD_DATABASE_URLS: str = ""
+    PROD_SHARD_DATABASE_URLS: str = ""
+    # emails hash into this many buckets and whole buckets move between shards; never change it once data exists
+    SHARD_BUCKETS: int = 4096
+    # how often workers re-read the bucket map that python -m db.sharding rebalance writes
+    SHARD_MAP_REFRESH_SECONDS: float = 30.0
+
+    # --------------------------------------------- static assets ---------------------------------------------
+    STATIC_DIR: str = "static"
+    # whether python -m core.static_assets writes gzip/brotli variants next to each file; workers only read them
+    STATIC_PRECOMPRESS: bool = True
+    STATIC_COMPRESS_MIN_BYTES: int = 1024
+    # for plain names; fingerprinted names are always cached as immutable
+    STATIC_MAX_AGE_SECONDS: int = 300
+
+    # --------------------------------------------- jwt ---------------------------------------------
+    JWT_SECRET: str = Field(DEVELOPMENT_JWT_SECRET, validation_alias=AliasChoices("JWT_SECRET", "secret"))
+    JWT_ALGORITHM: str = Field("HS256", validation_alias=AliasChoices("JWT_ALGORITHM", "algorithm"))
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 24 * 60
+
+    # --------------------------------------------- password reset ---------------------------------------------
+    # the emailed link is PASSWORD_RESET_URL?token=...; the page posts the token back to /auth/v1/forgot-password
+    PASSWORD_RESET_URL: str = "http://localhost:3000/reset-password"
+    PASSWORD_RESET_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # --------------------------------------------- otp / validation ---------------------------------------------
+    OTP_EXPIRE_MINUTES: int = 5
+    PRE_REGISTER_MAX_OTP_ATTEMPT_COUNT: int = 3
+    LOGIN_MAX_OTP_ATTEMPT_COUNT: int = 3
+    USERNAME_MIN_LEN: int = 3
+    USERNAME_MAX_LEN: int = 30
+
+    # --------------------------------------------- user existence filter ---------------------------------------------
+    # bloom filter of registered emails/phones; a definite miss answers pre-register and login without the DB
+    USER_FILTER_ENABLED: bool = True
+    USER_FILTER_FALSE_POSITIVE_RATE: float = 0.01
+    USER_FILTER_BUILD_BATCH_SIZE: int = 5000
+    # spare capacity so new registrations do not push the real false-positive rate past the target
+    USER_FILTER_HEADROOM: float = 2.0
+    # other workers' registrations are picked up from user.created_at at this interval
+    USER_FILTER_SYNC_INTERVAL_SECONDS: float = 1.0
+    USER_FILTER_REBUILD_INTERVAL_SECONDS: float = 6 * 60 * 60
+
+    # --------------------------------------------- user statistics ---------------------------------------------
+    # counters are kept up to date on every write; this pass recounts from the user table to correct any drift. 0 disables
+    USER_STATS_RECONCILE_INTERVAL_SECONDS: float = 60 * 60
+
+    # --------------------------------------------- user search ---------------------------------------------
+    # the organization trigram index picks up other workers' writes and drops stale names at this interval
+    USER_SEARCH_REFRESH_SECONDS: float = 5 * 60
+    # trigram similarity (as in pg_trgm) an organization needs to match a query it does not contain
+    USER_SEARCH_MIN_SIMILARITY: float = 0.3
+
+    # --------------------------------------------- bulk user operations ---------------------------------------------
+    # users per UPDATE/DELETE statement and per transaction
+    USER_BULK_CHUNK_SIZE: int = 1000
+
+    # --------------------------------------------- webhooks ---------------------------------------------
+    # comma-separated subscriber URLs; every subscriber receives every user lifecycle event
+    WEBHOOK_URLS: str = ""
+    # key for the HMAC-SHA256 X-Webhook-Signature header
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_BATCH_SIZE: int = 100
+    # batches in flight to one subscriber at a time
+    WEBHOOK_MAX_IN_FLIGHT: int = 2
+    WEBHOOK_TIMEOUT_SECONDS: float = 10.0
+    # events published by this worker go out at once; other workers' are found by polling at this interval
+    WEBHOOK_POLL_INTERVAL_SECONDS: float = 2.0
+    # failed deliveries back off exponentially from the base up to the max
+    WEBHOOK_RETRY_BASE_SECONDS: float = 1.0
+    WEBHOOK_RETRY_MAX_SECONDS: float = 5 * 60
+    # a worker that stops renewing its lease on a subscriber hands it over after this long
+    WEBHOOK_LEASE_SECONDS: float = 30.0
+    # a missing outbox id holds back the events after it until it commits, or until they are older than this and
+    # it is taken to have rolled back
+    WEBHOOK_GAP_GRACE_SECONDS: float = 60.0
+    # events every subscriber has received are deleted once older than this
+    OUTBOX_RETENTION_HOURS: float = 72
+
+    # --------------------------------------------- idempotency ---------------------------------------------
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 60 * 60
+    # a key claimed by a request that never finished (its worker died) can be used again after this long
+    IDEMPOTENCY_CLAIM_SECONDS: float = 2 * 60
+    # how long a duplicate waits for the first request carrying the same key before giving up with 409
+    IDEMPOTENCY_WAIT_SECONDS: float = 30.0
+
+    # --------------------------------------------- login audit ---------------------------------------------
+    # events wait in memory and are written in multi-row batches; when full, the oldest are dropped
+    AUDIT_BUFFER_CAPACITY: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 1.0
+
+    # --------------------------------------------- password hashing ---------------------------------------------
+    PASSWORD_HASH_ALGORITHM: str = "bcrypt"  # bcrypt | argon2id
+    # when enabled, the cost is benchmarked at startup to fit PASSWORD_HASH_TARGET_MS
+    PASSWORD_HASH_CALIBRATE: bool = True
+    PASSWORD_HASH_TARGET_MS: float = 250.0
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_MIN_ROUNDS: int = 10
+    BCRYPT_MAX_ROUNDS: int = 16
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MIN_TIME_COST: int = 2
+    ARGON2_MAX_TIME_COST: int = 10
+    ARGON2_MEMORY_COST_KIB: int = 65536
+    ARGON2_PARALLELISM: int = 2
+
+    # --------------------------------------------- smtp ---------------------------------------------
+    SMTP_SERVER: Optional[str] = Field(None, validation_alias=AliasChoices("SMTP_SERVER", "smtp_server_name"))
+    SMTP_PORT: int = Field(587, validation_alias=AliasChoices("SMTP_PORT", "smtp_port_name"))
+    SMTP_USER: Optional[str] = Field(None, validation_alias=AliasChoices("SMTP_USER", "smtp_username_name"))
+    SMTP_PASSWORD: Optional[str] = Field(None, validation_alias=AliasChoices("SMTP_PASSWORD", "smtp_password_name"))
+    # optional second relay, used when the primary fails or its circuit is open
+    SMTP_FALLBACK_SERVER: Optional[str] = None
+    SMTP_FALLBACK_PORT: int = 587
+    SMTP_FALLBACK_USER: Optional[str] = None
+    SMTP_FALLBACK_PASSWORD: Optional[str] = None
+    SMTP_TIMEOUT_SECONDS: float = 10.0
+
+    # --------------------------------------------- sms ---------------------------------------------
+    TWILIO_ACCOUNT_SID: Optional[str] = None
+    TWILIO_AUTH_TOKEN: Optional[str] = None
+    TWILIO_PHONE_NUMBER: Optional[str] = None
+    # optional second Twilio account / sender number for failover
+    TWILIO_FALLBACK_ACCOUNT_SID: Optional[str] = None
+    TWILIO_FALLBACK_AUTH_TOKEN: Optional[str] = None
+    TWILIO_FALLBACK_PHONE_NUMBER: Optional[str] = None
+    SMS_TIMEOUT_SECONDS: float = 10.0
+
+    # --------------------------------------------- google oauth ---------------------------------------------
+    GOOGLE_CLIENT_ID: Optional[str] = None
+    GOOGLE_CLIENT_SECRET: Optional[str] = None
+    GOOGLE_REDIRECT_URI: Optional[str] = None
+    GOOGLE_PROJECT_ID: str = ""
+    GOOGLE_TIMEOUT_SECONDS: float = 10.0
+
+    # --------------------------------------------- health checks ---------------------------------------------
+    # /readyz results are reused for this long, so probe traffic hits the DB at most once per interval per worker
+    HEALTH_CACHE_SECONDS: float = 2.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 2.0
+    HEALTH_MAX_THREADPOOL_WAITING: int = 50
+    HEALTH_MAX_AUDIT_BUFFER_FILL: float = 0.9
+    # readiness fails for this long after the login audit buffer had to drop events
+    HEALTH_AUDIT_DROP_WINDOW_SECONDS: float = 60.0
+    HEALTH_FAIL_ON_OPEN_CIRCUIT: bool = False
+    # on SIGTERM a worker keeps serving but fails /readyz for this long, then shuts down
+    HEALTH_DRAIN_SECONDS: float = 5.0
+
+    # --------------------------------------------- outbound resilience ---------------------------------------------
+    # every request gets this budget; outbound calls are cut to whatever is left of it
+    REQUEST_BUDGET_SECONDS: float = 20.0
+    # consecutive failures that open a provider's circuit, and how long it stays open before a probe call
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30.0
+    CIRCUIT_HALF_OPEN_MAX_CALLS: int = 1
+
+    # --------------------------------------------- reload ---------------------------------------------
+    # 0 disables polling of the env file; SIGHUP still triggers a reload
+    SETTINGS_WATCH_INTERVAL_SECONDS: float = 2.0
+
+    @property
+    def DATABASE_URL(self) -> Optional[str]:
+        return self.DEV_DATABASE_URL
+
+    @property
+    def REPLICA_DATABASE_URLS(self) -> List[str]:
+        return _split_urls(self.DEV_REPLICA_DATABASE_URLS)
+
     @property
-    def DATABASE_URL(self) -> str:
-        return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
-    
+    def SHARD_DATABASE_URLS(self) -> List[str]:
+        return _split_urls(self.DEV_SHARD_DATABASE_URLS)
+
     @property
-    def SQLITE_DATABASE_URL(self) -> str:
-        return "sqlite:///./app.db"
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+    def WEBHOOK_SUBSCRIBERS(self) -> List[str]:
+        return _split_urls(self.WEBHOOK_URLS)
 
 
 class DevelopmentSettings(Settings):
     DEBUG: bool = True
-    
+
+    @property
+    def DATABASE_URL(self) -> Optional[str]:
+        return self.DEV_DATABASE_URL
+
     @property
-    def DATABASE_URL(self) -> str:
-        return self.SQLITE_DATABASE_URL
+    def REPLICA_DATABASE_URLS(self) -> List[str]:
+        return _split_urls(self.DEV_REPLICA_DATABASE_URLS)
+
+    @property
+    def SHARD_DATABASE_URLS(self) -> List[str]:
+        return _split_urls(self.DEV_SHARD_DATABASE_URLS)
 
 
 class ProductionSettings(Settings):
     DEBUG: bool = False
-    
+
+    # access tokens and reset links are signed with it, so a missing secret must stop the deploy
+    @field_validator("JWT_SECRET")
+    @classmethod
+    def _require_jwt_secret(cls, value: str) -> str:
+        if not value or value == DEVELOPMENT_JWT_SECRET:
+            raise ValueError("JWT_SECRET must be set in production")
+        return value
+
+    # any site could make credentialed requests with the user's cookies and read the answers
+    @model_validator(mode="after")
+    def _refuse_credentialed_wildcard_cors(self) -> "ProductionSettings":
+        if self.CORS_ALLOW_CREDENTIALS and "*" in _split_urls(self.CORS_ALLOW_ORIGINS):
+            raise ValueError("CORS_ALLOW_ORIGINS must list the frontend origins when CORS_ALLOW_CREDENTIALS is on")
+        return self
+
     @property
-    def DATABASE_URL(self) -> str:
-        return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+    def DATABASE_URL(self) -> Optional[str]:
+        return self.PROD_DATABASE_URL
 
+    @property
+    def REPLICA_DATABASE_URLS(self) -> List[str]:
+        return _split_urls(self.PROD_REPLICA_DATABASE_URLS)
+
+    @property
+    def SHARD_DATABASE_URLS(self) -> List[str]:
+        return _split_urls(self.PROD_SHARD_DATABASE_URLS)
+
+
+#------------------------------------------------- settings holder -------------------------------------------------
 
-@lru_cache()
-def get_settings():
-    environment = os.getenv("ENVIRONMENT", "development")
-    if environment.lower() == "production":
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+_reload_listeners: List[Callable[[Settings, Settings], None]] = []
+
+
+def _load_settings() -> Settings:
+    environment = os.getenv("ENVIRONMENT", "dev")
+    if environment.lower() in ("prod", "production"):
         return ProductionSettings()
     return DevelopmentSettings()
 
 
+def get_settings() -> Settings:
+    settings = _settings
+    if settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _set_settings(_load_settings())
+            settings = _settings
+    return settings
+
+
+def _set_settings(settings: Settings) -> None:
+    global _settings
+    _settings = settings
+
+
+def on_settings_reload(callback: Callable[[Settings, Settings], None]) -> Callable[[Settings, Settings], None]:
+    _reload_listeners.append(callback)
+    return callback
+
+
+def reload_settings() -> Settings:
+    with _settings_lock:
+        old = _settings
+        load_dotenv(ENV_FILE, override=True)
+        try:
+            new = _load_settings()
+        except Exception as e:
+            logger.error(f"Settings reload rejected, keeping current settings: {e}")
+            return old if old is not None else get_settings()
+        _set_settings(new)
+
+    logger.info("Settings reloaded")
+    if old is not None:
+        for callback in list(_reload_listeners):
+            try:
+                callback(old, new)
+            except Exception as e:
+                logger.error(f"Settings reload listener {callback.__name__} failed: {e}")
+    return new
+
+
+#------------------------------------------------- reload triggers -------------------------------------------------
+
+class SettingsWatcher:
+    def __init__(self, path: str = ENV_FILE):
+        self.path = path
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _run(self) -> None:
+        last_mtime = self._mtime()
+        while not self._stop.wait(get_settings().SETTINGS_WATCH_INTERVAL_SECONDS):
+            mtime = self._mtime()
+            if mtime != last_mtime:
+                last_mtime = mtime
+                reload_settings()
+
+    def start(self) -> None:
+        if self._thread is not None or get_settings().SETTINGS_WATCH_INTERVAL_SECONDS <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="settings-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+settings_watcher = SettingsWatcher()
+
+
+def install_sighup_handler() -> bool:
+    # per process: under gunicorn this is each worker's; the master's SIGHUP respawns the workers instead
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return False
+
+    # the reload takes a lock, so never run it inside the handler itself
+    def _handler(signum, frame):
+        threading.Thread(target=reload_settings, name="settings-reload", daemon=True).start()
+
+    signal.signal(signal.SIGHUP, _handler)
+    return True
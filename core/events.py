@@ -0,0 +1,326 @@
+# User lifecycle events for downstream systems (CRM, billing). Endpoints publish() into the outbox table within the
+# transaction that makes the change, so on one database an event exists exactly when the change committed. The
+# outbox lives on the primary: with sharding (db.sharding) a user on another shard is committed by a second
+# transaction, with no two-phase commit between them, so a failure between the two commits can leave a change
+# without its event or an event without its change. The dispatcher delivers
+# the outbox to every WEBHOOK_URLS subscriber in id order, in HMAC-signed batches. Each subscriber has its own cursor,
+# retry backoff and in-flight limit, so a slow or failing one never holds the others back, and a lease on its cursor
+# row keeps workers from delivering to it twice. Ids are taken at flush but become visible at commit, so they can
+# appear out of order: the cursor never moves past a missing id until WEBHOOK_GAP_GRACE_SECONDS have passed without
+# it committing. Delivery is at least once: receivers dedupe on the event id.
+import asyncio
+import enum
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, event, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from api.v1.models.user.user_auth import OutboxEvent, WebhookCursor
+from core import leases
+from core.config import Settings, get_settings
+from core.metrics import WEBHOOK_DELIVERIES, WEBHOOK_EVENTS_DELIVERED
+from db import session as db_session
+
+logger = logging.getLogger(__name__)
+
+USER_REGISTERED = "user.registered"
+EMAIL_VERIFIED = "user.email_verified"
+GOOGLE_SIGNUP = "user.google_signup"
+PASSWORD_RESET = "user.password_reset"
+
+USER_FIELDS = ("user_id", "username", "email", "phone_number", "organization_name", "user_type", "status", "is_verified", "created_at")
+PURGE_INTERVAL_SECONDS = 10 * 60
+
+
+def _json_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def user_payload(user) -> dict:
+    return {name: _json_value(getattr(user, name)) for name in USER_FIELDS}
+
+
+#------------------------------------------------- publishing -------------------------------------------------
+
+def publish(session: Session, event_type: str, data: dict) -> None:
+    # written by the caller's commit; nothing is sent if it rolls back. Atomic with the change only when both are
+    # on the primary, see above
+    session.add(OutboxEvent(event_type=event_type, payload=data, created_at=datetime.utcnow()))
+    session.info["outbox_published"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session):
+    if session.info.pop("outbox_published", False):
+        webhook_dispatcher.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_published(session):
+    session.info.pop("outbox_published", None)
+
+
+#------------------------------------------------- outbox storage -------------------------------------------------
+
+def claim(subscriber: str, owner: str, lease_seconds: float) -> Optional[int]:
+    # takes or renews the subscriber's lease; returns its cursor, or None while another worker holds it
+    now = datetime.utcnow()
+    leased_until = now + timedelta(seconds=lease_seconds)
+    with db_session.engine.begin() as conn:
+        cursor = conn.execute(select(WebhookCursor.last_event_id).where(WebhookCursor.subscriber == subscriber)).scalar()
+        if cursor is not None:
+            claimed = conn.execute(
+                update(WebhookCursor)
+                .where(
+                    WebhookCursor.subscriber == subscriber,
+                    or_(WebhookCursor.lease_owner == owner, WebhookCursor.leased_until.is_(None), WebhookCursor.leased_until < now),
+                )
+                .values(lease_owner=owner, leased_until=leased_until)
+            ).rowcount
+            return cursor if claimed else None
+    # a new subscriber starts at the current end of the outbox instead of replaying its history
+    try:
+        with db_session.engine.begin() as conn:
+            start = conn.execute(select(func.max(OutboxEvent.id))).scalar() or 0
+            conn.execute(insert(WebhookCursor).values(subscriber=subscriber, last_event_id=start, lease_owner=owner, leased_until=leased_until))
+        return start
+    except IntegrityError:
+        return None
+
+
+def load_events(after_id: int, limit: int) -> list:
+    with db_session.engine.connect() as conn:
+        return conn.execute(
+            select(OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.payload, OutboxEvent.created_at)
+            .where(OutboxEvent.id > after_id)
+            .order_by(OutboxEvent.id)
+            .limit(limit)
+        ).all()
+
+
+def deliverable(after_id: int, events: list, grace_seconds: float) -> list:
+    # the contiguous run after the cursor; a gap is skipped only once the event after it is older than the grace,
+    # since the transaction holding the missing id has had that long to commit
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    expected = after_id + 1
+    for index, row in enumerate(events):
+        if row.id != expected and row.created_at > cutoff:
+            return events[:index]
+        expected = row.id + 1
+    return events
+
+
+def advance(subscriber: str, owner: str, last_event_id: int) -> bool:
+    # only the lease holder moves the cursor, and only forward
+    with db_session.engine.begin() as conn:
+        return bool(conn.execute(
+            update(WebhookCursor)
+            .where(WebhookCursor.subscriber == subscriber, WebhookCursor.lease_owner == owner, WebhookCursor.last_event_id < last_event_id)
+            .values(last_event_id=last_event_id)
+        ).rowcount)
+
+
+def release(subscriber: str, owner: str) -> None:
+    with db_session.engine.begin() as conn:
+        conn.execute(
+            update(WebhookCursor)
+            .where(WebhookCursor.subscriber == subscriber, WebhookCursor.lease_owner == owner)
+            .values(lease_owner=None, leased_until=None)
+        )
+
+
+def purge(subscribers: List[str], retention_hours: float) -> int:
+    # drops events every current subscriber is past, once they are older than the retention
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    with db_session.engine.begin() as conn:
+        statement = delete(OutboxEvent).where(OutboxEvent.created_at < cutoff)
+        if subscribers:
+            cursors = conn.execute(
+                select(WebhookCursor.subscriber, WebhookCursor.last_event_id).where(WebhookCursor.subscriber.in_(subscribers))
+            ).all()
+            if len(cursors) < len(set(subscribers)):
+                return 0
+            statement = statement.where(OutboxEvent.id <= min(cursor for _, cursor in cursors))
+        return conn.execute(statement).rowcount
+
+
+#------------------------------------------------- delivery -------------------------------------------------
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    # receivers recompute this over "<timestamp>.<raw body>" and reject stale timestamps
+    return hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+
+
+def encode_batch(events: list) -> bytes:
+    return json.dumps({
+        "events": [
+            {"id": row.id, "type": row.event_type, "created_at": row.created_at.isoformat(), "data": row.payload}
+            for row in events
+        ]
+    }, separators=(",", ":")).encode()
+
+
+@dataclass
+class Subscriber:
+    url: str
+    failures: int = 0
+    retry_at: float = 0.0
+    wake: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional[asyncio.Task] = None
+
+
+class WebhookDispatcher:
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.owner = leases.owner_id()
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Subscriber] = {}
+
+    def notify(self) -> None:
+        # called from whichever thread committed the event
+        if self._loop is None or self._loop.is_closed():
+            return
+        for subscriber in list(self._subscribers.values()):
+            self._loop.call_soon_threadsafe(subscriber.wake.set)
+
+    async def _send(self, subscriber: Subscriber, events: list, settings: Settings) -> bool:
+        body = encode_batch(events)
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Webhook-Id": f"{events[0].id}-{events[-1].id}",
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Signature": f"sha256={sign(settings.WEBHOOK_SECRET, timestamp, body)}",
+        }
+        try:
+            response = await self._client.post(subscriber.url, content=body, headers=headers, timeout=settings.WEBHOOK_TIMEOUT_SECONDS)
+        except httpx.HTTPError as e:
+            logger.warning(f"Webhook delivery to {subscriber.url} failed: {e}")
+            WEBHOOK_DELIVERIES.labels("failed").inc()
+            return False
+        if not response.is_success:
+            logger.warning(f"Webhook delivery to {subscriber.url} failed with status {response.status_code}")
+            WEBHOOK_DELIVERIES.labels("failed").inc()
+            return False
+        WEBHOOK_DELIVERIES.labels("delivered").inc()
+        WEBHOOK_EVENTS_DELIVERED.inc(len(events))
+        return True
+
+    async def deliver(self, subscriber: Subscriber, settings: Settings) -> bool:
+        # one round: up to WEBHOOK_MAX_IN_FLIGHT batches sent concurrently; returns True when more may be waiting
+        cursor = await run_in_threadpool(claim, subscriber.url, self.owner, settings.WEBHOOK_LEASE_SECONDS)
+        if cursor is None:
+            return False
+        batch_size = max(1, settings.WEBHOOK_BATCH_SIZE)
+        limit = batch_size * max(1, settings.WEBHOOK_MAX_IN_FLIGHT)
+        events = deliverable(cursor, await run_in_threadpool(load_events, cursor, limit), settings.WEBHOOK_GAP_GRACE_SECONDS)
+        if not events:
+            return False
+        batches = [events[start:start + batch_size] for start in range(0, len(events), batch_size)]
+        results = await asyncio.gather(*(self._send(subscriber, batch, settings) for batch in batches))
+
+        # the cursor moves past the batches delivered before the first failure; later ones are sent again
+        delivered = None
+        for batch, ok in zip(batches, results):
+            if not ok:
+                break
+            delivered = batch[-1].id
+        if delivered is not None and not await run_in_threadpool(advance, subscriber.url, self.owner, delivered):
+            logger.warning(f"Lost the webhook lease on {subscriber.url}")
+            return False
+        if all(results):
+            subscriber.failures = 0
+            return len(events) == limit
+        subscriber.failures += 1
+        backoff = min(settings.WEBHOOK_RETRY_MAX_SECONDS, settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (subscriber.failures - 1))
+        subscriber.retry_at = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+        return False
+
+    async def _serve(self, subscriber: Subscriber) -> None:
+        while True:
+            settings = get_settings()
+            delay = subscriber.retry_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                more = await self.deliver(subscriber, settings)
+            except SQLAlchemyError as e:
+                logger.error(f"Webhook outbox read failed: {e}")
+                more = False
+            if more:
+                continue
+            subscriber.wake.clear()
+            try:
+                await asyncio.wait_for(subscriber.wake.wait(), settings.WEBHOOK_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _sync_subscribers(self, settings: Settings) -> None:
+        # follows WEBHOOK_URLS across settings reloads
+        wanted = set(settings.WEBHOOK_SUBSCRIBERS)
+        for url in list(self._subscribers):
+            if url not in wanted:
+                self._subscribers.pop(url).task.cancel()
+        for url in wanted - set(self._subscribers):
+            subscriber = Subscriber(url)
+            subscriber.task = asyncio.create_task(self._serve(subscriber))
+            self._subscribers[url] = subscriber
+
+    async def _run(self) -> None:
+        last_purge = 0.0
+        while True:
+            settings = get_settings()
+            self._sync_subscribers(settings)
+            if time.monotonic() - last_purge >= PURGE_INTERVAL_SECONDS:
+                last_purge = time.monotonic()
+                try:
+                    purged = await run_in_threadpool(purge, settings.WEBHOOK_SUBSCRIBERS, settings.OUTBOX_RETENTION_HOURS)
+                    if purged:
+                        logger.info(f"Purged {purged} delivered outbox events")
+                except SQLAlchemyError as e:
+                    logger.error(f"Outbox purge failed: {e}")
+            await asyncio.sleep(settings.WEBHOOK_POLL_INTERVAL_SECONDS)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._client = httpx.AsyncClient(transport=self._transport)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        tasks = [self._task, *(subscriber.task for subscriber in self._subscribers.values())]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # hand the subscribers to another worker now instead of when the leases run out
+        for url in self._subscribers:
+            try:
+                await run_in_threadpool(release, url, self.owner)
+            except SQLAlchemyError as e:
+                logger.error(f"Could not release the webhook lease on {url}: {e}")
+        self._subscribers.clear()
+        await self._client.aclose()
+        self._task = self._client = self._loop = None
+
+
+webhook_dispatcher = WebhookDispatcher()
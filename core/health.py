@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import anyio.to_thread
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from core.config import Settings, get_settings
+from db import session as db_session
+
+logger = logging.getLogger(__name__)
+
+
+#------------------------------------------------- lifecycle -------------------------------------------------
+
+class HealthState:
+    STARTING, READY, DRAINING = "starting", "ready", "draining"
+
+    def __init__(self):
+        self.phase = self.STARTING
+
+    def mark_ready(self) -> None:
+        self.phase = self.READY
+
+    def mark_draining(self) -> None:
+        if self.phase != self.DRAINING:
+            logger.info("Draining: readiness now fails so the load balancer stops routing here")
+        self.phase = self.DRAINING
+
+    @property
+    def draining(self) -> bool:
+        return self.phase == self.DRAINING
+
+
+health_state = HealthState()
+
+
+#------------------------------------------------- checks -------------------------------------------------
+
+def ping_database() -> None:
+    with db_session.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def check_database(settings: Settings) -> dict:
+    pool = db_session.engine.pool
+    size = getattr(pool, "size", None)
+    checked_out = getattr(pool, "checkedout", None)
+    result = {"ok": True}
+    if size is not None and checked_out is not None:
+        capacity = size() + max(settings.DB_MAX_OVERFLOW, 0)
+        result.update(checked_out=checked_out(), capacity=capacity)
+        # a saturated pool would make the probe itself wait pool_timeout; report it instead of queueing
+        if result["checked_out"] >= capacity:
+            return dict(result, ok=False, error="connection pool exhausted")
+    try:
+        await asyncio.wait_for(run_in_threadpool(ping_database), settings.HEALTH_CHECK_TIMEOUT_SECONDS)
+    except Exception as e:
+        return dict(result, ok=False, error=str(e) or e.__class__.__name__)
+    return result
+
+
+def check_backlog(settings: Settings) -> dict:
+    # notifications and password hashing run in the threadpool; callers queueing for a thread means we are behind
+    from core.audit import login_audit
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    waiting = limiter.statistics().tasks_waiting
+    audit_fill = len(login_audit) / max(login_audit.capacity, 1)
+    result = {"threadpool_waiting": waiting, "audit_buffer_fill": round(audit_fill, 3), "audit_dropped": login_audit.dropped}
+    if waiting > settings.HEALTH_MAX_THREADPOOL_WAITING:
+        return dict(result, ok=False, error="threadpool backlog")
+    if login_audit.dropped_within(settings.HEALTH_AUDIT_DROP_WINDOW_SECONDS):
+        return dict(result, ok=False, error="login audit events dropped")
+    if audit_fill >= settings.HEALTH_MAX_AUDIT_BUFFER_FILL:
+        return dict(result, ok=False, error="login audit buffer nearly full")
+    return dict(result, ok=True)
+
+
+def check_providers(settings: Settings) -> dict:
+    # an open circuit is reported, but only fails readiness on request: every worker shares the same providers,
+    # so pulling them all out of rotation would turn a degraded feature into a full outage
+    from core.resilience import CircuitBreaker, _breakers
+
+    states = {name: breaker.state for name, breaker in sorted(_breakers.items())}
+    open_circuits = [name for name, state in states.items() if state == CircuitBreaker.OPEN]
+    ok = not (open_circuits and settings.HEALTH_FAIL_ON_OPEN_CIRCUIT)
+    return {"ok": ok, "circuits": states}
+
+
+class ReadinessCheck:
+    # probes within HEALTH_CACHE_SECONDS share one result, and concurrent probes share one in-flight check
+    def __init__(self):
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def run(self, settings: Optional[Settings] = None) -> dict:
+        settings = settings or get_settings()
+        if health_state.phase != HealthState.READY:
+            return {"ready": False, "status": health_state.phase}
+        if self._result is not None and time.monotonic() - self._checked_at < settings.HEALTH_CACHE_SECONDS:
+            return self._result
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._result is not None and time.monotonic() - self._checked_at < settings.HEALTH_CACHE_SECONDS:
+                return self._result
+            checks = {
+                "database": await check_database(settings),
+                "backlog": check_backlog(settings),
+                "providers": check_providers(settings),
+            }
+            ready = all(check["ok"] for check in checks.values())
+            self._result = {"ready": ready, "status": "ready" if ready else "degraded", "checks": checks}
+            self._checked_at = time.monotonic()
+            if not ready:
+                logger.warning(f"Readiness failing: {self._result}")
+            return self._result
+
+
+readiness = ReadinessCheck()
@@ -0,0 +1,136 @@
+# Idempotency keys are kept in the database, so a retry is deduplicated whichever worker or host it reaches. The
+# first request inserts the key's row (claims it); a duplicate finds the row and either replays the stored response
+# or waits for the claim to complete. A claim whose worker died is taken over after IDEMPOTENCY_CLAIM_SECONDS.
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from api.v1.models.user.user_auth import IdempotencyKey
+from db import session as db_session
+
+PURGE_INTERVAL_SECONDS = 10 * 60
+# how often a duplicate looks for the outcome of a claim held by another worker
+POLL_INTERVAL_SECONDS = 0.1
+
+
+class StoredResponse:
+    def __init__(self, status: int, headers: list, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class IdempotencyEntry:
+    def __init__(self, fingerprint: str, response: Optional[StoredResponse] = None):
+        self.fingerprint = fingerprint
+        # None while the first request is still running
+        self.response = response
+
+
+def _row_key(key: str) -> str:
+    # keys are up to 255 characters plus method and path; the primary key is their digest
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: float, claim_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.claim_seconds = claim_seconds
+        # claims held by this process, so a local duplicate is woken at once instead of polling
+        self._local: Dict[str, asyncio.Future] = {}
+        self._purged_at = 0.0
+
+    #------------------------------------------------- storage -------------------------------------------------
+
+    def _stale(self, now: datetime):
+        # expired keys, and claims whose worker never completed them
+        return or_(
+            IdempotencyKey.expires_at <= now,
+            (IdempotencyKey.status.is_(None)) & (IdempotencyKey.claimed_at < now - timedelta(seconds=self.claim_seconds)),
+        )
+
+    def _load(self, row_key: str) -> Optional[IdempotencyEntry]:
+        now = datetime.utcnow()
+        with db_session.engine.connect() as conn:
+            row = conn.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status, IdempotencyKey.headers, IdempotencyKey.body)
+                .where(IdempotencyKey.key == row_key, ~self._stale(now))
+            ).first()
+        if row is None:
+            return None
+        if row.status is None:
+            return IdempotencyEntry(row.fingerprint)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in row.headers]
+        return IdempotencyEntry(row.fingerprint, StoredResponse(row.status, headers, row.body))
+
+    def _insert(self, row_key: str, fingerprint: str) -> bool:
+        now = datetime.utcnow()
+        with db_session.engine.begin() as conn:
+            conn.execute(delete(IdempotencyKey).where(IdempotencyKey.key == row_key, self._stale(now)))
+        try:
+            with db_session.engine.begin() as conn:
+                conn.execute(insert(IdempotencyKey).values(
+                    key=row_key, fingerprint=fingerprint, claimed_at=now, expires_at=now + timedelta(seconds=self.ttl_seconds),
+                ))
+        except IntegrityError:
+            return False
+        return True
+
+    def _store(self, row_key: str, response: Optional[StoredResponse]) -> None:
+        with db_session.engine.begin() as conn:
+            if response is None:
+                conn.execute(delete(IdempotencyKey).where(IdempotencyKey.key == row_key))
+                return
+            headers = [[name.decode("latin-1"), value.decode("latin-1")] for name, value in response.headers]
+            conn.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == row_key)
+                .values(status=response.status, headers=headers, body=response.body)
+            )
+
+    def _purge(self) -> None:
+        with db_session.engine.begin() as conn:
+            conn.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+
+    #------------------------------------------------- requests -------------------------------------------------
+
+    async def get(self, key: str) -> Optional[IdempotencyEntry]:
+        return await run_in_threadpool(self._load, _row_key(key))
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        # False when another request claimed the key first; look it up again
+        if time.monotonic() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self._purged_at = time.monotonic()
+            await run_in_threadpool(self._purge)
+        row_key = _row_key(key)
+        if not await run_in_threadpool(self._insert, row_key, fingerprint):
+            return False
+        self._local[row_key] = asyncio.get_running_loop().create_future()
+        return True
+
+    async def wait(self, key: str, timeout: float) -> None:
+        # returns when the claim may have completed; the caller looks the key up again
+        done = self._local.get(_row_key(key))
+        try:
+            if done is not None:
+                await asyncio.wait_for(asyncio.shield(done), timeout)
+            else:
+                await asyncio.sleep(min(POLL_INTERVAL_SECONDS, timeout))
+        except asyncio.TimeoutError:
+            pass
+
+    async def complete(self, key: str, response: Optional[StoredResponse]) -> None:
+        # None means the outcome must not be replayed (e.g. a 5xx); the next retry runs again
+        row_key = _row_key(key)
+        try:
+            await run_in_threadpool(self._store, row_key, response)
+        finally:
+            done = self._local.pop(row_key, None)
+            if done is not None and not done.done():
+                done.set_result(None)
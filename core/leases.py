@@ -0,0 +1,38 @@
+# Leases for background jobs that should run in one worker of the fleet rather than in every one: whoever holds the
+# named row until leased_until runs the job, and renews it by acquiring again before it runs out.
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from api.v1.models.user.user_auth import WorkerLease
+from db import session as db_session
+
+
+def owner_id() -> str:
+    # unique per process, and readable enough to tell which host holds a lease
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def acquire(name: str, owner: str, seconds: float) -> bool:
+    # takes the lease if it is free or expired, or renews it for its holder
+    now = datetime.utcnow()
+    leased_until = now + timedelta(seconds=seconds)
+    with db_session.engine.begin() as conn:
+        taken = conn.execute(
+            update(WorkerLease)
+            .where(WorkerLease.name == name, or_(WorkerLease.owner == owner, WorkerLease.leased_until.is_(None), WorkerLease.leased_until < now))
+            .values(owner=owner, leased_until=leased_until)
+        ).rowcount
+    if taken:
+        return True
+    try:
+        with db_session.engine.begin() as conn:
+            conn.execute(insert(WorkerLease).values(name=name, owner=owner, leased_until=leased_until))
+        return True
+    except IntegrityError:
+        # held by someone else, or another worker created it first
+        return False
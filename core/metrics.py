@@ -0,0 +1,195 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+
+#------------------------------------------------- http -------------------------------------------------
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by route template",
+    ["method", "route"],
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Requests handled, by route template and status code",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+    multiprocess_mode="livesum",
+)
+
+#------------------------------------------------- database -------------------------------------------------
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing SQL statements, by statement type",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Replication lag reported by the last health probe",
+    ["replica"],
+    multiprocess_mode="max",
+)
+DB_REPLICA_HEALTHY = Gauge(
+    "db_replica_healthy",
+    "1 when the replica is reachable and within the allowed lag",
+    ["replica"],
+    multiprocess_mode="min",
+)
+DB_READS_ROUTED = Counter(
+    "db_reads_routed_total",
+    "Read-only sessions opened, by target (replica name or primary) and reason",
+    ["target", "reason"],
+)
+
+#------------------------------------------------- notifications -------------------------------------------------
+
+NOTIFICATION_SEND_DURATION = Histogram(
+    "notification_send_duration_seconds",
+    "Time spent handing a message to an email or SMS provider",
+    ["channel", "provider"],
+)
+NOTIFICATION_SEND_FAILURES = Counter(
+    "notification_send_failures_total",
+    "Messages a provider failed to accept",
+    ["channel", "provider"],
+)
+
+#------------------------------------------------- auth -------------------------------------------------
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying passwords",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0),
+)
+OTP_EVENTS = Counter(
+    "otp_events_total",
+    "OTP lifecycle events (issued, verified, failed, frozen, expired)",
+    ["purpose", "event"],
+)
+USER_FILTER_CHECKS = Counter(
+    "user_filter_checks_total",
+    "Existence filter lookups: absent (DB skipped), maybe (DB queried), stale (absent, but the filter is behind the DB, so queried), false_positive (maybe, but no such user)",
+    ["result"],
+)
+USER_FILTER_ENTRIES = Gauge(
+    "user_filter_entries",
+    "Emails and phone numbers in the existence filter",
+    multiprocess_mode="max",
+)
+USER_FILTER_FALSE_POSITIVE_RATE = Gauge(
+    "user_filter_false_positive_rate",
+    "Expected false-positive rate of the existence filter at its current fill",
+    multiprocess_mode="max",
+)
+IDEMPOTENCY_REQUESTS = Counter(
+    "idempotency_requests_total",
+    "Requests carrying an Idempotency-Key, by outcome (executed, replayed, waited, in_progress, mismatch)",
+    ["outcome"],
+)
+AUDIT_EVENTS = Counter(
+    "login_audit_events_total",
+    "Login audit events by outcome (queued, written, dropped, failed, rejected)",
+    ["outcome"],
+)
+AUDIT_FLUSH_DURATION = Histogram(
+    "login_audit_flush_duration_seconds",
+    "Time spent writing one batch of login audit rows",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Outbound circuit state: 0 closed, 1 half-open, 2 open",
+    ["breaker"],
+    multiprocess_mode="max",
+)
+CIRCUIT_BREAKER_CALLS = Counter(
+    "circuit_breaker_calls_total",
+    "Outbound calls through a circuit breaker, by outcome (success, failure, rejected)",
+    ["breaker", "outcome"],
+)
+
+#------------------------------------------------- webhooks -------------------------------------------------
+
+WEBHOOK_DELIVERIES = Counter(
+    "webhook_deliveries_total",
+    "Webhook batch deliveries by outcome (delivered, failed)",
+    ["outcome"],
+)
+WEBHOOK_EVENTS_DELIVERED = Counter(
+    "webhook_events_delivered_total",
+    "User lifecycle events acknowledged by a webhook subscriber",
+)
+
+
+@contextmanager
+def observe_notification(channel: str, provider: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        NOTIFICATION_SEND_FAILURES.labels(channel, provider).inc()
+        raise
+    finally:
+        NOTIFICATION_SEND_DURATION.labels(channel, provider).observe(time.perf_counter() - start)
+
+
+#------------------------------------------------- pool collector -------------------------------------------------
+
+class DatabasePoolCollector:
+    stats = {
+        "db_pool_size": ("Configured number of pooled connections", "size"),
+        "db_pool_checked_out": ("Connections currently in use", "checkedout"),
+        "db_pool_checked_in": ("Idle connections in the pool", "checkedin"),
+        "db_pool_overflow": ("Connections opened beyond the pool size", "overflow"),
+    }
+
+    # lets the registry learn the metric names without importing db.session at registration time
+    def describe(self):
+        for name, (documentation, _) in self.stats.items():
+            yield GaugeMetricFamily(name, documentation, labels=["pid"])
+
+    # read at scrape time so the numbers always describe the live engine, even after a settings reload
+    def collect(self):
+        from db.session import engine
+
+        pool = engine.pool
+        for name, (documentation, attribute) in self.stats.items():
+            getter = getattr(pool, attribute, None)
+            if getter is None:
+                continue
+            family = GaugeMetricFamily(name, documentation, labels=["pid"])
+            family.add_metric([str(os.getpid())], getter())
+            yield family
+
+
+_pool_collector = DatabasePoolCollector()
+REGISTRY.register(_pool_collector)
+
+
+def render_metrics() -> tuple:
+    # under a multi-process server every worker writes to PROMETHEUS_MULTIPROC_DIR and any of them can render the sum
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_pool_collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,291 @@
+import hashlib
+import math
+import time
+import logging
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import Settings, get_settings
+from core.idempotency import IdempotencyStore, StoredResponse
+from core.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS, HTTP_REQUESTS_IN_FLIGHT, IDEMPOTENCY_REQUESTS
+from core.resilience import start_deadline, stop_deadline
+from db.routing import start_routing, stop_routing
+from db.session import start_query_stats, stop_query_stats
+
+logger = logging.getLogger(__name__)
+
+
+def route_template(scope: Scope) -> str:
+    # label by the matched template (/users/v1/{user_id}), never the raw path, to keep label cardinality bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+#------------------------------------------------- cors -------------------------------------------------
+
+def _split(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def cors_options(settings: Settings) -> dict:
+    # Starlette turns the origin list into a set and the regex into a compiled pattern once, at startup.
+    # ProductionSettings refuses "*" together with credentials
+    return {
+        "allow_origins": _split(settings.CORS_ALLOW_ORIGINS),
+        "allow_origin_regex": settings.CORS_ALLOW_ORIGIN_REGEX,
+        "allow_credentials": settings.CORS_ALLOW_CREDENTIALS,
+        "allow_methods": _split(settings.CORS_ALLOW_METHODS),
+        "allow_headers": _split(settings.CORS_ALLOW_HEADERS),
+        "expose_headers": ["Idempotency-Replayed"],
+        "max_age": settings.CORS_MAX_AGE_SECONDS,
+    }
+
+
+#------------------------------------------------- metrics -------------------------------------------------
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, skip_paths: tuple = ("/metrics", "/healthz", "/readyz")):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = route_template(scope)
+            HTTP_REQUEST_DURATION.labels(scope["method"], route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status_code)).inc()
+
+
+#------------------------------------------------- deadlines -------------------------------------------------
+
+class DeadlineMiddleware:
+    # outbound calls made while handling the request are cut to what is left of REQUEST_BUDGET_SECONDS
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = start_deadline(get_settings().REQUEST_BUDGET_SECONDS)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            stop_deadline(token)
+
+
+#------------------------------------------------- query profiling -------------------------------------------------
+
+class QueryProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        settings = get_settings()
+        stats, token = start_query_stats()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and settings.DEBUG:
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Query-Count"] = str(stats.count)
+                headers["X-DB-Time-Ms"] = f"{stats.total_time * 1000:.2f}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stop_query_stats(token)
+            route = route_template(scope)
+            if stats.count > settings.QUERY_BUDGET_PER_REQUEST:
+                logger.warning(
+                    f"{scope['method']} {route} issued {stats.count} queries "
+                    f"(budget {settings.QUERY_BUDGET_PER_REQUEST}, {stats.total_time * 1000:.1f} ms in DB)"
+                )
+            for statement, count in stats.repeated(settings.N_PLUS_ONE_THRESHOLD):
+                logger.warning(f"Possible N+1 in {scope['method']} {route}: {count}x {statement}")
+
+
+#------------------------------------------------- read-your-writes -------------------------------------------------
+
+class ReadYourWritesMiddleware:
+    cookie_name = "db_primary_until"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _pinned_until(self, scope: Scope) -> float:
+        try:
+            return float(HTTPConnection(scope).cookies.get(self.cookie_name, 0))
+        except ValueError:
+            return 0.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        window = get_settings().READ_YOUR_WRITES_SECONDS
+        now = time.time()
+        state, token = start_routing(pinned=self._pinned_until(scope) > now)
+
+        # a client that just wrote keeps reading from the primary until replicas have caught up
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and state.wrote and window > 0:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{self.cookie_name}={now + window:.0f}; Max-Age={int(math.ceil(window))}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stop_routing(token)
+
+
+#------------------------------------------------- idempotency -------------------------------------------------
+
+class IdempotencyMiddleware:
+    methods = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+    # per-request headers that must not be replayed
+    skip_headers = frozenset((b"date", b"set-cookie", b"content-length"))
+    max_key_length = 255
+
+    def __init__(self, app: ASGIApp, paths: tuple, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.paths = frozenset(paths)
+        self._store = store
+
+    @property
+    def store(self) -> IdempotencyStore:
+        if self._store is None:
+            settings = get_settings()
+            self._store = IdempotencyStore(settings.IDEMPOTENCY_TTL_SECONDS, settings.IDEMPOTENCY_CLAIM_SECONDS)
+        return self._store
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    def _fingerprint(scope: Scope, body: bytes) -> str:
+        digest = hashlib.sha256()
+        for part in (scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body):
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    async def _replay(self, response: StoredResponse, send: Send) -> None:
+        headers = response.headers + [
+            (b"content-length", str(len(response.body)).encode()),
+            (b"idempotency-replayed", b"true"),
+        ]
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        await send({"type": "http.response.body", "body": response.body})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in self.methods or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        key = Headers(scope=scope).get("idempotency-key")
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > self.max_key_length:
+            await JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = self._fingerprint(scope, body)
+        store_key = f"{scope['method']} {scope['path']} {key}"
+        store = self.store
+
+        # a duplicate of a request still in flight, on this worker or another, waits for it, then replays its response
+        waited = False
+        deadline = time.monotonic() + get_settings().IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            entry = await store.get(store_key)
+            if entry is None:
+                if await store.claim(store_key, fingerprint):
+                    break
+                continue
+            if entry.fingerprint != fingerprint:
+                IDEMPOTENCY_REQUESTS.labels("mismatch").inc()
+                await JSONResponse(
+                    {"detail": "Idempotency-Key was already used with a different request"}, status_code=422
+                )(scope, receive, send)
+                return
+            if entry.response is not None:
+                IDEMPOTENCY_REQUESTS.labels("waited" if waited else "replayed").inc()
+                await self._replay(entry.response, send)
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                IDEMPOTENCY_REQUESTS.labels("in_progress").inc()
+                await JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is still being processed"}, status_code=409
+                )(scope, receive, send)
+                return
+            await store.wait(store_key, remaining)
+            waited = True
+
+        IDEMPOTENCY_REQUESTS.labels("executed").inc()
+        body_sent = False
+        status_code = 500
+        headers: list = []
+        chunks: list = []
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = [(name, value) for name, value in message.get("headers", []) if name.lower() not in self.skip_headers]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        response = None
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+            # server errors are not replayed so a retry gets another chance
+            if status_code < 500:
+                response = StoredResponse(status_code, headers, b"".join(chunks))
+        finally:
+            await store.complete(store_key, response)
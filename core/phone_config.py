@@ -1,20 +1,39 @@
-import os
+from functools import partial
+
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
-from dotenv import load_dotenv
 
-load_dotenv()  
+from core.config import get_settings
+from core.metrics import observe_notification
+from core.resilience import call_with_failover
 
-TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 
-def send_otp_sms(phone_number: str, otp: str):
-    try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        message = client.messages.create(
+def _send_twilio(timeout, provider, account_sid, auth_token, from_number, phone_number, body):
+    with observe_notification("sms", provider):
+        client = Client(account_sid, auth_token, http_client=TwilioHttpClient(timeout=timeout))
+        client.messages.create(
             to=phone_number,
-            from_=TWILIO_PHONE_NUMBER,
-            body=f"Your WOFR login OTP is {otp}. It is valid for 5 mins. Do not share this code with anyone."
+            from_=from_number,
+            body=body
+        )
+
+
+def sms_providers(settings) -> list:
+    providers = [("twilio", partial(_send_twilio, provider="twilio", account_sid=settings.TWILIO_ACCOUNT_SID,
+                                    auth_token=settings.TWILIO_AUTH_TOKEN, from_number=settings.TWILIO_PHONE_NUMBER))]
+    if settings.TWILIO_FALLBACK_ACCOUNT_SID:
+        providers.append(("twilio_fallback", partial(_send_twilio, provider="twilio_fallback", account_sid=settings.TWILIO_FALLBACK_ACCOUNT_SID,
+                                                     auth_token=settings.TWILIO_FALLBACK_AUTH_TOKEN, from_number=settings.TWILIO_FALLBACK_PHONE_NUMBER)))
+    return providers
+
+
+async def send_otp_sms(phone_number: str, otp: str):
+    settings = get_settings()
+    try:
+        await call_with_failover(
+            "sms", sms_providers(settings), settings.SMS_TIMEOUT_SECONDS,
+            phone_number=phone_number,
+            body=f"Your WOFR login OTP is {otp}. It is valid for {settings.OTP_EXPIRE_MINUTES} mins. Do not share this code with anyone."
         )
         return True
     except Exception as e:
@@ -0,0 +1,167 @@
+# On-demand request profiling. A request is profiled when an admin sends "X-Profile: 1" or it falls into
+# PROFILING_SAMPLE_RATE. A sampler thread walks the event loop's stack (and the threadpool's, where hashing and
+# provider calls run) every PROFILING_INTERVAL_MS and the result is stored as folded stacks, which flamegraph.pl,
+# speedscope and inferno read directly. Other requests served concurrently by the same worker show up in the
+# samples too; profile under light load or read the stacks below the endpoint frame.
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from auth.auth_handler import decodeJWT
+from core.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID = re.compile(r"^[\w.-]+$")
+ROUTE_UNSAFE = re.compile(r"[^\w.-]+")
+THREADPOOL_PREFIX = "AnyIO worker thread"
+
+
+#------------------------------------------------- sampler -------------------------------------------------
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold(frame) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class StackSampler:
+    def __init__(self, loop_thread_id: int, interval: float):
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _targets(self) -> dict:
+        targets = {self.loop_thread_id: "event-loop"}
+        for thread in threading.enumerate():
+            if thread.name.startswith(THREADPOOL_PREFIX):
+                targets[thread.ident] = "threadpool"
+        return targets
+
+    def sample(self) -> None:
+        frames = sys._current_frames()
+        for thread_id, root in self._targets().items():
+            frame = frames.get(thread_id)
+            # idle pool threads sit in the queue wait; only count ones doing work
+            if frame is None or (root == "threadpool" and frame.f_code.co_name == "wait"):
+                continue
+            self.samples[f"{root};{fold(frame)}"] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+#------------------------------------------------- storage -------------------------------------------------
+
+def profile_path(settings: Settings, profile_id: str) -> Optional[str]:
+    if not PROFILE_ID.match(profile_id):
+        return None
+    return os.path.join(settings.PROFILING_DIR, f"{profile_id}.folded")
+
+
+def list_profiles(settings: Settings) -> list:
+    try:
+        names = [name for name in os.listdir(settings.PROFILING_DIR) if name.endswith(".folded")]
+    except FileNotFoundError:
+        return []
+    return sorted((name[: -len(".folded")] for name in names), reverse=True)
+
+
+def save_profile(settings: Settings, profile_id: str, folded: str) -> None:
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    with open(profile_path(settings, profile_id), "w") as f:
+        f.write(folded)
+    # keep the newest PROFILING_MAX_FILES; ids start with a timestamp so name order is age order
+    for stale in list_profiles(settings)[settings.PROFILING_MAX_FILES:]:
+        try:
+            os.remove(profile_path(settings, stale))
+        except OSError:
+            pass
+
+
+#------------------------------------------------- middleware -------------------------------------------------
+
+def _is_admin(headers: Headers) -> bool:
+    # the signed claim is enough here; no DB lookup on the request being measured
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    payload = decodeJWT(token)
+    return bool(payload) and payload.get("user_type") == "admin"
+
+
+class ProfilingMiddleware:
+    header = "x-profile"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _should_profile(self, scope: Scope, settings: Settings) -> bool:
+        headers = Headers(scope=scope)
+        if headers.get(self.header) and _is_admin(headers):
+            return True
+        return settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        settings = get_settings()
+        if not settings.PROFILING_ENABLED or scope["type"] != "http" or not self._should_profile(scope, settings):
+            await self.app(scope, receive, send)
+            return
+
+        from core.middleware import route_template
+
+        # the response header goes out before routing finishes, so the id uses the raw path
+        request_name = ROUTE_UNSAFE.sub("_", f"{scope['method']}{scope['path']}").strip("_")[:80]
+        profile_id = f"{time.time():.3f}-{os.getpid()}-{request_name}"
+        sampler = StackSampler(threading.get_ident(), settings.PROFILING_INTERVAL_MS / 1000)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+            await send(message)
+
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            route = route_template(scope)
+            try:
+                await run_in_threadpool(save_profile, settings, profile_id, sampler.folded())
+                logger.info(f"Profiled {scope['method']} {route} ({elapsed_ms:.1f} ms) as {profile_id}")
+            except OSError as e:
+                logger.error(f"Could not store profile {profile_id}: {e}")
@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from core.config import Settings, get_settings, on_settings_reload
+from core.metrics import CIRCUIT_BREAKER_CALLS, CIRCUIT_BREAKER_STATE
+from core.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class CircuitOpen(ProviderUnavailable):
+    pass
+
+
+class DeadlineExceeded(ProviderUnavailable):
+    pass
+
+
+#------------------------------------------------- deadlines -------------------------------------------------
+
+# absolute time.monotonic() by which the current request must answer; None outside a request
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def start_deadline(budget_seconds: float) -> contextvars.Token:
+    return _deadline.set(time.monotonic() + budget_seconds)
+
+
+def stop_deadline(token: contextvars.Token) -> None:
+    _deadline.reset(token)
+
+
+def call_timeout(limit: float) -> float:
+    # an outbound call gets its own limit or whatever is left of the request budget, whichever is shorter
+    deadline = _deadline.get()
+    if deadline is None:
+        return limit
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("request budget exhausted")
+    return min(limit, remaining)
+
+
+#------------------------------------------------- circuit breaker -------------------------------------------------
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _state_values = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        # calls come from threadpool workers as well as the event loop
+        self._lock = threading.Lock()
+        CIRCUIT_BREAKER_STATE.labels(name).set(0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning(f"Circuit {self.name}: {self._state} -> {state}")
+            self._state = state
+            CIRCUIT_BREAKER_STATE.labels(self.name).set(self._state_values[state])
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._set_state(self.HALF_OPEN)
+            self._probes = 0
+
+    def allow(self) -> bool:
+        # half-open lets a few probe calls through; their outcome closes or re-opens the circuit
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+        CIRCUIT_BREAKER_CALLS.labels(self.name, "rejected").inc()
+        return False
+
+    def release(self) -> None:
+        # a probe that ended without an outcome (cancelled, shutting down) hands its slot to the next caller
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._set_state(self.CLOSED)
+        CIRCUIT_BREAKER_CALLS.labels(self.name, "success").inc()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+        CIRCUIT_BREAKER_CALLS.labels(self.name, "failure").inc()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            settings = get_settings()
+            breaker = CircuitBreaker(
+                name,
+                settings.CIRCUIT_FAILURE_THRESHOLD,
+                settings.CIRCUIT_RESET_SECONDS,
+                settings.CIRCUIT_HALF_OPEN_MAX_CALLS,
+            )
+            _breakers[name] = breaker
+        return breaker
+
+
+@on_settings_reload
+def _retune_breakers(old: Settings, new: Settings) -> None:
+    with _breakers_lock:
+        for breaker in _breakers.values():
+            breaker.failure_threshold = new.CIRCUIT_FAILURE_THRESHOLD
+            breaker.reset_seconds = new.CIRCUIT_RESET_SECONDS
+            breaker.half_open_max_calls = new.CIRCUIT_HALF_OPEN_MAX_CALLS
+
+
+#------------------------------------------------- calls -------------------------------------------------
+
+async def guarded_call(name: str, func: Callable, timeout: float, *args, trips: tuple = (Exception,), **kwargs):
+    # func is blocking and receives the timeout it must apply to its own sockets; the thread cannot be cancelled,
+    # so waiting past that timeout would only hide a slow provider.
+    # Only exceptions in trips count against the provider; anything else (a rejected code, say) means it answered.
+    timeout = call_timeout(timeout)
+    breaker = get_breaker(name)
+    if not breaker.allow():
+        raise CircuitOpen(f"{name} circuit is open")
+    try:
+        with start_span(name, **{"peer.service": name.split(":")[0], "timeout_seconds": timeout}):
+            result = await asyncio.wait_for(run_in_threadpool(func, timeout, *args, **kwargs), timeout + 1)
+    except (asyncio.TimeoutError, *trips):
+        breaker.record_failure()
+        raise
+    except Exception:
+        breaker.record_success()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.record_success()
+    return result
+
+
+async def call_with_failover(channel: str, providers: List[Tuple[str, Callable]], timeout: float, *args, **kwargs):
+    # providers are tried in order; an open circuit is skipped without waiting on it
+    errors = []
+    for provider, func in providers:
+        try:
+            return await guarded_call(f"{channel}:{provider}", func, timeout, *args, **kwargs)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"{channel} provider {provider} failed: {e}")
+            errors.append(f"{provider}: {e}")
+    raise ProviderUnavailable(f"no {channel} provider available ({'; '.join(errors) or 'none configured'})")
@@ -0,0 +1,219 @@
+# Production entrypoint: python -m core.server
+# gunicorn supervises uvicorn workers (uvloop + httptools when installed) with the app preloaded in the
+# master so workers share its memory copy-on-write. Without gunicorn (Windows) uvicorn's own supervisor runs
+# the same limits instead.
+# Settings: a forked worker starts from the master's copy, so post_fork reloads them from the environment and .env;
+# each worker then watches .env itself. SIGHUP to a worker reloads its settings. SIGHUP to the gunicorn master is
+# gunicorn's own: it replaces every worker, and the new ones load the current settings in post_fork.
+import importlib.util
+import logging
+import math
+import os
+from typing import Optional
+
+from core.config import Settings, get_settings, reload_settings
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+#------------------------------------------------- sizing -------------------------------------------------
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota(root: str = CGROUP_ROOT) -> Optional[float]:
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read(os.path.join(root, "cpu.max"))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max":
+            try:
+                return int(quota) / int(period)
+            except ValueError:
+                return None
+        return None
+    # cgroup v1: a quota of -1 means unlimited
+    quota = _read(os.path.join(root, "cpu", "cpu.cfs_quota_us")) or _read(os.path.join(root, "cpu.cfs_quota_us"))
+    period = _read(os.path.join(root, "cpu", "cpu.cfs_period_us")) or _read(os.path.join(root, "cpu.cfs_period_us"))
+    try:
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    except ValueError:
+        pass
+    return None
+
+
+def cpu_limit(root: str = CGROUP_ROOT) -> float:
+    # os.cpu_count() reports the host, not what the container may use
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+    quota = cgroup_cpu_quota(root)
+    return min(available, quota) if quota else float(available)
+
+
+def worker_count(settings: Settings, cpus: Optional[float] = None) -> int:
+    if settings.SERVER_WORKERS > 0:
+        return settings.SERVER_WORKERS
+    cpus = cpu_limit() if cpus is None else cpus
+    return max(1, min(settings.SERVER_MAX_WORKERS, math.ceil(cpus * settings.SERVER_WORKERS_PER_CPU)))
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def uvicorn_options(settings: Settings) -> dict:
+    return {
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "timeout_keep_alive": settings.SERVER_KEEPALIVE_SECONDS,
+        "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "limit_concurrency": settings.SERVER_LIMIT_CONCURRENCY,
+        "proxy_headers": True,
+        "forwarded_allow_ips": settings.SERVER_FORWARDED_ALLOW_IPS,
+    }
+
+
+#------------------------------------------------- gunicorn -------------------------------------------------
+
+def post_fork(server, worker) -> None:
+    # connections opened while preloading belong to the master; the worker must not share the sockets
+    from db import session as db_session
+    from db.routing import replica_router
+    from db.sharding import shard_router
+
+    db_session.engine.dispose(close=False)
+    for replica in replica_router.replicas:
+        replica.engine.dispose(close=False)
+    # main.py creates the shard tables while preloading, so the shard pools hold the master's connections too
+    shard_router.dispose(close=False)
+    # the master's settings were loaded at preload; .env may have changed since (a respawn after a timeout, a crash
+    # or max_requests). After the pools are let go, so an engine the reload rebuilds closes none of the master's
+    reload_settings()
+
+
+def child_exit(server, worker) -> None:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def gunicorn_options(settings: Settings) -> dict:
+    return {
+        "bind": f"{settings.SERVER_HOST}:{settings.SERVER_PORT}",
+        "workers": worker_count(settings),
+        "worker_class": "core.server.ProductionUvicornWorker",
+        "preload_app": True,
+        "backlog": settings.SERVER_BACKLOG,
+        "keepalive": settings.SERVER_KEEPALIVE_SECONDS,
+        "timeout": settings.SERVER_TIMEOUT_SECONDS,
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "max_requests": settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER,
+        "forwarded_allow_ips": settings.SERVER_FORWARDED_ALLOW_IPS,
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+        "accesslog": "-",
+        "errorlog": "-",
+    }
+
+
+if BaseApplication is not None:
+    try:
+        from uvicorn_worker import UvicornWorker
+    except ImportError:
+        from uvicorn.workers import UvicornWorker
+
+    import asyncio
+    import sys
+
+    from gunicorn.arbiter import Arbiter
+    from uvicorn.server import Server
+
+    class DrainingServer(Server):
+        # the first SIGTERM/SIGQUIT only fails /readyz; the server stops after HEALTH_DRAIN_SECONDS, once the
+        # load balancer has had time to notice. A second signal exits right away.
+        def handle_exit(self, sig, frame) -> None:
+            from core.health import health_state
+
+            delay = get_settings().HEALTH_DRAIN_SECONDS
+            if health_state.draining or delay <= 0:
+                super().handle_exit(sig, frame)
+                return
+            health_state.mark_draining()
+            asyncio.get_event_loop().call_later(delay, super().handle_exit, sig, frame)
+
+    class ProductionUvicornWorker(UvicornWorker):
+        # gunicorn already passes keep-alive, backlog, max requests and forwarded IPs
+        CONFIG_KWARGS = {
+            key: value for key, value in uvicorn_options(get_settings()).items()
+            if key in ("loop", "http", "timeout_graceful_shutdown", "limit_concurrency", "proxy_headers")
+        }
+
+        # same as UvicornWorker._serve, with the draining server
+        async def _serve(self) -> None:
+            self.config.app = self.wsgi
+            server = DrainingServer(config=self.config)
+            self._install_sigquit_handler()
+            await server.serve(sockets=self.sockets)
+            if not server.started:
+                sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+    class ProductionServer(BaseApplication):
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+
+            return app
+
+
+#------------------------------------------------- entrypoint -------------------------------------------------
+
+def run() -> None:
+    settings = get_settings()
+    if BaseApplication is not None:
+        options = gunicorn_options(settings)
+        logger.info(f"Starting gunicorn on {options['bind']} with {options['workers']} worker(s)")
+        ProductionServer(options).run()
+        return
+
+    import uvicorn
+
+    workers = worker_count(settings)
+    logger.info(f"gunicorn unavailable, starting uvicorn on {settings.SERVER_HOST}:{settings.SERVER_PORT} with {workers} worker(s)")
+    uvicorn.run(
+        "main:app",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=workers,
+        backlog=settings.SERVER_BACKLOG,
+        limit_max_requests=settings.SERVER_MAX_REQUESTS or None,
+        **uvicorn_options(settings),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run()
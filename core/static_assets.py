@@ -0,0 +1,211 @@
+# Static asset pipeline: python -m core.static_assets precompresses at build time; the app only re-indexes at startup
+# and never writes to the static directory, which every worker shares.
+# Every file is served under its plain name and under a content-hashed name (css/app.3f2a1b9c04de.css). The hashed
+# name never changes meaning, so it is cached as immutable; plain names revalidate with a strong ETag.
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import tempfile
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from core.config import Settings, get_settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+TEMPORARY_SUFFIX = ".tmp"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# preferred first when the client accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_TYPES = {
+    "application/javascript", "application/json", "application/manifest+json", "application/wasm",
+    "application/xml", "image/svg+xml", "font/ttf", "font/otf",
+}
+
+
+def is_compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def fingerprinted_name(relative_path: str, digest: str) -> str:
+    root, ext = os.path.splitext(relative_path)
+    return f"{root}.{digest}{ext}"
+
+
+#------------------------------------------------- build -------------------------------------------------
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # readers see the old file or the new one, never a half-written one
+    directory, name = os.path.split(path)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=TEMPORARY_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp creates owner-only files; variants must stay as readable as their sources
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _compress(path: str, data: bytes) -> None:
+    # rewrite a variant only when it is missing or older than the source, so repeated builds are cheap
+    source_mtime = os.stat(path).st_mtime
+    targets = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        targets.append((".br", lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in targets:
+        variant = path + suffix
+        if os.path.exists(variant) and os.stat(variant).st_mtime >= source_mtime:
+            continue
+        compressed = compress()
+        # not worth a second file if compression barely helps (already-compressed formats)
+        if len(compressed) >= len(data) * 0.9:
+            continue
+        try:
+            _write_atomic(variant, compressed)
+        except OSError as e:
+            # read-only image: serve what was precompressed at build time
+            logger.warning(f"Could not write {variant}: {e}")
+
+
+def scan(directory: str, settings: Optional[Settings] = None, compress: bool = True) -> Dict[str, str]:
+    # plain relative path -> content digest, precompressing compressible files on the way
+    settings = settings or get_settings()
+    digests = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith((".gz", ".br", TEMPORARY_SUFFIX)) or name == MANIFEST_NAME:
+                continue
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, directory).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                data = f.read()
+            digests[relative_path] = hashlib.sha256(data).hexdigest()[:12]
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if compress and is_compressible(media_type) and len(data) >= settings.STATIC_COMPRESS_MIN_BYTES:
+                _compress(path, data)
+    return digests
+
+
+def build(directory: str, settings: Optional[Settings] = None, compress: bool = True) -> Dict[str, str]:
+    # writes manifest.json (plain -> fingerprinted path) for the frontend build to reference
+    digests = scan(directory, settings, compress)
+    manifest = {relative_path: fingerprinted_name(relative_path, digest) for relative_path, digest in digests.items()}
+    try:
+        _write_atomic(os.path.join(directory, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    except OSError as e:
+        logger.warning(f"Could not write the static manifest: {e}")
+    return digests
+
+
+#------------------------------------------------- serving -------------------------------------------------
+
+class Asset:
+    def __init__(self, path: str, digest: str, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        # encoding -> (file, stat, etag); stat results are kept so serving never touches the filesystem metadata
+        self.variants = {}
+        source_mtime = os.stat(path).st_mtime
+        for encoding, suffix in (("identity", ""),) + ENCODINGS:
+            variant = path + suffix
+            # a variant older than its source predates the last edit; serve the source until the next build
+            if os.path.isfile(variant) and os.stat(variant).st_mtime >= source_mtime:
+                etag = f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+                self.variants[encoding] = (variant, os.stat(variant), etag)
+
+    def negotiate(self, accept_encoding: str) -> tuple:
+        accepted = {
+            part.split(";")[0].strip().lower()
+            for part in accept_encoding.split(",")
+            if not part.strip().endswith(("q=0", "q=0.0"))
+        }
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+
+class StaticAssets:
+    # drop-in for StaticFiles; the index is built once (see load) instead of stat-ing files on every request
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest: Dict[str, str] = {}
+        self._assets: Dict[str, tuple] = {}
+
+    def load(self, settings: Optional[Settings] = None) -> None:
+        settings = settings or get_settings()
+        if not os.path.isdir(self.directory):
+            logger.warning(f"Static directory {self.directory!r} does not exist; /static will return 404")
+            self.manifest, self._assets = {}, {}
+            return
+        # read-only: variants and manifest.json come from the build step
+        digests = scan(self.directory, settings, compress=False)
+        manifest, assets = {}, {}
+        for relative_path, digest in digests.items():
+            path = os.path.join(self.directory, *relative_path.split("/"))
+            asset = Asset(path, digest, mimetypes.guess_type(path)[0] or "application/octet-stream")
+            manifest[relative_path] = fingerprinted_name(relative_path, digest)
+            assets[relative_path] = (asset, False)
+            assets[manifest[relative_path]] = (asset, True)
+        self.manifest, self._assets = manifest, assets
+        logger.info(f"Indexed {len(manifest)} static assets from {self.directory!r}")
+
+    def url_for(self, relative_path: str) -> str:
+        return "/static/" + self.manifest.get(relative_path, relative_path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = self.get_response(scope)
+        await response(scope, receive, send)
+
+    def get_response(self, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405, headers={"allow": "GET, HEAD"})
+        # under a Mount the path still carries the mount prefix, which is in root_path
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        found = self._assets.get(path.lstrip("/"))
+        if found is None:
+            return PlainTextResponse("Not Found", status_code=404)
+        asset, immutable = found
+        request_headers = Headers(scope=scope)
+        encoding, (file_path, stat_result, etag) = asset.negotiate(request_headers.get("accept-encoding", ""))
+
+        headers = {
+            "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else f"public, max-age={get_settings().STATIC_MAX_AGE_SECONDS}, must-revalidate",
+            "etag": etag,
+        }
+        if len(asset.variants) > 1:
+            headers["vary"] = "Accept-Encoding"
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or etag in tags:
+                return Response(status_code=304, headers=headers)
+
+        return FileResponse(file_path, headers=headers, media_type=asset.media_type, stat_result=stat_result)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    settings = get_settings()
+    built = build(settings.STATIC_DIR, settings, compress=settings.STATIC_PRECOMPRESS)
+    logger.info(f"Precompressed and fingerprinted {len(built)} assets in {settings.STATIC_DIR!r}")
@@ -0,0 +1,68 @@
+# Change counters for conditional GETs. Every flush that changes what the user listing shows bumps the "user" row in
+# the same transaction, so its ETag is a primary-key read instead of a scan and render of the whole table. Writes
+# that bypass the unit of work (core.user_bulk) call bump() themselves.
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session, attributes
+
+from api.v1.models.user.user_auth import TableVersion, User
+from api.v1.schemas import ALLUser
+
+USERS = "user"
+# a password rehash or an OTP round trip changes nothing the listing shows
+LISTED = tuple(ALLUser.model_fields)
+_UPSERTS = {"mysql": mysql.insert, "postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def bump(session: Session, name: str) -> None:
+    table = TableVersion.__table__
+    now = datetime.utcnow()
+    dialect = session.get_bind(mapper=TableVersion.__mapper__).dialect.name
+    upsert = _UPSERTS.get(dialect)
+    if upsert is None:
+        updated = session.execute(update(table).where(table.c.name == name).values(version=table.c.version + 1, updated_at=now))
+        if not updated.rowcount:
+            session.execute(insert(table).values(name=name, version=1, updated_at=now))
+        return
+    statement = upsert(table).values(name=name, version=1, updated_at=now)
+    if dialect == "mysql":
+        statement = statement.on_duplicate_key_update(version=table.c.version + 1, updated_at=now)
+    else:
+        statement = statement.on_conflict_do_update(index_elements=["name"], set_={"version": table.c.version + 1, "updated_at": now})
+    session.execute(statement)
+
+
+def read_version(db: Session, name: str) -> Tuple[int, Optional[datetime]]:
+    row = db.execute(select(TableVersion.version, TableVersion.updated_at).where(TableVersion.name == name)).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+def etag(version: int, updated_at: Optional[datetime]) -> str:
+    # the timestamp keeps tags from repeating if the counter row is ever recreated
+    stamp = int(updated_at.timestamp() * 1000) if updated_at else 0
+    return f'"{version}-{stamp}"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in tags or tag in tags
+
+
+def _listing_changed(session: Session) -> bool:
+    if any(isinstance(obj, User) for obj in session.new) or any(isinstance(obj, User) for obj in session.deleted):
+        return True
+    for obj in session.dirty:
+        if isinstance(obj, User) and any(attributes.get_history(obj, name).has_changes() for name in LISTED):
+            return True
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_user_version(session, flush_context):
+    if _listing_changed(session):
+        bump(session, USERS)
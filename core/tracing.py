@@ -0,0 +1,166 @@
+# Tracing with OpenTelemetry. Request spans honour W3C traceparent from upstream; DB statements, password hashing
+# and provider calls (SMTP, SMS, Google) are child spans. Everything is a no-op unless TRACING_ENABLED is set and
+# opentelemetry-sdk is installed; the OTLP exporter additionally needs opentelemetry-exporter-otlp-proto-http.
+import logging
+from contextlib import nullcontext
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import Settings, get_settings
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+except ImportError:
+    TracerProvider = None
+
+logger = logging.getLogger(__name__)
+
+_tracer = trace.get_tracer("wofr") if trace is not None else None
+_provider = None
+_trace_file = None
+
+
+#------------------------------------------------- setup -------------------------------------------------
+
+def _exporter(settings: Settings):
+    global _trace_file
+    exporter = settings.TRACING_EXPORTER.lower()
+    if exporter == "file":
+        # one JSON span per line; works without a collector
+        _trace_file = open(settings.TRACING_FILE_PATH, "a", buffering=1)
+        return ConsoleSpanExporter(out=_trace_file, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if exporter == "console":
+        return ConsoleSpanExporter()
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.error("TRACING_EXPORTER=otlp requires opentelemetry-exporter-otlp-proto-http; spans are not exported")
+            return None
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    return None
+
+
+def configure_tracing(settings: Optional[Settings] = None) -> bool:
+    # called per worker process, after fork, so the exporter thread belongs to the worker
+    global _provider
+    settings = settings or get_settings()
+    if not settings.TRACING_ENABLED or _provider is not None:
+        return _provider is not None
+    if TracerProvider is None:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing stays off")
+        return False
+    # an upstream sampling decision wins; root spans are sampled at TRACING_SAMPLE_RATIO
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+    )
+    exporter = _exporter(settings)
+    if exporter is not None:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _provider = provider
+    logger.info(f"Tracing on: exporter={settings.TRACING_EXPORTER}, sample ratio={settings.TRACING_SAMPLE_RATIO}")
+    return True
+
+
+def shutdown_tracing() -> None:
+    global _provider, _trace_file
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+
+#------------------------------------------------- spans -------------------------------------------------
+
+def start_span(name: str, **attributes):
+    # child of whatever span is current (contextvars carry it into run_in_threadpool); exceptions mark it failed
+    if _provider is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes={key: value for key, value in attributes.items() if value is not None})
+
+
+class TracingMiddleware:
+    def __init__(self, app: ASGIApp, skip_prefixes: tuple = ("/metrics", "/healthz", "/readyz", "/static")):
+        self.app = app
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if _provider is None or scope["type"] != "http" or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        from core.middleware import route_template
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = propagate.extract(carrier)
+        with _tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        ) as span:
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # the route template is known only after routing; it keeps span names low-cardinality
+                route = route_template(scope)
+                span.set_attribute("http.route", route)
+                span.update_name(f"{scope['method']} {route}")
+
+
+#------------------------------------------------- database -------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_span(conn, cursor, statement, parameters, context, executemany):
+    if _provider is None:
+        return
+    from db.session import normalize_statement
+
+    span = _tracer.start_span(
+        f"db {statement.lstrip()[:6].upper()}",
+        kind=SpanKind.CLIENT,
+        attributes={"db.system": conn.dialect.name, "db.statement": normalize_statement(statement)},
+    )
+    conn.info.setdefault("trace_spans", []).append(span)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_query_span(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        spans.pop().end()
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_query_span(exception_context):
+    connection = exception_context.connection
+    spans = connection.info.get("trace_spans") if connection is not None else None
+    if spans:
+        span = spans.pop()
+        span.record_exception(exception_context.original_exception)
+        span.set_status(Status(StatusCode.ERROR))
+        span.end()
+
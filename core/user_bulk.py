@@ -0,0 +1,129 @@
+# Admin bulk operations on users: one set-based UPDATE or DELETE per chunk of USER_BULK_CHUNK_SIZE users, each chunk
+# in its own transaction, shard by shard. Rows are selected by an id list or by organization (keyset-paged on user_id)
+# and locked before the statement, so the stats counters are adjusted from the exact rows changed, and the user
+# listing's version is bumped with them. Issued tokens need no separate revocation: auth.auth_bearer reads the user
+# on every request and rejects locked, inactive and deleted users.
+import logging
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from api.v1.models.user.google_auth import SocialAuth
+from api.v1.models.user.user_auth import OTP, LoginAudit, User
+from core import table_versions, user_stats
+from core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+SELECTED = (User.user_id, User.email, User.phone_number, User.status, User.user_type, User.is_verified, User.created_at)
+
+
+@dataclass
+class BulkResult:
+    matched: int = 0
+    changed: int = 0
+
+
+def _stat_values(row) -> tuple:
+    return row.status, row.user_type, row.is_verified, row.created_at
+
+
+def _chunks(db: Session, user_ids: Optional[List[str]], organization_name: Optional[str], exclude: Optional[str], size: int) -> Iterator[list]:
+    # locked rows of one shard, a chunk at a time; every chunk is committed before the next is read
+    query = select(*SELECTED).order_by(User.user_id).limit(size).with_for_update()
+    if organization_name is not None:
+        query = query.where(User.organization_name == organization_name)
+    if exclude is not None:
+        query = query.where(User.user_id != exclude)
+    if user_ids is not None:
+        unique = sorted(set(user_ids))
+        for start in range(0, len(unique), size):
+            rows = db.execute(query.where(User.user_id.in_(unique[start:start + size]))).all()
+            if rows:
+                yield rows
+        return
+    last = None
+    while True:
+        rows = db.execute(query if last is None else query.where(User.user_id > last)).all()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1].user_id
+
+
+def _run(operation, user_ids: Optional[List[str]], organization_name: Optional[str], exclude: Optional[str]) -> BulkResult:
+    from db.sharding import PRIMARY, shard_router
+
+    size = get_settings().USER_BULK_CHUNK_SIZE
+    result = BulkResult()
+    for shard_id in shard_router.shard_ids:
+        db = shard_router.shard_session(shard_id)
+        # counters, directory and audit rows live on the primary; on the primary shard they share the user transaction
+        primary = db if shard_id == PRIMARY else shard_router.shard_session(PRIMARY)
+        try:
+            for rows in _chunks(db, user_ids, organization_name, exclude, size):
+                result.matched += len(rows)
+                result.changed += operation(db, primary, rows)
+                db.commit()
+                if primary is not db:
+                    primary.commit()
+        except Exception:
+            db.rollback()
+            if primary is not db:
+                primary.rollback()
+            raise
+        finally:
+            db.close()
+            if primary is not db:
+                primary.close()
+    return result
+
+
+#------------------------------------------------- operations -------------------------------------------------
+
+def set_status(status, user_ids: Optional[List[str]] = None, organization_name: Optional[str] = None, exclude: Optional[str] = None) -> BulkResult:
+    def operation(db: Session, primary: Session, rows: list) -> int:
+        changing = [row for row in rows if row.status != status]
+        if not changing:
+            return 0
+        db.execute(
+            update(User).where(User.user_id.in_([row.user_id for row in changing])).values(status=status),
+            execution_options={"synchronize_session": False},
+        )
+        user_stats.adjust(
+            primary,
+            [_stat_values(row) for row in changing],
+            [(status, row.user_type, row.is_verified, row.created_at) for row in changing],
+        )
+        table_versions.bump(primary, table_versions.USERS)
+        return len(changing)
+
+    result = _run(operation, user_ids, organization_name, exclude)
+    logger.info(f"Bulk status {status.value}: {result.changed} of {result.matched} matched users changed")
+    return result
+
+
+def delete_users(user_ids: Optional[List[str]] = None, organization_name: Optional[str] = None, exclude: Optional[str] = None) -> BulkResult:
+    from db.sharding import ShardDirectory, shard_router
+
+    def operation(db: Session, primary: Session, rows: list) -> int:
+        ids = [row.user_id for row in rows]
+        emails = [row.email for row in rows if row.email]
+        phones = [row.phone_number for row in rows if row.phone_number]
+        # rows referencing the users go first; the login history is kept without its user
+        primary.execute(update(LoginAudit).where(LoginAudit.user_id.in_(ids)).values(user_id=None), execution_options={"synchronize_session": False})
+        primary.execute(delete(SocialAuth).where(SocialAuth.user_id.in_(ids)), execution_options={"synchronize_session": False})
+        if shard_router.enabled:
+            primary.execute(delete(ShardDirectory).where(ShardDirectory.user_id.in_(ids)))
+        if emails or phones:
+            db.execute(delete(OTP).where(or_(OTP.email.in_(emails), OTP.phone_number.in_(phones))), execution_options={"synchronize_session": False})
+        db.execute(delete(User).where(User.user_id.in_(ids)), execution_options={"synchronize_session": False})
+        user_stats.adjust(primary, [_stat_values(row) for row in rows], [])
+        table_versions.bump(primary, table_versions.USERS)
+        return len(rows)
+
+    result = _run(operation, user_ids, organization_name, exclude)
+    logger.info(f"Bulk delete: {result.changed} users deleted")
+    return result
@@ -0,0 +1,299 @@
+# Per-worker Bloom filter of registered emails and phone numbers, so login can answer an unknown one without looking
+# it up. The filter is stamped with the user table version (core.table_versions) it has caught up to, and a miss is
+# only trusted while that is still the current version; behind it, lookups go to the DB. Syncs pick up new rows by
+# created_at. Changes a created_at scan cannot see (new emails or phones on existing rows, backdated inserts) bump the
+# user_filter version, which makes every worker rebuild; writes that bypass the ORM must call invalidate() instead.
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, attributes
+
+from api.v1.models.user.user_auth import TableVersion, User
+from core import table_versions
+from core.config import Settings, get_settings, on_settings_reload
+from core.metrics import USER_FILTER_CHECKS, USER_FILTER_ENTRIES, USER_FILTER_FALSE_POSITIVE_RATE
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 1024
+# rows committed slightly out of created_at order are still caught by the next sync
+SYNC_OVERLAP = timedelta(seconds=60)
+FILTER_VERSION = "user_filter"
+
+
+def normalize(value: Optional[str]) -> Optional[str]:
+    # emails compare case-insensitively in MySQL, so the filter must never be stricter than the DB
+    if value is None:
+        return None
+    value = value.strip().lower()
+    return value or None
+
+
+#------------------------------------------------- bloom filter -------------------------------------------------
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        # double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hash_count)]
+
+    def add(self, value: str) -> bool:
+        # only values that were not already (apparently) present count towards the fill
+        bits = self._bits
+        added = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, value: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    @property
+    def false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+
+#------------------------------------------------- registered users -------------------------------------------------
+
+class UserExistenceFilter:
+    def __init__(self):
+        self._filter: Optional[BloomFilter] = None
+        self._lock = threading.Lock()
+        # values added while a rebuild is scanning the table, replayed into the new filter
+        self._pending: Optional[list] = None
+        self._watermark: Optional[datetime] = None
+        # table versions the filter has caught up to
+        self._version: Optional[int] = None
+        self._filter_version: Optional[int] = None
+        self._built_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def might_exist(self, value: Optional[str]) -> bool:
+        # False only when the value is certainly not registered; anything uncertain goes to the DB
+        bloom = self._filter
+        value = normalize(value)
+        if bloom is None or value is None or not get_settings().USER_FILTER_ENABLED:
+            return True
+        if value in bloom:
+            USER_FILTER_CHECKS.labels("maybe").inc()
+            return True
+        if not self._current():
+            USER_FILTER_CHECKS.labels("stale").inc()
+            return True
+        USER_FILTER_CHECKS.labels("absent").inc()
+        return False
+
+    def _current(self) -> bool:
+        # a primary-key read: the user table has not changed since the filter last caught up
+        try:
+            return self._versions()[0] == self._version
+        except SQLAlchemyError as e:
+            logger.warning(f"User existence filter could not read the table version: {e}")
+            return False
+
+    def _versions(self) -> Tuple[int, int]:
+        from db import session as db_session
+
+        with db_session.engine.connect() as conn:
+            versions = dict(conn.execute(
+                select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_((table_versions.USERS, FILTER_VERSION)))
+            ).all())
+        return versions.get(table_versions.USERS, 0), versions.get(FILTER_VERSION, 0)
+
+    def record_false_positive(self) -> None:
+        # call after might_exist() said maybe and the DB found nothing
+        if self.ready and get_settings().USER_FILTER_ENABLED:
+            USER_FILTER_CHECKS.labels("false_positive").inc()
+
+    def add(self, *values: Optional[str]) -> None:
+        with self._lock:
+            for value in map(normalize, values):
+                if value is None:
+                    continue
+                if self._filter is not None:
+                    self._filter.add(value)
+                if self._pending is not None:
+                    self._pending.append(value)
+        self._export()
+
+    def _export(self) -> None:
+        bloom = self._filter
+        if bloom is not None:
+            USER_FILTER_ENTRIES.set(bloom.count)
+            USER_FILTER_FALSE_POSITIVE_RATE.set(bloom.false_positive_rate)
+
+    #------------------------------------------------- building -------------------------------------------------
+
+    def _scan(self, batch_size: int, since: Optional[datetime] = None) -> Iterable[tuple]:
+        # keyset pages over the primary key keep memory flat however large the table is; one shard at a time
+        from db.sharding import shard_router
+
+        for shard_id in shard_router.shard_ids:
+            db = shard_router.shard_session(shard_id)
+            try:
+                last_id = ""
+                while True:
+                    query = db.query(User.user_id, User.email, User.phone_number).filter(User.user_id > last_id)
+                    if since is not None:
+                        query = query.filter(User.created_at >= since)
+                    rows = query.order_by(User.user_id).limit(batch_size).all()
+                    if not rows:
+                        break
+                    yield from rows
+                    last_id = rows[-1].user_id
+            finally:
+                db.close()
+
+    def rebuild(self, settings: Optional[Settings] = None) -> None:
+        from db.sharding import shard_router
+
+        settings = settings or get_settings()
+        started = datetime.utcnow()
+        # read before the scan, so the filter holds at least everything these versions cover
+        version, filter_version = self._versions()
+        with self._lock:
+            self._pending = []
+        try:
+            db = shard_router.session()
+            try:
+                total = sum(count for (count,) in db.query(func.count(User.user_id)).select_from(User).all())
+            finally:
+                db.close()
+            capacity = max(MIN_CAPACITY, int(total * 2 * settings.USER_FILTER_HEADROOM))
+            bloom = BloomFilter(capacity, settings.USER_FILTER_FALSE_POSITIVE_RATE)
+            for row in self._scan(settings.USER_FILTER_BUILD_BATCH_SIZE):
+                for value in (normalize(row.email), normalize(row.phone_number)):
+                    if value is not None:
+                        bloom.add(value)
+            with self._lock:
+                for value in self._pending:
+                    bloom.add(value)
+                self._filter = bloom
+                self._watermark = started - SYNC_OVERLAP
+                self._version, self._filter_version = version, filter_version
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+        self._export()
+        logger.info(f"User existence filter built: {bloom.count} entries, {bloom.size // 8} bytes, expected fp rate {bloom.false_positive_rate:.4f}")
+
+    def sync(self, settings: Optional[Settings] = None) -> int:
+        # picks up users created by other workers since the last build or sync
+        settings = settings or get_settings()
+        if self._watermark is None:
+            return 0
+        started = datetime.utcnow()
+        # with sharding the version row is on the primary, which a session commits after the user's shard
+        version, filter_version = self._versions()
+        if filter_version != self._filter_version:
+            self.rebuild(settings)
+            return 0
+        if version == self._version:
+            return 0
+        added = 0
+        for row in self._scan(settings.USER_FILTER_BUILD_BATCH_SIZE, since=self._watermark):
+            self.add(row.email, row.phone_number)
+            added += 1
+        self._watermark = started - SYNC_OVERLAP
+        self._version = version
+        return added
+
+    def request_rebuild(self) -> None:
+        # picked up by the background thread on its next tick
+        self._built_at = 0.0
+
+    def _needs_rebuild(self, settings: Settings) -> bool:
+        bloom = self._filter
+        if bloom is None:
+            return True
+        if bloom.count > bloom.capacity or bloom.false_positive_rate > settings.USER_FILTER_FALSE_POSITIVE_RATE * 2:
+            return True
+        return time.monotonic() - self._built_at >= settings.USER_FILTER_REBUILD_INTERVAL_SECONDS
+
+    def _run(self) -> None:
+        while True:
+            settings = get_settings()
+            try:
+                if self._needs_rebuild(settings):
+                    self.rebuild(settings)
+                else:
+                    self.sync(settings)
+            except Exception as e:
+                logger.error(f"User existence filter refresh failed: {e}")
+            if self._stop.wait(settings.USER_FILTER_SYNC_INTERVAL_SECONDS):
+                return
+
+    def start(self) -> None:
+        # built in the background; until then every lookup falls through to the DB
+        if self._thread is not None or not get_settings().USER_FILTER_ENABLED:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="user-existence-filter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+user_filter = UserExistenceFilter()
+
+
+@on_settings_reload
+def _resize_user_filter(old: Settings, new: Settings) -> None:
+    if old.USER_FILTER_FALSE_POSITIVE_RATE != new.USER_FILTER_FALSE_POSITIVE_RATE or old.USER_FILTER_HEADROOM != new.USER_FILTER_HEADROOM:
+        user_filter.request_rebuild()
+
+
+def invalidate(session: Session) -> None:
+    # for writes that bypass the ORM and add emails or phones a created_at sync would miss; every worker rebuilds
+    table_versions.bump(session, FILTER_VERSION)
+
+
+def _unsyncable(session: Session) -> bool:
+    cutoff = datetime.utcnow() - SYNC_OVERLAP
+    for obj in session.new:
+        if isinstance(obj, User) and obj.created_at is not None and obj.created_at < cutoff:
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, User) and any(attributes.get_history(obj, name).has_changes() for name in ("email", "phone_number")):
+            return True
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_unsyncable_change(session, flush_context):
+    if _unsyncable(session):
+        invalidate(session)
@@ -0,0 +1,182 @@
+# Admin user search. Email and username are prefix-matched in the database (LIKE 'q%' on their indexes);
+# organization names are matched here, against an in-memory trigram index of the distinct names, and the users of
+# the matching organizations are then fetched by ix_user_organization_name. Distinct organizations are far fewer
+# than users, so the index stays small at millions of users.
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from api.v1.models.user.user_auth import User
+from core.config import get_settings
+from core.user_filter import normalize
+
+logger = logging.getLogger(__name__)
+
+# higher ranks first; within a rank, shorter matches (closer to the query) first
+RANK_EMAIL_EXACT, RANK_EMAIL_PREFIX = 6, 5
+RANK_USERNAME_EXACT, RANK_USERNAME_PREFIX = 4, 3
+RANK_ORGANIZATION = 2
+
+
+def trigrams(text: str) -> Set[str]:
+    # padded like pg_trgm, so short names and word starts still produce grams
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def like_prefix(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+
+#------------------------------------------------- organization index -------------------------------------------------
+
+class OrganizationIndex:
+    def __init__(self):
+        # normalized name -> spellings as stored, and trigram -> normalized names
+        self._names: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: Optional[str]) -> None:
+        key = normalize(name)
+        if key is None:
+            return
+        with self._lock:
+            spellings = self._names.get(key)
+            if spellings is None:
+                self._names[key] = {name}
+                for gram in trigrams(key):
+                    self._grams.setdefault(gram, set()).add(key)
+            else:
+                spellings.add(name)
+
+    def search(self, query: str, limit: int, min_similarity: float) -> List[tuple]:
+        # (score, spellings) for names containing the query or sharing enough trigrams with it, best first
+        query = normalize(query)
+        if query is None:
+            return []
+        query_grams = trigrams(query)
+        with self._lock:
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(self._grams.get(gram, ()))
+            matches = []
+            for key, common in shared.items():
+                similarity = common / len(query_grams | trigrams(key))
+                if query in key:
+                    # exact, then prefix, then substring, each ahead of fuzzy matches
+                    score = 3.0 if key == query else 2.0 if key.startswith(query) else 1.0
+                    matches.append((score + similarity, key))
+                elif similarity >= min_similarity:
+                    matches.append((similarity, key))
+            matches.sort(key=lambda match: (-match[0], len(match[1]), match[1]))
+            return [(score, sorted(self._names[key])) for score, key in matches[:limit]]
+
+    #------------------------------------------------- refresh -------------------------------------------------
+
+    def rebuild(self) -> None:
+        # picks up other workers' writes and drops names no user has any more
+        from db.sharding import shard_router
+
+        fresh = OrganizationIndex()
+        for shard_id in shard_router.shard_ids:
+            with shard_router.engine(shard_id).connect() as conn:
+                for (name,) in conn.execute(select(User.organization_name).distinct()):
+                    fresh.add(name)
+        with self._lock:
+            self._names, self._grams = fresh._names, fresh._grams
+        logger.info(f"Organization search index built with {len(fresh)} organizations")
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.rebuild()
+            except Exception as e:
+                logger.error(f"Organization search index refresh failed: {e}")
+            if self._stop.wait(get_settings().USER_SEARCH_REFRESH_SECONDS):
+                return
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="organization-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+organization_index = OrganizationIndex()
+
+
+@event.listens_for(Session, "after_flush")
+def _index_organizations(session, flush_context):
+    # this worker's writes are searchable at once; other workers' at the next rebuild
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, User) and obj.organization_name:
+            organization_index.add(obj.organization_name)
+
+
+#------------------------------------------------- search -------------------------------------------------
+
+def _rank(user, query: str, organization_scores: Dict[str, float]) -> tuple:
+    email, username = normalize(user.email) or "", normalize(user.username) or ""
+    if email == query:
+        return RANK_EMAIL_EXACT, len(email)
+    if email.startswith(query):
+        return RANK_EMAIL_PREFIX, len(email)
+    if username == query:
+        return RANK_USERNAME_EXACT, len(username)
+    if username.startswith(query):
+        return RANK_USERNAME_PREFIX, len(username)
+    # organization scores are at most 4, so an organization match always ranks under a username prefix
+    return RANK_ORGANIZATION - 1 + organization_scores.get(normalize(user.organization_name), 0.0) / 4, 0
+
+
+def search_users(db: Session, query: str, limit: int, offset: int, min_similarity: Optional[float] = None) -> list:
+    # every source is read only as deep as the requested page, then merged and ranked
+    query = normalize(query)
+    if query is None:
+        return []
+    if min_similarity is None:
+        min_similarity = get_settings().USER_SEARCH_MIN_SIMILARITY
+    depth = offset + limit
+
+    found = {}
+    pattern = like_prefix(query)
+    for column in (User.email, User.username):
+        for user in db.query(User).filter(column.like(pattern, escape="\\")).order_by(column).limit(depth):
+            found[user.user_id] = user
+
+    # best organizations first, each fetched by ix_user_organization_name until the page is covered
+    organization_scores = {}
+    remaining = depth
+    for score, spellings in organization_index.search(query, depth, min_similarity):
+        if remaining <= 0:
+            break
+        organization_scores[normalize(spellings[0])] = score
+        users = db.query(User).filter(User.organization_name.in_(spellings)).order_by(User.user_id).limit(remaining).all()
+        for user in users:
+            found.setdefault(user.user_id, user)
+        remaining -= len(users)
+
+    ranked = []
+    for user in found.values():
+        rank, length = _rank(user, query, organization_scores)
+        ranked.append((-rank, length, user.user_id, user))
+    ranked.sort(key=lambda entry: entry[:3])
+    return [user for *_, user in ranked[offset:depth]]
@@ -0,0 +1,236 @@
+# Rollup counters for the user dashboards: all users, and users per status, type, verification and signup day.
+# Every flush that adds, deletes or changes a user adjusts them in the same transaction, so reading them never
+# scans the user table. Writes that bypass the unit of work (query.update()) call adjust() themselves; a periodic
+# recount from the user table corrects whatever drift is left. The recount locks the counters for a full scan, so a
+# lease lets only one worker of the fleet run it per interval.
+import enum
+import logging
+import threading
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, attributes
+
+from api.v1.models.user.user_auth import User, UserStat
+from core import leases
+from core.config import get_settings
+from db import session as db_session
+
+logger = logging.getLogger(__name__)
+
+TOTAL = ("total", "all")
+RECONCILE_LEASE = "user_stats_reconcile"
+TRACKED = ("status", "user_type", "is_verified", "created_at")
+_UPSERTS = {"mysql": mysql.insert, "postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _label(value) -> str:
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return "none" if value is None else str(value)
+
+
+def user_counters(status, user_type, is_verified, created_at) -> list:
+    return [
+        TOTAL,
+        ("status", _label(status)),
+        ("user_type", _label(user_type)),
+        ("verified", "true" if is_verified else "false"),
+        ("signup_day", _label(created_at)),
+    ]
+
+
+#------------------------------------------------- incremental -------------------------------------------------
+
+def _increment(session: Session, deltas: Dict[tuple, int]) -> None:
+    # every counter in one atomic multi-row upsert, so a registration costs one statement and concurrent writers
+    # never race on creating a row (a new signup day, say); rows go in key order so writers lock them in the same order
+    table = UserStat.__table__
+    rows = [{"dimension": dimension, "value": value, "count": delta} for (dimension, value), delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+    dialect = session.get_bind(mapper=UserStat.__mapper__).dialect.name
+    upsert = _UPSERTS.get(dialect)
+    if upsert is None:
+        for row in rows:
+            updated = session.execute(
+                update(table).where(table.c.dimension == row["dimension"], table.c.value == row["value"]).values(count=table.c.count + row["count"])
+            )
+            if not updated.rowcount:
+                session.execute(insert(table).values(**row))
+        return
+    statement = upsert(table).values(rows)
+    if dialect == "mysql":
+        statement = statement.on_duplicate_key_update(count=table.c.count + statement.inserted.count)
+    else:
+        statement = statement.on_conflict_do_update(index_elements=["dimension", "value"], set_={"count": table.c.count + statement.excluded.count})
+    session.execute(statement)
+
+
+def adjust(session: Session, before: Iterable[tuple], after: Iterable[tuple]) -> None:
+    # for set-based updates: before/after are the (status, user_type, is_verified, created_at) of each changed user
+    deltas = Counter()
+    for values in before:
+        deltas.subtract(user_counters(*values))
+    for values in after:
+        deltas.update(user_counters(*values))
+    _increment(session, deltas)
+
+
+def _previous_values(user: User) -> Optional[tuple]:
+    values = []
+    for name in TRACKED:
+        history = attributes.get_history(user, name)
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.added:
+            # changed without the old value ever being loaded; only a recount can tell
+            return None
+        else:
+            values.append(getattr(user, name))
+    return tuple(values)
+
+
+@event.listens_for(Session, "after_flush")
+def _count_user_changes(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, User):
+            deltas.update(user_counters(*(getattr(obj, name) for name in TRACKED)))
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            previous = _previous_values(obj)
+            if previous is None:
+                user_stats.request_reconcile()
+                continue
+            deltas.subtract(user_counters(*previous))
+    for obj in session.dirty:
+        if isinstance(obj, User) and session.is_modified(obj):
+            previous = _previous_values(obj)
+            if previous is None:
+                user_stats.request_reconcile()
+                continue
+            deltas.subtract(user_counters(*previous))
+            deltas.update(user_counters(*(getattr(obj, name) for name in TRACKED)))
+    if any(deltas.values()):
+        _increment(session, deltas)
+
+
+#------------------------------------------------- reading -------------------------------------------------
+
+def read_stats(db: Session, signup_days: int = 30) -> dict:
+    # a few hundred rows whatever the number of users; signup days are capped to the most recent ones
+    rows = db.execute(select(UserStat.dimension, UserStat.value, UserStat.count).where(UserStat.dimension != "signup_day")).all()
+    recent_days = db.execute(
+        select(UserStat.value, UserStat.count)
+        .where(UserStat.dimension == "signup_day", UserStat.value != "none")
+        .order_by(UserStat.value.desc())
+        .limit(signup_days)
+    ).all()
+    stats = {"status": {}, "user_type": {}, "verified": {}}
+    total = 0
+    for dimension, value, count in rows:
+        if (dimension, value) == TOTAL:
+            total = count
+        elif count:
+            stats.setdefault(dimension, {})[value] = count
+    stats["signup_day"] = {value: count for value, count in reversed(recent_days)}
+    return {"total": total, **stats}
+
+
+#------------------------------------------------- reconciliation -------------------------------------------------
+
+COUNTED_COLUMNS = {"status": User.status, "user_type": User.user_type, "verified": User.is_verified, "signup_day": func.date(User.created_at)}
+
+
+def count_users(conn, counts: Counter) -> None:
+    # the full scan the counters exist to avoid; only reconciliation runs it
+    counts[TOTAL] += conn.execute(select(func.count(User.user_id))).scalar()
+    for dimension, column in COUNTED_COLUMNS.items():
+        for value, count in conn.execute(select(column, func.count(User.user_id)).group_by(column)):
+            if dimension == "verified":
+                value = "true" if value else "false"
+            counts[(dimension, _label(value))] += count
+
+
+class UserStats:
+    def __init__(self):
+        self.owner = leases.owner_id()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def request_reconcile(self) -> None:
+        self._wake.set()
+
+    def reconcile(self) -> int:
+        # replaces every counter with a fresh count; returns how many were off
+        from db.sharding import PRIMARY, shard_router
+
+        with db_session.engine.begin() as conn:
+            # counters are locked before the primary is counted: a registration committed earlier is in the count,
+            # one still waiting on the lock adds its increment after the counters are replaced
+            current = {
+                (dimension, value): count
+                for dimension, value, count in conn.execute(select(UserStat.dimension, UserStat.value, UserStat.count).with_for_update())
+            }
+            counts = Counter()
+            count_users(conn, counts)
+            for shard_id in shard_router.shard_ids:
+                if shard_id != PRIMARY:
+                    with shard_router.engine(shard_id).connect() as shard:
+                        count_users(shard, counts)
+            counts = +counts
+            drifted = sum(1 for key in set(current) | set(counts) if current.get(key, 0) != counts.get(key, 0))
+            if drifted:
+                conn.execute(delete(UserStat))
+                conn.execute(insert(UserStat), [{"dimension": dimension, "value": value, "count": count} for (dimension, value), count in counts.items()])
+        if drifted and current:
+            logger.warning(f"User statistics reconciled: {drifted} counters were off")
+        return drifted
+
+    def run_pass(self, requested: bool = False) -> Optional[int]:
+        # None when another worker holds this interval's pass. A recount this worker asked for (a change it could not
+        # count) runs anyway; those are rare. A fresh database has no lease yet, so some worker always seeds it
+        interval = get_settings().USER_STATS_RECONCILE_INTERVAL_SECONDS
+        if not requested and not leases.acquire(RECONCILE_LEASE, self.owner, interval if interval > 0 else 60):
+            return None
+        return self.reconcile()
+
+    def _run(self) -> None:
+        requested = False
+        while not self._stop.is_set():
+            try:
+                self.run_pass(requested)
+            except SQLAlchemyError as e:
+                logger.error(f"User statistics reconciliation failed: {e}")
+            interval = get_settings().USER_STATS_RECONCILE_INTERVAL_SECONDS
+            if interval <= 0:
+                return
+            requested = self._wake.wait(interval)
+            self._wake.clear()
+
+    def start(self) -> None:
+        # the first pass seeds the counters on a database that predates them; the lease is not released on stop,
+        # so a deploy restarting every worker does not trigger a recount in each
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="user-stats-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+
+user_stats = UserStats()
@@ -0,0 +1,223 @@
+import itertools
+import logging
+import math
+import threading
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from core.config import Settings, get_settings, on_settings_reload
+from core.metrics import DB_READS_ROUTED, DB_REPLICA_HEALTHY, DB_REPLICA_LAG
+from db import session as db_session
+from db.session import SessionLocal, build_engine
+from db.sharding import shard_router
+
+logger = logging.getLogger(__name__)
+
+
+#------------------------------------------------- read-your-writes state -------------------------------------------------
+
+class RoutingState:
+    def __init__(self, pinned: bool = False):
+        # pinned: reads must go to the primary; wrote: this request changed data on the primary
+        self.pinned = pinned
+        self.wrote = False
+
+
+_routing_state: ContextVar[Optional[RoutingState]] = ContextVar("routing_state", default=None)
+
+
+def start_routing(pinned: bool = False) -> tuple:
+    state = RoutingState(pinned)
+    return state, _routing_state.set(state)
+
+
+def stop_routing(token) -> None:
+    _routing_state.reset(token)
+
+
+def mark_write() -> None:
+    # the state object is shared with the middleware, so this works from threadpool-run dependencies too
+    state = _routing_state.get()
+    if state is not None:
+        state.wrote = True
+        state.pinned = True
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session, flush_context):
+    if not session.info.get("read_only"):
+        mark_write()
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _after_bulk_write(orm_execute_state):
+    # query.update()/delete() never flush, so catch them at execution
+    if (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert) and not orm_execute_state.session.info.get("read_only"):
+        mark_write()
+
+
+#------------------------------------------------- replicas -------------------------------------------------
+
+_LAG_QUERIES = {
+    "postgresql": (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+}
+
+
+class Replica:
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self.engine = engine
+        # usable until the first probe says otherwise
+        self.healthy = True
+        self.lag: Optional[float] = None
+
+    def measure_lag(self) -> float:
+        dialect = self.engine.dialect.name
+        with self.engine.connect() as conn:
+            if dialect == "mysql":
+                return self._mysql_lag(conn)
+            query = _LAG_QUERIES.get(dialect)
+            if query is None:
+                conn.execute(text("SELECT 1"))
+                return 0.0
+            return float(conn.execute(text(query)).scalar() or 0)
+
+    @staticmethod
+    def _mysql_lag(conn) -> float:
+        for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"), ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except Exception:
+                continue
+            if row is None:
+                return 0.0
+            # NULL means the replication threads are stopped: treat as infinitely behind
+            lag = row.get(column)
+            return math.inf if lag is None else float(lag)
+        return 0.0
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._replicas: tuple = ()
+        self.max_lag = 0.0
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def replicas(self) -> tuple:
+        return self._replicas
+
+    def configure(self, settings: Settings) -> None:
+        previous = self._replicas
+        self._replicas = tuple(
+            Replica(f"replica{index}", build_engine(settings, url))
+            for index, url in enumerate(settings.REPLICA_DATABASE_URLS)
+        )
+        self.max_lag = settings.REPLICA_MAX_LAG_SECONDS
+        for replica in previous:
+            replica.engine.dispose()
+        if self._replicas:
+            logger.info(f"Routing reads to {len(self._replicas)} replica(s)")
+
+    def probe(self) -> None:
+        for replica in self._replicas:
+            was_healthy = replica.healthy
+            try:
+                replica.lag = replica.measure_lag()
+                replica.healthy = replica.lag <= self.max_lag
+                problem = f"{replica.lag:.1f}s behind"
+            except Exception as e:
+                replica.lag = None
+                replica.healthy = False
+                problem = f"unreachable ({e})"
+            if was_healthy and not replica.healthy:
+                logger.warning(f"Replica {replica.name} is {problem}, routing its reads to the primary")
+            elif replica.healthy and not was_healthy:
+                logger.info(f"Replica {replica.name} is back within {self.max_lag:.1f}s of the primary")
+            DB_REPLICA_LAG.labels(replica.name).set(replica.lag if replica.lag is not None else math.inf)
+            DB_REPLICA_HEALTHY.labels(replica.name).set(1 if replica.healthy else 0)
+
+    def route(self) -> tuple:
+        # (engine, target, reason) for a read-only session
+        replicas = self._replicas
+        if not replicas:
+            return db_session.engine, "primary", "no_replicas"
+        state = _routing_state.get()
+        if state is not None and state.pinned:
+            return db_session.engine, "primary", "read_your_writes"
+        healthy = [replica for replica in replicas if replica.healthy]
+        if not healthy:
+            return db_session.engine, "primary", "replicas_unavailable"
+        replica = healthy[next(self._counter) % len(healthy)]
+        return replica.engine, replica.name, "replica"
+
+    #------------------------------------------------- lag probe -------------------------------------------------
+
+    def _run(self) -> None:
+        while not self._stop.wait(get_settings().REPLICA_LAG_CHECK_INTERVAL_SECONDS):
+            self.probe()
+
+    def start(self) -> None:
+        if not self._replicas:
+            return
+        self.probe()
+        if self._thread is not None or get_settings().REPLICA_LAG_CHECK_INTERVAL_SECONDS <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-lag-probe", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+replica_router = ReplicaRouter()
+replica_router.configure(get_settings())
+
+
+def _replica_options(settings: Settings) -> tuple:
+    return (
+        tuple(settings.REPLICA_DATABASE_URLS),
+        settings.DB_POOL_SIZE,
+        settings.DB_MAX_OVERFLOW,
+        settings.DB_POOL_TIMEOUT_SECONDS,
+        settings.DB_POOL_RECYCLE_SECONDS,
+    )
+
+
+@on_settings_reload
+def _reconfigure_replicas(old: Settings, new: Settings) -> None:
+    if _replica_options(old) != _replica_options(new):
+        replica_router.configure(new)
+        replica_router.probe()
+    elif old.REPLICA_MAX_LAG_SECONDS != new.REPLICA_MAX_LAG_SECONDS:
+        replica_router.max_lag = new.REPLICA_MAX_LAG_SECONDS
+
+
+def get_read_db():
+    # for dependencies that only read; anything that writes keeps using get_db
+    if shard_router.enabled:
+        # replicas mirror the primary only, so sharded reads go to the shard that owns the row
+        db = shard_router.session(read_only=True)
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+    engine, target, reason = replica_router.route()
+    DB_READS_ROUTED.labels(target, reason).inc()
+    db = SessionLocal(bind=engine, info={"read_only": True})
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,23 +1,164 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from dotenv import load_dotenv
-import os
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+import json
+import logging
+import re
+import time
 
-load_dotenv()
+from core.config import Settings, get_settings, on_settings_reload
+from core.metrics import DB_QUERY_DURATION
 
-SQLALCHEMY_DATABASE_URL1 =os.getenv("DEV_DATABASE_URL")
-engine = create_engine(SQLALCHEMY_DATABASE_URL1)
+logger = logging.getLogger(__name__)
+
+
+def _engine_options(settings: Settings) -> tuple:
+    return (
+        settings.DATABASE_URL,
+        settings.DB_POOL_SIZE,
+        settings.DB_MAX_OVERFLOW,
+        settings.DB_POOL_TIMEOUT_SECONDS,
+        settings.DB_POOL_RECYCLE_SECONDS,
+    )
+
+
+def build_engine(settings: Settings, url: Optional[str] = None):
+    url = url or settings.DATABASE_URL
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+
+
+#------------------------------------------------- query profiling -------------------------------------------------
+
+slow_query_logger = logging.getLogger("db.slow_query")
+
+_OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE"))
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\?|%s|:\w+|%\(\w+\)s)(?:, ?(?:\?|%s|:\w+|%\(\w+\)s))*\)", re.IGNORECASE)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list:
+        return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def start_query_stats() -> tuple:
+    stats = QueryStats()
+    return stats, _query_stats.set(stats)
+
+
+def stop_query_stats(token) -> None:
+    _query_stats.reset(token)
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(statement: str) -> str:
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _STRING_LITERAL.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    return _IN_LIST.sub("IN (...)", normalized)
+
+
+def _redact_parameters(parameters, executemany: bool):
+    # only the shape of the bound values is logged, never the values themselves
+    if executemany:
+        return {"rows": len(parameters)}
+    if isinstance(parameters, dict):
+        return {key: "?" for key in parameters}
+    return ["?"] * len(parameters or ())
+
+
+def _statement_operation(statement: str) -> str:
+    head = statement.lstrip()[:6].upper()
+    return head if head in _OPERATIONS else "OTHER"
+
+
+# registered on the Engine class so engines rebuilt after a settings reload are covered too
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    DB_QUERY_DURATION.labels(_statement_operation(statement)).observe(elapsed)
+
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.record(normalize_statement(statement), elapsed)
+
+    if elapsed * 1000 >= get_settings().SLOW_QUERY_MS:
+        slow_query_logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": normalize_statement(statement),
+            "parameters": _redact_parameters(parameters, executemany),
+        }))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_time"):
+        connection.info["query_start_time"].pop()
+
+
+engine = build_engine(get_settings())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+@on_settings_reload
+def _rebuild_engine(old: Settings, new: Settings) -> None:
+    global engine
+    if _engine_options(old) == _engine_options(new):
+        return
+    previous = engine
+    engine = build_engine(new)
+    SessionLocal.configure(bind=engine)
+    # checked-out connections finish on the old pool and are closed when returned
+    previous.dispose()
+    logger.info("Database engine rebuilt with new pool settings")
+
 def api_response(status_code, data=None, message: str = None, total: int = 0, count: int = 0):
     response_data = {"data": data, "message": message, "status_code": status_code, "total": total, "count": count}
     filtered_response = {key: value for key, value in response_data.items() if value is not None or 0}
     return filtered_response
 
 def get_db():
-    db = SessionLocal()
+    # a shard-aware session when user rows are sharded; imported here because db.sharding builds on this module
+    from db.sharding import shard_router
+
+    db = shard_router.session()
     try:
         yield db
     finally:
@@ -0,0 +1,429 @@
+# Horizontal sharding of user and otp rows. A normalized email hashes to one of SHARD_BUCKETS buckets and the bucket
+# map (shard_bucket, on the primary) says which shard owns it; unmapped buckets stay on the primary, shard "0".
+# Lookups by phone or user_id go through shard_directory, also on the primary. Every other table lives on the primary.
+import argparse
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, delete, event, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import DropConstraint
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+
+from api.v1.models.user.user_auth import OTP, User
+from core.config import Settings, get_settings, on_settings_reload
+from core.user_filter import normalize
+from db import session as db_session
+from db.session import Base, SessionLocal, build_engine
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "0"
+SHARDED_TABLES = (User.__table__, OTP.__table__)
+KEY_COLUMNS = ("email", "phone_number", "user_id")
+BATCH_SIZE = 1000
+# primary tables whose user_id may name a user on another shard, so a foreign key to user cannot hold
+CROSS_SHARD_REFERENCES = ("login_audit", "social_auth")
+
+
+class ShardDirectory(Base):
+    __tablename__ = "shard_directory"
+    user_id = Column(String(10), primary_key=True)
+    shard = Column(String(16), nullable=False)
+    phone_number = Column(String(255), index=True)
+
+
+class ShardBucket(Base):
+    __tablename__ = "shard_bucket"
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    shard = Column(String(16), nullable=False)
+
+
+def bucket_for(value: Optional[str], buckets: int) -> Optional[int]:
+    # blake2b rather than hash(): the bucket must be the same in every process and every release
+    value = normalize(value)
+    if value is None:
+        return None
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big") % buckets
+
+
+#------------------------------------------------- router -------------------------------------------------
+
+class ShardRouter:
+    def __init__(self):
+        # extra shards only; the primary engine is looked up on use because a settings reload can rebuild it
+        self._engines: Dict[str, Engine] = {}
+        self.buckets = 4096
+        self.map_refresh = 30.0
+        self._bucket_map: Dict[int, str] = {}
+        self._map_loaded_at: Optional[float] = None
+        self._map_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._engines)
+
+    @property
+    def shard_ids(self) -> List[str]:
+        return [PRIMARY, *self._engines]
+
+    def engine(self, shard_id: str) -> Engine:
+        return db_session.engine if shard_id == PRIMARY else self._engines[shard_id]
+
+    def configure(self, settings: Settings) -> None:
+        previous = self._engines
+        self._engines = {
+            str(index): build_engine(settings, url)
+            for index, url in enumerate(settings.SHARD_DATABASE_URLS, start=1)
+        }
+        self.buckets = settings.SHARD_BUCKETS
+        self.map_refresh = settings.SHARD_MAP_REFRESH_SECONDS
+        self._map_loaded_at = None
+        for engine in previous.values():
+            engine.dispose()
+        if self._engines:
+            logger.info(f"Sharding user and otp rows over {len(self.shard_ids)} databases")
+
+    def create_tables(self) -> None:
+        for engine in self._engines.values():
+            Base.metadata.create_all(bind=engine, tables=list(SHARDED_TABLES))
+        if self._engines:
+            self._drop_cross_shard_foreign_keys()
+
+    def _drop_cross_shard_foreign_keys(self) -> None:
+        # SQLite cannot drop a constraint in place, and only enforces one with PRAGMA foreign_keys on
+        if db_session.engine.dialect.name == "sqlite":
+            return
+        with db_session.engine.begin() as conn:
+            for name in CROSS_SHARD_REFERENCES:
+                table = Table(name, MetaData(), autoload_with=conn)
+                for constraint in list(table.foreign_key_constraints):
+                    if constraint.referred_table.name == User.__tablename__ and constraint.name:
+                        conn.execute(DropConstraint(constraint))
+                        logger.info(f"Dropped foreign key {constraint.name} on {name}: users live on several shards")
+
+    def dispose(self, close: bool = True) -> None:
+        for engine in self._engines.values():
+            engine.dispose(close=close)
+
+    #------------------------------------------------- bucket map -------------------------------------------------
+
+    def bucket_map(self, refresh: bool = False) -> Dict[int, str]:
+        loaded_at = self._map_loaded_at
+        if refresh or loaded_at is None or time.monotonic() - loaded_at >= self.map_refresh:
+            with self._map_lock:
+                if refresh or self._map_loaded_at is loaded_at:
+                    with db_session.engine.connect() as conn:
+                        rows = conn.execute(select(ShardBucket.bucket, ShardBucket.shard)).all()
+                    self._bucket_map = {bucket: shard for bucket, shard in rows}
+                    self._map_loaded_at = time.monotonic()
+        return self._bucket_map
+
+    def shard_for_key(self, value: Optional[str]) -> str:
+        bucket = bucket_for(value, self.buckets)
+        if not self.enabled or bucket is None:
+            return PRIMARY
+        return self.bucket_map().get(bucket, PRIMARY)
+
+    #------------------------------------------------- directory -------------------------------------------------
+
+    def _directory(self, column, value) -> List[str]:
+        with db_session.engine.connect() as conn:
+            return sorted(set(conn.execute(select(ShardDirectory.shard).where(column == value)).scalars()))
+
+    def shards_for_user(self, user_id: str) -> List[str]:
+        return self._directory(ShardDirectory.user_id, user_id)
+
+    def shards_for_phone(self, phone_number: Optional[str]) -> List[str]:
+        phone_number = normalize(phone_number)
+        return self._directory(ShardDirectory.phone_number, phone_number) if phone_number else []
+
+    #------------------------------------------------- choosers -------------------------------------------------
+
+    def _shards_for_statement(self, statement) -> Optional[List[str]]:
+        # the shards that key comparisons in the WHERE clause point at; None when any of them cannot be resolved
+        shards = set()
+        for element in visitors.iterate(statement):
+            if not isinstance(element, BinaryExpression) or element.operator is not operators.eq:
+                continue
+            column, value = element.left, element.right
+            if getattr(column, "table", None) not in SHARDED_TABLES or column.key not in KEY_COLUMNS:
+                continue
+            if not isinstance(value, BindParameter) or value.effective_value is None:
+                continue
+            if column.key == "email":
+                found = [self.shard_for_key(value.effective_value)]
+            elif column.key == "phone_number":
+                found = self.shards_for_phone(value.effective_value)
+            else:
+                found = self.shards_for_user(value.effective_value)
+            if not found:
+                return None
+            shards.update(found)
+        return sorted(shards) or None
+
+    def _shard_chooser(self, mapper, instance, clause=None) -> str:
+        if isinstance(instance, User):
+            return self.shard_for_key(instance.email)
+        if isinstance(instance, OTP):
+            if instance.email:
+                return self.shard_for_key(instance.email)
+            # login OTPs sent by SMS sit with the user they were sent to
+            shards = self.shards_for_phone(instance.phone_number)
+            return shards[0] if shards else PRIMARY
+        return PRIMARY
+
+    def _identity_chooser(self, mapper, primary_key, *, lazy_loaded_from, execution_options, bind_arguments, **kw) -> List[str]:
+        if mapper.local_table is User.__table__:
+            return self.shards_for_user(primary_key[0]) or self.shard_ids
+        if mapper.local_table is OTP.__table__:
+            return self.shard_ids
+        return [PRIMARY]
+
+    def _execute_chooser(self, orm_context) -> List[str]:
+        mapper = orm_context.bind_mapper
+        if mapper is None or mapper.local_table not in SHARDED_TABLES:
+            return [PRIMARY]
+        # no usable key: fan out to every shard and merge the results
+        return self._shards_for_statement(orm_context.statement) or self.shard_ids
+
+    #------------------------------------------------- sessions -------------------------------------------------
+
+    def session(self, **info) -> Session:
+        if not self.enabled:
+            return SessionLocal(info=info)
+        return ShardSessionLocal(
+            shard_chooser=self._shard_chooser,
+            identity_chooser=self._identity_chooser,
+            execute_chooser=self._execute_chooser,
+            shards={shard_id: self.engine(shard_id) for shard_id in self.shard_ids},
+            info=info,
+        )
+
+    def shard_session(self, shard_id: str) -> Session:
+        # a plain session on one shard, for scans that page through each shard on their own
+        return SessionLocal(bind=self.engine(shard_id))
+
+
+ShardSessionLocal = sessionmaker(class_=ShardedSession, autocommit=False, autoflush=False)
+
+
+@event.listens_for(ShardSessionLocal, "before_flush")
+def _maintain_directory(session, flush_context, instances):
+    # flushed with the user, in the same primary transaction; a user_id taken on another shard fails here
+    for obj in list(session.new):
+        if isinstance(obj, User):
+            session.add(ShardDirectory(
+                user_id=obj.user_id,
+                shard=session.shard_chooser(User.__mapper__, obj),
+                phone_number=normalize(obj.phone_number),
+            ))
+    for obj in list(session.deleted):
+        if isinstance(obj, User):
+            entry = session.get(ShardDirectory, obj.user_id)
+            if entry is not None:
+                session.delete(entry)
+
+
+shard_router = ShardRouter()
+shard_router.configure(get_settings())
+
+
+def _shard_options(settings: Settings) -> tuple:
+    return (
+        tuple(settings.SHARD_DATABASE_URLS),
+        settings.SHARD_BUCKETS,
+        settings.DB_POOL_SIZE,
+        settings.DB_MAX_OVERFLOW,
+        settings.DB_POOL_TIMEOUT_SECONDS,
+        settings.DB_POOL_RECYCLE_SECONDS,
+    )
+
+
+@on_settings_reload
+def _reconfigure_shards(old: Settings, new: Settings) -> None:
+    if _shard_options(old) != _shard_options(new):
+        shard_router.configure(new)
+        shard_router.create_tables()
+    elif old.SHARD_MAP_REFRESH_SECONDS != new.SHARD_MAP_REFRESH_SECONDS:
+        shard_router.map_refresh = new.SHARD_MAP_REFRESH_SECONDS
+
+
+#------------------------------------------------- rebalancing -------------------------------------------------
+
+def _chunks(values: list, size: int = BATCH_SIZE) -> Iterable[list]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _scan(engine: Engine, table, key) -> Iterable[dict]:
+    # keyset pages so a shard of any size is read in bounded memory
+    last = None
+    with engine.connect() as conn:
+        while True:
+            query = select(table).order_by(key).limit(BATCH_SIZE)
+            if last is not None:
+                query = query.where(key > last)
+            rows = conn.execute(query).mappings().all()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][key.key]
+
+
+def plan_rebalance(current: Dict[int, str], shard_ids: List[str], buckets: int) -> Dict[int, str]:
+    # bucket -> new shard, moving as few buckets as possible: shards over an even share hand their surplus
+    # to shards under it, so adding a shard only moves the buckets it takes over
+    owner = {bucket: current.get(bucket, PRIMARY) for bucket in range(buckets)}
+    unknown = set(owner.values()) - set(shard_ids)
+    if unknown:
+        raise ValueError(f"bucket map references unconfigured shards {sorted(unknown)}; add their URLs back first")
+    base, extra = divmod(buckets, len(shard_ids))
+    quota = {shard_id: base + (index < extra) for index, shard_id in enumerate(shard_ids)}
+    owned = defaultdict(list)
+    for bucket, shard_id in owner.items():
+        owned[shard_id].append(bucket)
+    surplus = []
+    for shard_id in shard_ids:
+        while len(owned[shard_id]) > quota[shard_id]:
+            surplus.append(owned[shard_id].pop())
+    moves = {}
+    for shard_id in shard_ids:
+        while len(owned[shard_id]) < quota[shard_id]:
+            bucket = surplus.pop()
+            owned[shard_id].append(bucket)
+            moves[bucket] = shard_id
+    return moves
+
+
+def rebuild_directory(router: ShardRouter) -> int:
+    # the directory is derived data; this rewrites it from the user rows on every shard
+    count = 0
+    for shard_id in router.shard_ids:
+        rows = [
+            {"user_id": row["user_id"], "shard": shard_id, "phone_number": normalize(row["phone_number"])}
+            for row in _scan(router.engine(shard_id), User.__table__, User.__table__.c.user_id)
+        ]
+        for chunk in _chunks(rows):
+            with db_session.engine.begin() as conn:
+                conn.execute(delete(ShardDirectory).where(ShardDirectory.user_id.in_([row["user_id"] for row in chunk])))
+                conn.execute(insert(ShardDirectory), chunk)
+        count += len(rows)
+    return count
+
+
+def _copy_buckets(router: ShardRouter, source: str, targets: Dict[int, str]) -> tuple:
+    # copies the users and OTPs in the moving buckets from source to their new shards; returns what to delete later
+    user_table, otp_table = User.__table__, OTP.__table__
+    users, phone_buckets = defaultdict(list), {}
+    for row in _scan(router.engine(source), user_table, user_table.c.user_id):
+        bucket = bucket_for(row["email"], router.buckets)
+        if bucket in targets:
+            users[targets[bucket]].append(dict(row))
+            if normalize(row["phone_number"]):
+                phone_buckets[normalize(row["phone_number"])] = bucket
+    otps = defaultdict(list)
+    for row in _scan(router.engine(source), otp_table, otp_table.c.otp_id):
+        if row["email"]:
+            bucket = bucket_for(row["email"], router.buckets)
+        else:
+            bucket = phone_buckets.get(normalize(row["phone_number"]))
+        if bucket in targets:
+            otps[targets[bucket]].append(dict(row))
+
+    for target in set(users) | set(otps):
+        with router.engine(target).begin() as conn:
+            for chunk in _chunks(users[target]):
+                conn.execute(insert(user_table), chunk)
+            # otp ids are per-shard sequences; the target assigns new ones
+            for chunk in _chunks(otps[target]):
+                conn.execute(insert(otp_table), [{k: v for k, v in row.items() if k != "otp_id"} for row in chunk])
+        with db_session.engine.begin() as conn:
+            for chunk in _chunks([row["user_id"] for row in users[target]]):
+                conn.execute(update(ShardDirectory).where(ShardDirectory.user_id.in_(chunk)).values(shard=target))
+
+    moved_users = [row["user_id"] for rows in users.values() for row in rows]
+    moved_otps = [row["otp_id"] for rows in otps.values() for row in rows]
+    return moved_users, moved_otps
+
+
+def move_buckets(router: ShardRouter, moves: Dict[int, str], settings: Optional[Settings] = None) -> Dict[str, int]:
+    # copy, switch the map, wait for every worker to pick the map up, then delete the old copies.
+    # Writes to a moving bucket between the copy and the switch stay on the old shard: run it in a quiet window.
+    settings = settings or get_settings()
+    current = router.bucket_map(refresh=True)
+    by_source = defaultdict(dict)
+    for bucket, target in moves.items():
+        by_source[current.get(bucket, PRIMARY)][bucket] = target
+
+    stale = {}
+    for source, targets in by_source.items():
+        stale[source] = _copy_buckets(router, source, targets)
+        with db_session.engine.begin() as conn:
+            for chunk in _chunks(sorted(targets)):
+                conn.execute(delete(ShardBucket).where(ShardBucket.bucket.in_(chunk)))
+                conn.execute(insert(ShardBucket), [{"bucket": bucket, "shard": targets[bucket]} for bucket in chunk])
+    router.bucket_map(refresh=True)
+
+    time.sleep(settings.SHARD_MAP_REFRESH_SECONDS)
+    moved = {}
+    for source, (user_ids, otp_ids) in stale.items():
+        with router.engine(source).begin() as conn:
+            for chunk in _chunks(user_ids):
+                conn.execute(delete(User.__table__).where(User.__table__.c.user_id.in_(chunk)))
+            for chunk in _chunks(otp_ids):
+                conn.execute(delete(OTP.__table__).where(OTP.__table__.c.otp_id.in_(chunk)))
+        moved[source] = len(user_ids)
+    return moved
+
+
+def rebalance(router: ShardRouter, settings: Optional[Settings] = None, dry_run: bool = False) -> Dict[int, str]:
+    Base.metadata.create_all(bind=db_session.engine, tables=[ShardDirectory.__table__, ShardBucket.__table__])
+    router.create_tables()
+    moves = plan_rebalance(router.bucket_map(refresh=True), router.shard_ids, router.buckets)
+    if dry_run:
+        return moves
+    logger.info(f"Directory rebuilt with {rebuild_directory(router)} users")
+    if moves:
+        for source, count in move_buckets(router, moves, settings).items():
+            logger.info(f"Moved {count} users off shard {source}")
+    return moves
+
+
+def status(router: ShardRouter) -> Dict[str, dict]:
+    owners = defaultdict(int)
+    for bucket in range(router.buckets):
+        owners[router.bucket_map().get(bucket, PRIMARY)] += 1
+    result = {}
+    for shard_id in router.shard_ids:
+        with router.shard_session(shard_id) as db:
+            users = db.query(User).count()
+        result[shard_id] = {"buckets": owners[shard_id], "users": users}
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m db.sharding", description="Inspect and rebalance user shards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="buckets and users per shard")
+    rebalance_parser = commands.add_parser("rebalance", help="spread buckets evenly over the configured shards")
+    rebalance_parser.add_argument("--dry-run", action="store_true", help="only print how many buckets would move")
+    commands.add_parser("rebuild-directory", help="rewrite the user_id/phone directory from the shards")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for shard_id, counts in status(shard_router).items():
+            logger.info(f"shard {shard_id}: {counts['buckets']} buckets, {counts['users']} users")
+    elif args.command == "rebalance":
+        moves = rebalance(shard_router, dry_run=args.dry_run)
+        logger.info(f"{'Would move' if args.dry_run else 'Moved'} {len(moves)} of {shard_router.buckets} buckets")
+    else:
+        logger.info(f"Directory rebuilt with {rebuild_directory(shard_router)} users")
@@ -1,13 +1,61 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
+from core.config import get_settings, settings_watcher, install_sighup_handler
+from auth.password_hasher import password_hasher
+from core.audit import login_audit
+from core.user_filter import user_filter
+from core.user_stats import user_stats
+from core.user_search import organization_index
+from core.events import webhook_dispatcher
+from core.static_assets import StaticAssets
+from core.health import health_state, ping_database
+from core.profiling import ProfilingMiddleware
+from core.tracing import TracingMiddleware, configure_tracing, shutdown_tracing
+from core.middleware import cors_options, DeadlineMiddleware, IdempotencyMiddleware, MetricsMiddleware, QueryProfilingMiddleware, ReadYourWritesMiddleware
 from db.session import Base, engine,get_db
-from api.v1.endpoints.user import user_router, google_router
+from db.routing import replica_router
+from db.sharding import shard_router
+from api.v1.endpoints.user import user_router, google_router, login_audit_router, user_search_router, user_stats_router, bulk_users_router
+from api.v1.endpoints.monitoring import health_router, metrics_router, profiles_router
 Base.metadata.create_all(bind=engine)
+shard_router.create_tables()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    install_sighup_handler()
+    settings_watcher.start()
+    configure_tracing()
+    await run_in_threadpool(password_hasher.configure, get_settings())
+    await run_in_threadpool(static_assets.load)
+    await run_in_threadpool(replica_router.start)
+    login_audit.start()
+    user_filter.start()
+    user_stats.start()
+    organization_index.start()
+    await webhook_dispatcher.start()
+    # warm the pool so the first real request does not pay for the connection
+    await run_in_threadpool(ping_database)
+    health_state.mark_ready()
+    yield
+    health_state.mark_draining()
+    await webhook_dispatcher.stop()
+    organization_index.stop()
+    user_stats.stop()
+    user_filter.stop()
+    await run_in_threadpool(login_audit.stop)
+    replica_router.stop()
+    settings_watcher.stop()
+    shutdown_tracing()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+static_assets = StaticAssets(get_settings().STATIC_DIR)
 
 
 def custom_openapi():
@@ -22,20 +70,40 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
+# retried register / pre-register / password reset calls replay the first response instead of re-running
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    IdempotencyMiddleware,
+    paths=(
+        "/api/auth/v1/register",
+        "/api/auth/v1/pre-register/email-verification",
+        "/api/auth/v1/forgot-password",
+    ),
 )
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(QueryProfilingMiddleware)
+# preflights are answered here, before query profiling, routing and the rest of the stack. The middleware added
+# after it wraps it, so the request profiler, tracing and metrics see preflights too
+app.add_middleware(CORSMiddleware, **cors_options(get_settings()))
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", static_assets, name="static")
 
 app.include_router(user_router, prefix="/api", tags=["User Auth"])
+app.include_router(login_audit_router, prefix="/api", tags=["Login Audit"])
+app.include_router(user_stats_router, prefix="/api", tags=["User Stats"])
+app.include_router(user_search_router, prefix="/api", tags=["User Search"])
+app.include_router(bulk_users_router, prefix="/api", tags=["Bulk Users"])
 app.include_router(google_router, tags=["google Auth"])
+app.include_router(metrics_router, tags=["Monitoring"])
+app.include_router(health_router, tags=["Monitoring"])
+app.include_router(profiles_router, prefix="/api", tags=["Monitoring"])
 
+# development server with auto-reload; production runs python -m core.server
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", port=8001, reload= True, host="0.0.0.0")
\ No newline at end of file
+    settings = get_settings()
+    uvicorn.run("main:app", port=settings.SERVER_PORT, reload=True, host=settings.SERVER_HOST)
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""Micro-benchmarks for the auth hot paths, compared against a stored JSON baseline.
+
+    python test_case/bench_auth.py --save            # record a baseline on this machine
+    python test_case/bench_auth.py                   # compare, exit 1 on regressions
+    python test_case/bench_auth.py --filter jwt --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+#------------------------------------------------- timing -------------------------------------------------
+
+def measure(func, rounds: int, target_seconds: float) -> dict:
+    # calibrate the batch size so one round takes roughly target_seconds, then report per-call times
+    func()
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target_seconds or iterations >= 1_000_000:
+            break
+        iterations *= 2 if elapsed == 0 else max(2, min(10, int(target_seconds / elapsed) + 1))
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter_ns() - start) / iterations)
+    return {
+        "median_ns": statistics.median(samples),
+        "min_ns": min(samples),
+        "stdev_ns": statistics.pstdev(samples),
+        "iterations": iterations,
+        "rounds": rounds,
+    }
+
+
+#------------------------------------------------- benchmarks -------------------------------------------------
+
+def _user_session(rows: int):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from datetime import datetime
+    from db.session import Base
+    from api.v1.models.user import User
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all(
+        User(
+            user_id=str(i).zfill(5),
+            username=f"User{i}",
+            email=f"user{i}@example.com",
+            phone_number=f"+9190000{i:05d}",
+            organization_name="Bench",
+            password_hash="x" * 60,
+            status="active",
+            user_type="user",
+            created_at=datetime.utcnow(),
+            is_verified=True,
+        )
+        for i in range(1, rows + 1)
+    )
+    session.commit()
+    session.expunge_all()
+    return session
+
+
+def build_benchmarks() -> dict:
+    from auth.password_hasher import password_hasher
+    from auth.auth_handler import signJWT, decodeJWT
+    from auth.auth_bearer import JWTBearer
+    from utils import validators
+    from api.v1.endpoints.user.user_auth import generate_otp
+    from core.Email_config import build_otp_email, build_email_message
+    from api.v1.models.user import User
+    from api.v1.schemas import ALL_USERS_ADAPTER, ALLUser
+
+    token, _ = signJWT("00001", "user")
+    hashed = password_hasher.hash("Bench@1234")
+    session = _user_session(500)
+
+    def hydrate_users():
+        session.query(User).all()
+        session.expunge_all()
+
+    def serialize_users():
+        rows = session.query(*[getattr(User, name) for name in ALLUser.model_fields]).all()
+        ALL_USERS_ADAPTER.dump_json(ALL_USERS_ADAPTER.validate_python(rows, from_attributes=True))
+
+    def email_message():
+        subject, body = build_otp_email("1234", "login")
+        build_email_message("noreply@example.com", "user@example.com", subject, body)
+
+    return {
+        "jwt.sign": lambda: signJWT("00001", "user"),
+        "jwt.decode": lambda: decodeJWT(token),
+        "jwt.bearer_verify": lambda: JWTBearer.verify_jwt(token),
+        "validators.username": lambda: validators.validate_username("BenchUser"),
+        "validators.email": lambda: validators.validate_email("bench.user@example.com"),
+        "validators.phone": lambda: validators.validate_phone_number("+919876543210"),
+        "validators.password_strength": lambda: validators.validate_password_strength("Bench@1234"),
+        "validators.date_format": lambda: validators.validate_date_format("19-10-26"),
+        "validators.next_user_id": lambda: validators.generate_next_user_id(session),
+        "otp.generate": generate_otp,
+        "password.hash": lambda: password_hasher.hash("Bench@1234"),
+        "password.verify": lambda: password_hasher.verify("Bench@1234", hashed),
+        "email.otp_message": email_message,
+        "orm.hydrate_500_users": hydrate_users,
+        "json.all_users_500": serialize_users,
+    }
+
+
+#------------------------------------------------- baseline comparison -------------------------------------------------
+
+def environment() -> dict:
+    from auth.password_hasher import password_hasher
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "password_hash": password_hasher.describe(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        ratio = result["median_ns"] / previous["median_ns"]
+        result["baseline_median_ns"] = previous["median_ns"]
+        result["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def _format_ns(ns: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.2f} {unit}"
+    return f"{ns:.0f} ns"
+
+
+def print_report(results: dict, regressions: list, threshold: float) -> None:
+    print(f"{'benchmark':<32}{'median':>12}{'min':>12}{'baseline':>12}{'change':>10}")
+    for name, result in results.items():
+        baseline = _format_ns(result["baseline_median_ns"]) if "baseline_median_ns" in result else "-"
+        change = f"{(result['ratio'] - 1) * 100:+.1f}%" if "ratio" in result else "-"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<32}{_format_ns(result['median_ns']):>12}{_format_ns(result['min_ns']):>12}{baseline:>12}{change:>10}{flag}")
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {threshold * 100:.0f}%")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark WOFR auth hot paths.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown before failing (0.15 = 15%%)")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--target-seconds", type=float, default=0.1, help="approximate duration of one round")
+    args = parser.parse_args(argv)
+
+    # set here rather than at import, so pytest collecting this file does not leak them into other tests
+    os.environ.setdefault("DEV_DATABASE_URL", "sqlite://")
+    os.environ.setdefault("SETTINGS_WATCH_INTERVAL_SECONDS", "0")
+    # benchmark the configured cost, not whatever calibration picks on this run
+    os.environ.setdefault("PASSWORD_HASH_CALIBRATE", "false")
+
+    benchmarks = {name: func for name, func in build_benchmarks().items() if args.filter in name}
+    results = {name: measure(func, args.rounds, args.target_seconds) for name, func in benchmarks.items()}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != environment():
+            print(f"warning: baseline was recorded on a different environment: {baseline.get('environment')}")
+
+    regressions = compare(results, baseline, args.threshold) if baseline and not args.save else []
+    print_report(results, regressions, args.threshold)
+
+    if args.save:
+        merged = dict(baseline.get("results", {})) if baseline.get("environment") == environment() else {}
+        merged.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"environment": environment(), "results": merged}, f, indent=2, sort_keys=True)
+        print(f"\nbaseline written to {args.baseline}")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from api.v1.models.user.google_auth import SocialAuth
+from api.v1.models.user.user_auth import OTP, LoginAudit, User
+from api.v1.schemas import StatusEnum
+from auth.auth_bearer import require_enabled
+from core import user_bulk
+from core.config import get_settings
+from core.user_stats import read_stats, user_stats
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    # small chunks, so a handful of users spans several statements
+    monkeypatch.setattr("core.user_bulk.get_settings", lambda: get_settings().model_copy(update={"USER_BULK_CHUNK_SIZE": 3}))
+    for index in range(1, 9):
+        db.add(User(
+            user_id=f"{index:05d}", email=f"user{index}@example.com", status=StatusEnum.active, user_type="user",
+            is_verified=True, created_at=datetime(2026, 10, 1), organization_name="Acme" if index <= 6 else "Other",
+        ))
+    db.commit()
+    return db
+
+
+def test_status_by_organization_skips_excluded_and_unchanged_users(db):
+    db.get(User, "00002").status = StatusEnum.locked
+    db.commit()
+
+    result = user_bulk.set_status(StatusEnum.locked, organization_name="Acme", exclude="00001")
+    assert (result.matched, result.changed) == (5, 4)
+
+    db.expire_all()
+    locked = {user.user_id for user in db.query(User).filter(User.status == StatusEnum.locked)}
+    assert locked == {"00002", "00003", "00004", "00005", "00006"}
+    assert read_stats(db)["status"] == {"active": 3, "locked": 5}
+    assert user_stats.reconcile() == 0
+    # tokens already issued to the locked users stop working on their next request
+    with pytest.raises(HTTPException) as error:
+        require_enabled(db.get(User, "00003"))
+    assert error.value.status_code == 403
+
+
+def test_delete_by_ids_removes_dependent_rows(db):
+    db.add(OTP(email="user7@example.com", purpose="login"))
+    db.add(SocialAuth(user_id="00007", provider="google", provider_user_id="g-7"))
+    db.add(LoginAudit(user_id="00007"))
+    db.commit()
+
+    result = user_bulk.delete_users(user_ids=["00007", "00008", "00008", "99999"])
+    assert (result.matched, result.changed) == (2, 2)
+
+    db.expire_all()
+    assert db.query(User).count() == 6
+    assert db.query(OTP).count() == 0
+    assert db.query(SocialAuth).count() == 0
+    assert db.query(LoginAudit).one().user_id is None
+    assert read_stats(db)["total"] == 6
+    assert user_stats.reconcile() == 0
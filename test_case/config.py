@@ -0,0 +1,32 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.config import get_settings, reload_settings, on_settings_reload, _reload_listeners
+
+
+def test_settings_resolved_once():
+    assert get_settings() is get_settings()
+
+
+def test_reload_swaps_settings_and_notifies_listeners(monkeypatch):
+    seen = []
+    listener = on_settings_reload(lambda old, new: seen.append((old.LOGIN_MAX_OTP_ATTEMPT_COUNT, new.LOGIN_MAX_OTP_ATTEMPT_COUNT)))
+    try:
+        before = get_settings()
+        monkeypatch.setenv("LOGIN_MAX_OTP_ATTEMPT_COUNT", str(before.LOGIN_MAX_OTP_ATTEMPT_COUNT + 2))
+        after = reload_settings()
+        assert after is get_settings()
+        assert after.LOGIN_MAX_OTP_ATTEMPT_COUNT == before.LOGIN_MAX_OTP_ATTEMPT_COUNT + 2
+        assert seen == [(before.LOGIN_MAX_OTP_ATTEMPT_COUNT, before.LOGIN_MAX_OTP_ATTEMPT_COUNT + 2)]
+    finally:
+        _reload_listeners.remove(listener)
+        monkeypatch.undo()
+        reload_settings()
+
+
+def test_invalid_reload_keeps_current_settings(monkeypatch):
+    before = get_settings()
+    monkeypatch.setenv("LOGIN_MAX_OTP_ATTEMPT_COUNT", "not-a-number")
+    assert reload_settings() is before
+    monkeypatch.undo()
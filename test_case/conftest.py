@@ -0,0 +1,29 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from sqlalchemy import create_engine
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # a throwaway sqlite file in place of the configured database, for everything that goes through db.session.
+    # Imported here, so tests that never touch a database collect without one configured
+    from db import session as db_session
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    db_session.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db_session, "engine", engine)
+    monkeypatch.setitem(db_session.SessionLocal.kw, "bind", engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    from db import session as db_session
+
+    session = db_session.SessionLocal()
+    yield session
+    session.close()
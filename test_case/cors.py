@@ -0,0 +1,63 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from core.config import ProductionSettings, get_settings
+from core.middleware import cors_options
+
+
+def make_client(**overrides):
+    settings = get_settings().model_copy(update=dict(
+        CORS_ALLOW_ORIGINS="https://app.wofr.example, https://admin.wofr.example",
+        CORS_ALLOW_ORIGIN_REGEX=r"https://pr-\d+\.preview\.wofr\.example",
+        **overrides,
+    ))
+    app = FastAPI()
+    calls = []
+
+    @app.post("/login")
+    def login():
+        calls.append(1)
+        return {"ok": True}
+
+    app.add_middleware(CORSMiddleware, **cors_options(settings))
+    return TestClient(app), calls
+
+
+def preflight(client, origin):
+    return client.options("/login", headers={
+        "Origin": origin,
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type, idempotency-key",
+    })
+
+
+def test_preflight_is_answered_without_routing_and_cached():
+    client, calls = make_client()
+    response = preflight(client, "https://app.wofr.example")
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "https://app.wofr.example"
+    assert response.headers["access-control-max-age"] == "7200"
+    assert calls == []
+    assert preflight(client, "https://pr-42.preview.wofr.example").status_code == 200
+
+
+def test_unknown_origins_are_refused():
+    client, calls = make_client()
+    assert preflight(client, "https://evil.example").status_code == 400
+    response = client.post("/login", headers={"Origin": "https://evil.example"})
+    assert "access-control-allow-origin" not in response.headers
+
+
+def test_production_refuses_any_origin_with_credentials():
+    secret = "s" * 32
+    with pytest.raises(ValidationError, match="CORS_ALLOW_ORIGINS"):
+        ProductionSettings(JWT_SECRET=secret, CORS_ALLOW_ORIGINS="*", CORS_ALLOW_CREDENTIALS=True)
+    ProductionSettings(JWT_SECRET=secret, CORS_ALLOW_ORIGINS="*", CORS_ALLOW_CREDENTIALS=False)
+    ProductionSettings(JWT_SECRET=secret, CORS_ALLOW_ORIGINS="https://app.wofr.example", CORS_ALLOW_CREDENTIALS=True)
@@ -0,0 +1,99 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.config import get_settings
+from db import session as db_session
+from db.routing import ReplicaRouter, mark_write, start_routing, stop_routing
+
+
+def make_router(tmp_path, *names, **overrides):
+    urls = ",".join(f"sqlite:///{tmp_path / name}" for name in names)
+    settings = get_settings().model_copy(update={"DEV_REPLICA_DATABASE_URLS": urls, "PROD_REPLICA_DATABASE_URLS": urls, **overrides})
+    router = ReplicaRouter()
+    router.configure(settings)
+    return router
+
+
+def test_reads_go_to_primary_without_replicas():
+    engine, target, reason = ReplicaRouter().route()
+    assert engine is db_session.engine
+    assert (target, reason) == ("primary", "no_replicas")
+
+
+def test_reads_rotate_over_replicas_until_the_request_writes(tmp_path):
+    router = make_router(tmp_path, "r0.db", "r1.db")
+    state, token = start_routing()
+    try:
+        assert {router.route()[1] for _ in range(4)} == {"replica0", "replica1"}
+        mark_write()
+        assert router.route()[1:] == ("primary", "read_your_writes")
+        assert state.wrote
+    finally:
+        stop_routing(token)
+
+
+def test_flush_on_primary_session_pins_reads(tmp_path):
+    from api.v1.models.user.user_auth import OTP
+
+    OTP.__table__.create(bind=db_session.engine, checkfirst=True)
+    router = make_router(tmp_path, "r0.db")
+    state, token = start_routing()
+    db = db_session.SessionLocal()
+    try:
+        assert router.route()[1] == "replica0"
+        db.add(OTP(email="routing@example.com"))
+        db.flush()
+        assert state.wrote
+        assert router.route()[1:] == ("primary", "read_your_writes")
+    finally:
+        db.rollback()
+        db.close()
+        stop_routing(token)
+
+
+def test_lagging_or_unreachable_replicas_are_skipped(tmp_path, monkeypatch):
+    router = make_router(tmp_path, "r0.db", "missing/r1.db", REPLICA_MAX_LAG_SECONDS=1.0)
+    lagging, unreachable = router.replicas
+    monkeypatch.setattr(lagging, "measure_lag", lambda: 30.0)
+    router.probe()
+    assert not lagging.healthy and not unreachable.healthy
+    assert router.route()[1:] == ("primary", "replicas_unavailable")
+
+    monkeypatch.setattr(lagging, "measure_lag", lambda: 0.2)
+    router.probe()
+    assert router.route()[1] == "replica0"
+
+
+def test_authorization_reads_the_user_from_the_primary(db, tmp_path):
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from api.v1.models.user.user_auth import User
+    from api.v1.schemas import StatusEnum
+    from auth.auth_handler import signJWT
+    from db.routing import get_read_db
+    from main import app
+
+    # a replica that has not seen the account being locked yet
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    db_session.Base.metadata.create_all(bind=replica)
+    stale = sessionmaker(bind=replica)()
+    stale.add(User(user_id="00001", email="a@example.com", user_type="user", status=StatusEnum.active))
+    stale.commit()
+    db.add(User(user_id="00001", email="a@example.com", user_type="user", status=StatusEnum.locked))
+    db.commit()
+
+    def read_db():
+        yield stale
+
+    app.dependency_overrides[get_read_db] = read_db
+    try:
+        token, _ = signJWT("00001", "user")
+        response = TestClient(app).get("/api/users/v1/me/login-audit", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 403
+    finally:
+        app.dependency_overrides.pop(get_read_db, None)
+        stale.close()
+        replica.dispose()
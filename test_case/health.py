@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from core import health
+from core.health import HealthState, ReadinessCheck, health_state
+from main import app
+
+
+def test_readiness_follows_startup_and_drain():
+    with TestClient(app) as client:
+        assert client.get("/healthz").json() == {"status": "ok"}
+        ready = client.get("/readyz")
+        assert ready.status_code == 200
+        assert ready.json()["checks"]["database"]["ok"]
+
+        health_state.mark_draining()
+        draining = client.get("/readyz")
+        assert draining.status_code == 503
+        assert draining.json()["status"] == "draining"
+        # liveness is unaffected: the worker is healthy, just leaving
+        assert client.get("/healthz").status_code == 200
+    health_state.phase = HealthState.STARTING
+
+
+def test_probe_bursts_share_one_database_check(monkeypatch):
+    calls = []
+
+    async def fake_check_database(settings):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    monkeypatch.setattr(health, "check_database", fake_check_database)
+    monkeypatch.setattr(health_state, "phase", HealthState.READY)
+    check = ReadinessCheck()
+
+    async def burst():
+        return await asyncio.gather(*(check.run() for _ in range(20)))
+
+    results = asyncio.run(burst())
+    assert all(result["ready"] for result in results)
+    assert len(calls) == 1
+
+
+def test_exhausted_pool_fails_readiness_without_querying(monkeypatch):
+    class FullPool:
+        def size(self):
+            return 2
+
+        def checkedout(self):
+            return 2 + health.get_settings().DB_MAX_OVERFLOW
+
+    class FakeEngine:
+        pool = FullPool()
+
+        def connect(self):
+            raise AssertionError("must not wait on a saturated pool")
+
+    monkeypatch.setattr(health.db_session, "engine", FakeEngine())
+    result = asyncio.run(health.check_database(health.get_settings()))
+    assert not result["ok"]
+    assert result["error"] == "connection pool exhausted"
+
+
+def test_dropped_audit_events_fail_readiness(monkeypatch):
+    from api.v1.schemas import LoginStatusEnum, LoginTypeEnum
+    from core import audit
+
+    trail = audit.LoginAuditTrail(capacity=1, batch_size=10, flush_interval=60)
+    monkeypatch.setattr(audit, "login_audit", trail)
+
+    async def backlog():
+        # the threadpool limiter is only reachable from inside an event loop
+        return health.check_backlog(health.get_settings())
+
+    assert asyncio.run(backlog())["ok"]
+    trail.record("A0005", LoginTypeEnum.email, LoginStatusEnum.failed, None)
+    trail.record("A0005", LoginTypeEnum.email, LoginStatusEnum.success, None)
+    result = asyncio.run(backlog())
+    assert result["ok"] is False and result["audit_dropped"] == 1
+    assert result["error"] == "login audit events dropped"
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.idempotency import IdempotencyStore
+from core.middleware import IdempotencyMiddleware
+
+
+def make_app(delay: float = 0.0, status_code: int = 200, calls: list = None):
+    app = FastAPI()
+    calls = [] if calls is None else calls
+
+    @app.post("/register")
+    async def register(payload: dict):
+        calls.append(payload)
+        await asyncio.sleep(delay)
+        if status_code >= 500:
+            raise RuntimeError("provider down")
+        return {"call": len(calls), "email": payload["email"]}
+
+    app.add_middleware(IdempotencyMiddleware, paths=("/register",), store=IdempotencyStore(60, 60))
+    return app, calls
+
+
+def test_replay_returns_first_response_without_running_again(engine):
+    app, calls = make_app()
+    client = TestClient(app)
+    headers = {"Idempotency-Key": "k-1"}
+    first = client.post("/register", json={"email": "a@example.com"}, headers=headers)
+    second = client.post("/register", json={"email": "a@example.com"}, headers=headers)
+    assert first.json() == second.json() == {"call": 1, "email": "a@example.com"}
+    assert second.headers["idempotency-replayed"] == "true"
+    assert len(calls) == 1
+    # no key, no deduplication
+    client.post("/register", json={"email": "a@example.com"})
+    assert len(calls) == 2
+
+
+def test_same_key_with_different_body_is_rejected(engine):
+    app, calls = make_app()
+    client = TestClient(app)
+    client.post("/register", json={"email": "a@example.com"}, headers={"Idempotency-Key": "k-2"})
+    response = client.post("/register", json={"email": "b@example.com"}, headers={"Idempotency-Key": "k-2"})
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+
+def test_concurrent_duplicates_wait_for_the_first(engine):
+    app, calls = make_app(delay=0.2)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/register", json={"email": "c@example.com"}, headers={"Idempotency-Key": "k-3"})
+                for _ in range(5)
+            ))
+
+    responses = asyncio.run(run())
+    assert len(calls) == 1
+    assert {response.status_code for response in responses} == {200}
+    assert sum(response.headers.get("idempotency-replayed") == "true" for response in responses) == 4
+
+
+def test_server_errors_are_not_stored(engine):
+    app, calls = make_app(status_code=500)
+    client = TestClient(app, raise_server_exceptions=False)
+    for _ in range(2):
+        assert client.post("/register", json={"email": "d@example.com"}, headers={"Idempotency-Key": "k-4"}).status_code == 500
+    assert len(calls) == 2
+
+
+def test_a_retry_on_another_worker_is_replayed(engine):
+    # two workers: their own middleware and store, one database
+    first_worker, calls = make_app(delay=0.2)
+    second_worker, _ = make_app(calls=calls)
+
+    async def run():
+        clients = [
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+            for app in (first_worker, second_worker)
+        ]
+        headers = {"Idempotency-Key": "k-5"}
+        first = asyncio.create_task(clients[0].post("/register", json={"email": "e@example.com"}, headers=headers))
+        await asyncio.sleep(0.05)
+        # still running on the first worker: the second waits for it instead of running again
+        retry = await clients[1].post("/register", json={"email": "e@example.com"}, headers=headers)
+        responses = [await first, retry, await clients[1].post("/register", json={"email": "e@example.com"}, headers=headers)]
+        for client in clients:
+            await client.aclose()
+        return responses
+
+    responses = asyncio.run(run())
+    assert len(calls) == 1
+    assert [response.json() for response in responses] == [{"call": 1, "email": "e@example.com"}] * 3
+    assert [response.headers.get("idempotency-replayed") for response in responses] == [None, "true", "true"]
@@ -0,0 +1,295 @@
+"""Load test for the auth flow, driven in-process against the FastAPI app.
+
+Every virtual user walks pre-register -> verify -> register -> login ->
+verify-login-otp -> an authenticated call. The database is a throwaway
+SQLite file, email and SMS go to local sinks with injectable latency, and
+OTPs are read back from those sinks. Latency percentiles cover successful
+requests only; failures are counted and sampled on their own.
+
+    python test_case/load_auth_flow.py --users 200 --concurrency 20 --smtp-latency-ms 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+STEPS = ["pre_register", "verify_email_otp", "register", "login", "verify_login_otp", "authenticated_call"]
+OTP_PATTERN = re.compile(r">(\d{4,8})</h2>|OTP is (\d{4,8})")
+
+
+#------------------------------------------------- provider stand-ins -------------------------------------------------
+
+class OTPSink:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # recipient -> (messages received, latest OTP)
+        self._otps = {}
+        self.sent = 0
+
+    def capture(self, recipient: str, text: str) -> None:
+        match = OTP_PATTERN.search(text)
+        with self._lock:
+            self.sent += 1
+            if match:
+                received, _ = self._otps.get(recipient, (0, None))
+                self._otps[recipient] = (received + 1, match.group(1) or match.group(2))
+
+    def received(self, recipient: str) -> int:
+        with self._lock:
+            return self._otps.get(recipient, (0, None))[0]
+
+    async def next_otp(self, recipient: str, after: int, timeout: float = 10.0):
+        # the message may still be on its way (sent in a background task) when the response arrives
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                received, otp = self._otps.get(recipient, (0, None))
+            if received > after:
+                return otp
+            await asyncio.sleep(0.005)
+        return None
+
+
+def make_fake_smtp(sink: OTPSink, latency: float):
+    class FakeSMTP:
+        def __init__(self, host=None, port=None, *args, **kwargs):
+            pass
+
+        def starttls(self):
+            pass
+
+        def login(self, user, password):
+            pass
+
+        def sendmail(self, from_addr, to_addr, message):
+            time.sleep(latency)
+            sink.capture(to_addr, message)
+
+        def quit(self):
+            pass
+
+    return FakeSMTP
+
+
+def make_fake_twilio(sink: OTPSink, latency: float):
+    class FakeMessages:
+        def create(self, to, from_, body):
+            time.sleep(latency)
+            sink.capture(to, body)
+
+    class FakeClient:
+        def __init__(self, account_sid=None, auth_token=None, *args, **kwargs):
+            self.messages = FakeMessages()
+
+    return FakeClient
+
+
+#------------------------------------------------- app setup -------------------------------------------------
+
+def load_app(workdir: str, smtp_latency: float, sms_latency: float):
+    os.makedirs(os.path.join(workdir, "static"), exist_ok=True)
+    os.chdir(workdir)
+    os.environ["ENVIRONMENT"] = "dev"
+    os.environ["DEV_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ.setdefault("SETTINGS_WATCH_INTERVAL_SECONDS", "0")
+
+    import core.Email_config as email_config
+    import core.phone_config as phone_config
+    from main import app
+
+    email_sink, sms_sink = OTPSink(), OTPSink()
+    email_config.smtplib.SMTP = make_fake_smtp(email_sink, smtp_latency)
+    phone_config.Client = make_fake_twilio(sms_sink, sms_latency)
+    return app, email_sink, sms_sink
+
+
+#------------------------------------------------- scenario -------------------------------------------------
+
+def _letters(n: int) -> str:
+    out = ""
+    n += 1
+    while n:
+        n, rem = divmod(n - 1, 26)
+        out = chr(ord("a") + rem) + out
+    return out
+
+
+class Recorder:
+    def __init__(self):
+        # successful requests only, so failures that return early do not flatter the percentiles
+        self.latencies = defaultdict(list)
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(list)
+
+    async def step(self, name: str, call, expected: int = 200):
+        start = time.perf_counter()
+        try:
+            response = await call
+            ok = response.status_code == expected
+            detail = f"{response.status_code} {response.text[:120]}"
+        except Exception as e:
+            response, ok, detail = None, False, repr(e)
+        self.requests[name] += 1
+        if ok:
+            self.latencies[name].append(time.perf_counter() - start)
+        else:
+            self.errors[name] += 1
+            if len(self.error_samples[name]) < 3:
+                self.error_samples[name].append(detail)
+            return None
+        return response
+
+
+async def run_user(client, recorder: Recorder, email_sink: OTPSink, sms_sink: OTPSink, index: int, run_id: str, use_phone: bool):
+    email = f"load{run_id}{index}@example.com"
+    phone = f"+91{9000000000 + int(run_id) * 100000 + index}"
+    password = "Load@1234"
+
+    if not await recorder.step("pre_register", client.post("/api/auth/v1/pre-register/email-verification", params={"email": email})):
+        return
+    otp = await email_sink.next_otp(email, after=0)
+    if not await recorder.step("verify_email_otp", client.post("/api/auth/v1/pre-register/verify-otp", json={"email": email, "otp_code": otp})):
+        return
+    form = {
+        "user_name": f"Load{_letters(index)}",
+        "user_email": email,
+        "phone": phone,
+        "organization_name": "LoadTest",
+        "user_password": password,
+        "confirm_password": password,
+    }
+    if not await recorder.step("register", client.post("/api/auth/v1/register", data=form)):
+        return
+
+    login_id = phone if use_phone else email
+    sink = sms_sink if use_phone else email_sink
+    received = sink.received(login_id)
+    if not await recorder.step("login", client.post("/api/auth/v1/login", json={"email_or_phone": login_id, "password": password})):
+        return
+    otp = await sink.next_otp(login_id, after=received)
+    response = await recorder.step("verify_login_otp", client.post("/api/auth/v1/verify-login-otp", json={"email_or_phone": login_id, "otp_code": otp}))
+    if response is None:
+        return
+    token = response.json()["token"]
+    # an endpoint behind get_current_user, so the issued token is decoded and its user loaded
+    await recorder.step("authenticated_call", client.get("/api/users/v1/me/login-audit", headers={"Authorization": f"Bearer {token}"}))
+
+
+async def run_load(app, email_sink, sms_sink, users: int, concurrency: int, phone_ratio: float) -> dict:
+    import httpx
+
+    recorder = Recorder()
+    run_id = str(int(time.time()) % 1000)
+    queue = asyncio.Queue()
+    for index in range(users):
+        queue.put_nowait(index)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+        async def worker():
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                use_phone = phone_ratio > 0 and (index % round(1 / phone_ratio)) == 0
+                await run_user(client, recorder, email_sink, sms_sink, index, run_id, use_phone)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return summarize(recorder, elapsed, users, concurrency)
+
+
+#------------------------------------------------- reporting -------------------------------------------------
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(recorder: Recorder, elapsed: float, users: int, concurrency: int) -> dict:
+    steps = {}
+    for name in STEPS:
+        values = sorted(recorder.latencies.get(name, []))
+        count = recorder.requests.get(name, 0)
+        errors = recorder.errors.get(name, 0)
+        steps[name] = {
+            "requests": count,
+            "errors": errors,
+            "error_rate": errors / count if count else 0.0,
+            "throughput_rps": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "error_samples": recorder.error_samples.get(name, []),
+        }
+    completed = steps["authenticated_call"]["requests"] - steps["authenticated_call"]["errors"]
+    return {
+        "users": users,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "completed_flows": completed,
+        "flows_per_s": completed / elapsed if elapsed else 0.0,
+        "steps": steps,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['users']} users, concurrency {report['concurrency']}, {report['elapsed_s']:.2f}s, "
+          f"{report['completed_flows']} complete flows ({report['flows_per_s']:.1f}/s)\n")
+    print(f"{'step':<20}{'ok rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, step in report["steps"].items():
+        print(f"{name:<20}{step['throughput_rps']:>9.1f}{step['p50_ms']:>10.1f}{step['p95_ms']:>10.1f}{step['p99_ms']:>10.1f}")
+    failing = {name: step for name, step in report["steps"].items() if step["errors"]}
+    print("\nerrors: " + ("none" if not failing else ""))
+    for name, step in failing.items():
+        print(f"  {name}: {step['errors']} of {step['requests']} ({step['error_rate'] * 100:.1f}%)")
+        for sample in step["error_samples"]:
+            print(f"    {sample}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the WOFR auth flow against local stand-ins.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--smtp-latency-ms", type=float, default=20.0)
+    parser.add_argument("--sms-latency-ms", type=float, default=20.0)
+    parser.add_argument("--phone-ratio", type=float, default=0.0, help="share of users logging in by phone (0-1)")
+    parser.add_argument("--workdir", help="directory for the SQLite file (default: a fresh temp dir)")
+    parser.add_argument("--json", dest="json_path", help="also write the report as JSON")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="exit non-zero above this error rate (0-1)")
+    args = parser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="wofr-load-")
+    app, email_sink, sms_sink = load_app(workdir, args.smtp_latency_ms / 1000, args.sms_latency_ms / 1000)
+    report = asyncio.run(run_load(app, email_sink, sms_sink, args.users, args.concurrency, args.phone_ratio))
+    print_report(report)
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_error_rate is not None:
+        worst = max(step["error_rate"] for step in report["steps"].values())
+        if worst > args.max_error_rate:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
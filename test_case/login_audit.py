@@ -0,0 +1,74 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.v1.models.user.user_auth import LoginAudit
+from api.v1.schemas import LoginStatusEnum, LoginTypeEnum
+from core.audit import LoginAuditTrail
+from db import session as db_session
+
+
+def audit_rows(user_id):
+    db = db_session.SessionLocal()
+    try:
+        return db.query(LoginAudit).filter(LoginAudit.user_id == user_id).order_by(LoginAudit.id).all()
+    finally:
+        db.close()
+
+
+def test_flush_writes_buffered_events_in_batches(engine):
+    trail = LoginAuditTrail(capacity=100, batch_size=3, flush_interval=60)
+    for status in (LoginStatusEnum.failed, LoginStatusEnum.failed, LoginStatusEnum.locked, LoginStatusEnum.success):
+        trail.record("A0001", LoginTypeEnum.email, status, "10.0.0.1")
+    assert len(trail) == 4
+    assert trail.flush() == 4
+    assert len(trail) == 0
+    rows = audit_rows("A0001")
+    assert [row.status for row in rows] == [LoginStatusEnum.failed, LoginStatusEnum.failed, LoginStatusEnum.locked, LoginStatusEnum.success]
+    assert rows[0].ip_address == "10.0.0.1"
+
+
+def test_full_buffer_sheds_oldest_events(engine):
+    trail = LoginAuditTrail(capacity=2, batch_size=10, flush_interval=60)
+    trail.record("A0002", LoginTypeEnum.phone, LoginStatusEnum.failed, None)
+    trail.record("A0002", LoginTypeEnum.phone, LoginStatusEnum.locked, None)
+    trail.record("A0002", LoginTypeEnum.phone, LoginStatusEnum.success, None)
+    trail.flush()
+    assert [row.status for row in audit_rows("A0002")] == [LoginStatusEnum.locked, LoginStatusEnum.success]
+    assert trail.dropped == 1 and trail.dropped_within(60)
+
+
+def test_failed_batch_is_kept_for_the_next_flush(engine, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    trail = LoginAuditTrail(capacity=10, batch_size=10, flush_interval=60)
+    trail.record("A0003", LoginTypeEnum.email, LoginStatusEnum.success, None)
+
+    class BrokenEngine:
+        def begin(self):
+            raise OperationalError("INSERT", {}, Exception("database is down"))
+
+    monkeypatch.setattr(db_session, "engine", BrokenEngine())
+    assert trail.flush() == 0
+    assert len(trail) == 1
+    monkeypatch.setattr(db_session, "engine", engine)
+    assert trail.flush() == 1
+    assert len(audit_rows("A0003")) == 1
+
+
+def test_rows_the_database_rejects_do_not_block_the_queue(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine, event
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+    event.listen(engine, "connect", lambda conn, record: conn.execute("PRAGMA foreign_keys=ON"))
+    db_session.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db_session, "engine", engine)
+    monkeypatch.setitem(db_session.SessionLocal.kw, "bind", engine)
+
+    trail = LoginAuditTrail(capacity=10, batch_size=10, flush_interval=60)
+    trail.record(None, LoginTypeEnum.email, LoginStatusEnum.failed, None)
+    # no such user: the foreign key fails the batch insert
+    trail.record("A0404", LoginTypeEnum.email, LoginStatusEnum.success, None)
+    assert trail.flush() == 2
+    assert len(trail) == 0
+    assert len(audit_rows(None)) == 2
@@ -0,0 +1,42 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from api.v1.endpoints.user import user_auth
+from api.v1.models.user.user_auth import User
+from api.v1.schemas import StatusEnum
+from auth.password_hasher import hash_password
+from core.user_filter import user_filter
+from main import app
+
+PASSWORD = "Secret@123"
+
+
+def add_user(db, user_id, email, phone):
+    db.add(User(user_id=user_id, username="Login", email=email, phone_number=phone, password_hash=hash_password(PASSWORD),
+                status=StatusEnum.active, user_type="user", is_verified=True, created_at=datetime.utcnow()))
+    db.commit()
+
+
+def test_overlapping_email_logins_each_verify_their_own_otp(db, monkeypatch):
+    add_user(db, "L0001", "first@example.com", "+919000000001")
+    add_user(db, "L0002", "second@example.com", "+919000000002")
+    monkeypatch.setattr(user_filter, "might_exist", lambda value: True)
+    sent = {}
+
+    async def capture(email, otp, purpose):
+        sent[email] = otp
+
+    monkeypatch.setattr(user_auth, "send_otp_email", capture)
+    client = TestClient(app)
+
+    # both OTPs are outstanding at once; the second login must not take over the first one's row
+    for email in ("first@example.com", "second@example.com"):
+        assert client.post("/api/auth/v1/login", json={"email_or_phone": email, "password": PASSWORD}).status_code == 200
+    for email in ("first@example.com", "second@example.com"):
+        response = client.post("/api/auth/v1/verify-login-otp", json={"email_or_phone": email, "otp_code": sent[email]})
+        assert response.status_code == 200, response.text
@@ -0,0 +1,107 @@
+import os
+import subprocess
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+
+from api.v1.models.user.user_auth import OTP
+from core.metrics import observe_notification, render_metrics
+from core.middleware import MetricsMiddleware
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_requests_are_counted_by_route_template():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def item(item_id: str):
+        return {"id": item_id}
+
+    @app.get("/metrics")
+    def metrics():
+        return {}
+
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app)
+    route = {"method": "GET", "route": "/items/{item_id}"}
+    before = sample("http_requests_total", status="200", **route), sample("http_request_duration_seconds_count", **route)
+    unmatched = sample("http_requests_total", method="GET", route="unmatched", status="404")
+
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nowhere")
+    client.get("/metrics")
+
+    # one series for every item, however many ids are requested
+    assert sample("http_requests_total", status="200", **route) == before[0] + 2
+    assert sample("http_request_duration_seconds_count", **route) == before[1] + 2
+    assert sample("http_requests_total", method="GET", route="unmatched", status="404") == unmatched + 1
+    assert sample("http_requests_total", method="GET", route="/metrics", status="200") == 0
+    assert sample("http_requests_in_flight") == 0
+
+
+def test_otp_verification_outcomes_are_counted(db):
+    from main import app
+
+    now = datetime.utcnow()
+    db.add(OTP(email="otp@example.com", purpose="register", otp_code="1234", attempt_count=0, is_verified=False,
+               status="active", generated_at=now, expired_at=now + timedelta(minutes=5)))
+    db.commit()
+    failed, verified = sample("otp_events_total", purpose="register", event="failed"), sample("otp_events_total", purpose="register", event="verified")
+
+    client = TestClient(app)
+    assert client.post("/api/auth/v1/pre-register/verify-otp", json={"email": "otp@example.com", "otp_code": "0000"}).status_code == 401
+    assert client.post("/api/auth/v1/pre-register/verify-otp", json={"email": "otp@example.com", "otp_code": "1234"}).status_code == 200
+
+    assert sample("otp_events_total", purpose="register", event="failed") == failed + 1
+    assert sample("otp_events_total", purpose="register", event="verified") == verified + 1
+
+
+def test_notification_sends_are_timed_and_failures_counted():
+    labels = {"channel": "email", "provider": "test"}
+    count = sample("notification_send_duration_seconds_count", **labels)
+
+    with observe_notification("email", "test"):
+        pass
+    with pytest.raises(ConnectionError):
+        with observe_notification("email", "test"):
+            raise ConnectionError("relay down")
+
+    assert sample("notification_send_duration_seconds_count", **labels) == count + 2
+    assert sample("notification_send_failures_total", **labels) == 1
+
+
+def test_metrics_endpoint_serves_the_exposition_format():
+    from main import app
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE_LATEST
+    assert "# TYPE http_requests_total counter" in response.text
+    assert "db_pool_size{" in response.text
+
+
+def test_multiprocess_metrics_are_summed_from_the_worker_files(tmp_path, monkeypatch):
+    # two "workers" record into the shared directory, the way gunicorn workers do
+    script = "from core.metrics import OTP_EVENTS; OTP_EVENTS.labels('login', 'issued').inc(3)"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)})
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    body, content_type = render_metrics()
+    text = body.decode()
+    assert content_type == CONTENT_TYPE_LATEST
+    assert 'otp_events_total{event="issued",purpose="login"} 6.0' in text
+    # the pool gauges are per process and read live, not from the directory
+    assert "db_pool_size{" in text
@@ -0,0 +1,52 @@
+import os
+import sys
+import bcrypt
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.config import get_settings
+from auth.password_hasher import PasswordHasher
+
+
+def make_hasher(**overrides):
+    settings = get_settings().model_copy(update={"PASSWORD_HASH_CALIBRATE": False, "BCRYPT_ROUNDS": 4, **overrides})
+    hasher = PasswordHasher()
+    hasher.configure(settings)
+    return hasher
+
+
+def test_bcrypt_hash_records_cost_and_verifies():
+    hasher = make_hasher()
+    hashed = hasher.hash("Valid@123")
+    assert hashed.startswith("$2b$04$")
+    assert hasher.verify("Valid@123", hashed)
+    assert not hasher.verify("Wrong@123", hashed)
+
+
+def test_placeholder_hash_never_matches():
+    hasher = make_hasher()
+    assert not hasher.verify("GOOGLE_AUTH", "GOOGLE_AUTH")
+    assert not hasher.needs_rehash("GOOGLE_AUTH")
+
+
+def test_needs_rehash_only_upgrades_cost():
+    hasher = make_hasher(BCRYPT_ROUNDS=5)
+    weaker = bcrypt.hashpw(b"Valid@123", bcrypt.gensalt(rounds=4)).decode()
+    stronger = bcrypt.hashpw(b"Valid@123", bcrypt.gensalt(rounds=6)).decode()
+    assert hasher.needs_rehash(weaker)
+    assert not hasher.needs_rehash(stronger)
+
+
+def test_calibration_stays_within_bounds():
+    hasher = make_hasher(PASSWORD_HASH_CALIBRATE=True, BCRYPT_MIN_ROUNDS=4, BCRYPT_MAX_ROUNDS=6, PASSWORD_HASH_TARGET_MS=1.0)
+    assert 4 <= hasher.describe()["rounds"] <= 6
+
+
+def test_argon2id_verifies_and_upgrades_bcrypt_hashes():
+    bcrypt_hash = make_hasher().hash("Valid@123")
+    hasher = make_hasher(PASSWORD_HASH_ALGORITHM="argon2id", ARGON2_TIME_COST=1, ARGON2_MEMORY_COST_KIB=1024, ARGON2_PARALLELISM=1)
+    hashed = hasher.hash("Valid@123")
+    assert hashed.startswith("$argon2id$")
+    assert hasher.verify("Valid@123", hashed)
+    assert hasher.verify("Valid@123", bcrypt_hash)
+    assert hasher.needs_rehash(bcrypt_hash)
+    assert not hasher.needs_rehash(hashed)
@@ -0,0 +1,53 @@
+import os
+import re
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from auth.auth_handler import signJWT
+from core import profiling
+from core.config import get_settings
+from core.profiling import ProfilingMiddleware, profile_path
+
+
+def busy_handler():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+
+def make_client(tmp_path, monkeypatch, **overrides):
+    settings = get_settings().model_copy(update=dict(PROFILING_ENABLED=True, PROFILING_DIR=str(tmp_path), PROFILING_INTERVAL_MS=1.0, **overrides))
+    monkeypatch.setattr(profiling, "get_settings", lambda: settings)
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login():
+        busy_handler()
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware)
+    return TestClient(app), settings
+
+
+def test_admin_header_stores_a_folded_profile(tmp_path, monkeypatch):
+    client, settings = make_client(tmp_path, monkeypatch)
+    admin_token, _ = signJWT("A0001", "admin")
+    response = client.post("/login", headers={"X-Profile": "1", "Authorization": f"Bearer {admin_token}"})
+    profile_id = response.headers["x-profile-id"]
+    with open(profile_path(settings, profile_id)) as f:
+        lines = f.read().splitlines()
+    assert lines and all(re.match(r"^event-loop;.+ \d+$", line) for line in lines)
+    assert any("busy_handler" in line for line in lines)
+
+
+def test_only_admins_can_ask_for_a_profile(tmp_path, monkeypatch):
+    client, settings = make_client(tmp_path, monkeypatch)
+    user_token, _ = signJWT("U0001", "user")
+    assert "x-profile-id" not in client.post("/login", headers={"X-Profile": "1", "Authorization": f"Bearer {user_token}"}).headers
+    assert "x-profile-id" not in client.post("/login", headers={"X-Profile": "1"}).headers
+    assert os.listdir(tmp_path) == []
+    assert profile_path(settings, "../../etc/passwd") is None
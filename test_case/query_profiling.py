@@ -0,0 +1,76 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from core import middleware
+from core.config import get_settings
+from core.middleware import QueryProfilingMiddleware
+from db import session as db_session
+from db.session import normalize_statement
+
+
+def make_app(engine, queries: int):
+    app = FastAPI()
+
+    @app.get("/users/{user_id}")
+    def user(user_id: str):
+        with engine.connect() as conn:
+            for index in range(queries):
+                conn.execute(text("SELECT :value"), {"value": index})
+        return {}
+
+    app.add_middleware(QueryProfilingMiddleware)
+    return app
+
+
+def use_settings(monkeypatch, **overrides):
+    settings = get_settings().model_copy(update=overrides)
+    monkeypatch.setattr(middleware, "get_settings", lambda: settings)
+    monkeypatch.setattr(db_session, "get_settings", lambda: settings)
+
+
+def test_debug_responses_carry_the_query_count_and_time(engine, monkeypatch):
+    use_settings(monkeypatch, DEBUG=True)
+    response = TestClient(make_app(engine, 3)).get("/users/00001")
+    assert response.headers["x-db-query-count"] == "3"
+    assert float(response.headers["x-db-time-ms"]) > 0
+
+    use_settings(monkeypatch, DEBUG=False)
+    response = TestClient(make_app(engine, 3)).get("/users/00001")
+    assert "x-db-query-count" not in response.headers
+
+
+def test_repeated_statements_are_reported_as_n_plus_one(engine, monkeypatch, caplog):
+    use_settings(monkeypatch, N_PLUS_ONE_THRESHOLD=5, QUERY_BUDGET_PER_REQUEST=100)
+    with caplog.at_level(logging.WARNING, logger="core.middleware"):
+        TestClient(make_app(engine, 4)).get("/users/00001")
+        assert not caplog.records
+        TestClient(make_app(engine, 5)).get("/users/00001")
+    # reported once, by route template and normalized statement
+    assert [record.getMessage() for record in caplog.records] == ["Possible N+1 in GET /users/{user_id}: 5x SELECT ?"]
+
+
+def test_statements_are_normalized_without_literals():
+    assert normalize_statement("SELECT *\n  FROM user WHERE email = 'a@b.com' AND id = 42") == "SELECT * FROM user WHERE email = ? AND id = ?"
+    assert normalize_statement("SELECT * FROM user WHERE user_id IN (?, ?, ?)") == "SELECT * FROM user WHERE user_id IN (...)"
+    assert normalize_statement("SELECT * FROM user WHERE user_id IN (%(id_1)s, %(id_2)s)") == "SELECT * FROM user WHERE user_id IN (...)"
+
+
+def test_slow_queries_are_logged_as_json_without_values(engine, monkeypatch, caplog):
+    use_settings(monkeypatch, SLOW_QUERY_MS=0)
+    with caplog.at_level(logging.WARNING, logger="db.slow_query"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 'secret@example.com', :password"), {"password": "hunter2"})
+
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line["event"] == "slow_query" and line["duration_ms"] >= 0
+    assert line["statement"] == "SELECT ?, ?"
+    assert line["parameters"] == ["?"]
+    assert "secret@example.com" not in caplog.text and "hunter2" not in caplog.text
@@ -0,0 +1,52 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.v1.models.user.user_auth import User
+from auth.password_hasher import hash_password, verify_password
+from auth.reset_token import create_reset_token, decode_reset_token, matches_password
+from main import app
+
+
+@pytest.fixture
+def db(db):
+    db.add(User(user_id="R0001", username="Reset User", email="reset@example.com", phone_number="+919800000001",
+                password_hash=hash_password("Old@12345"), user_type="user", is_verified=True))
+    db.commit()
+    return db
+
+
+def current_hash(db):
+    db.expire_all()
+    return db.query(User.password_hash).filter(User.user_id == "R0001").scalar()
+
+
+def test_token_round_trip_and_tampering():
+    token = create_reset_token("R0001", "hash-a")
+    user_id, fingerprint = decode_reset_token(token)
+    assert user_id == "R0001"
+    assert matches_password(fingerprint, "hash-a")
+    assert not matches_password(fingerprint, "hash-b")
+
+    payload, signature = token.split(".")
+    assert decode_reset_token(payload + "." + signature[:-2] + "AA") is None
+    assert decode_reset_token("not-a-token") is None
+    assert decode_reset_token(create_reset_token("R0001", "hash-a", expires_in=-1)) is None
+
+
+def test_reset_link_works_once(db):
+    client = TestClient(app)
+    token = create_reset_token("R0001", current_hash(db))
+    body = {"token": token, "new_password": "New@12345", "confirm_password": "New@12345"}
+
+    response = client.post("/api/auth/v1/forgot-password", json=body)
+    assert response.status_code == 200
+    assert verify_password("New@12345", current_hash(db))
+
+    # the password hash changed, so the same link is now dead
+    replay = client.post("/api/auth/v1/forgot-password", json=dict(body, new_password="Other@12345", confirm_password="Other@12345"))
+    assert replay.status_code == 400
+    assert verify_password("New@12345", current_hash(db))
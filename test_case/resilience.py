@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from core import resilience
+from core.resilience import CircuitBreaker, DeadlineExceeded, ProviderUnavailable, call_with_failover
+
+
+def test_breaker_opens_then_probes_half_open():
+    breaker = CircuitBreaker("test:probe", failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    # one probe call goes through; a second caller is still rejected until the probe reports back
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_a_cancelled_probe_gives_its_slot_back(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    breaker = resilience.get_breaker("test:cancelled")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker._opened_at -= breaker.reset_seconds
+
+    def hang(timeout):
+        time.sleep(0.2)
+
+    async def scenario():
+        probe = asyncio.create_task(resilience.guarded_call("test:cancelled", hang, 1.0))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_failover_skips_an_open_primary(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    calls = []
+
+    def primary(timeout, to):
+        calls.append("primary")
+        raise ConnectionError("relay down")
+
+    def secondary(timeout, to):
+        calls.append("secondary")
+        return to
+
+    providers = [("primary", primary), ("secondary", secondary)]
+    for _ in range(resilience.get_settings().CIRCUIT_FAILURE_THRESHOLD):
+        assert asyncio.run(call_with_failover("email", providers, 1.0, to="a@example.com")) == "a@example.com"
+    assert resilience.get_breaker("email:primary").state == CircuitBreaker.OPEN
+
+    calls.clear()
+    asyncio.run(call_with_failover("email", providers, 1.0, to="a@example.com"))
+    assert calls == ["secondary"]
+
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(call_with_failover("email", providers[:1], 1.0, to="a@example.com"))
+
+
+def test_calls_are_cut_to_the_request_budget():
+    seen = []
+
+    async def handler(budget):
+        token = resilience.start_deadline(budget)
+        try:
+            return await call_with_failover("sms", [("only", lambda timeout: seen.append(timeout))], 10.0)
+        finally:
+            resilience.stop_deadline(token)
+
+    asyncio.run(handler(0.5))
+    assert 0 < seen[0] <= 0.5
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(handler(-1))
@@ -0,0 +1,40 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import config, server
+from core.config import get_settings
+from core.server import cgroup_cpu_quota, worker_count
+
+
+def test_cgroup_v2_quota(tmp_path):
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert cgroup_cpu_quota(str(tmp_path)) == 1.5
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cgroup_cpu_quota(str(tmp_path)) is None
+
+
+def test_cgroup_v1_quota(tmp_path):
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("200000")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000")
+    assert cgroup_cpu_quota(str(tmp_path)) == 2.0
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1")
+    assert cgroup_cpu_quota(str(tmp_path)) is None
+
+
+def test_worker_count_follows_cpu_limit():
+    settings = get_settings().model_copy(update={"SERVER_WORKERS": 0, "SERVER_WORKERS_PER_CPU": 2.0, "SERVER_MAX_WORKERS": 8})
+    assert worker_count(settings, cpus=1.5) == 3
+    assert worker_count(settings, cpus=0.25) == 1
+    assert worker_count(settings, cpus=64) == 8
+    assert worker_count(settings.model_copy(update={"SERVER_WORKERS": 5}), cpus=1) == 5
+
+
+def test_forked_workers_reload_settings(monkeypatch):
+    # the master's settings were loaded at preload; a worker forked after an .env edit must not keep them
+    inherited = get_settings().model_copy(update={"SERVER_MAX_WORKERS": 999})
+    monkeypatch.setattr(config, "_settings", inherited)
+    server.post_fork(None, None)
+    assert get_settings() is not inherited
+    assert get_settings().SERVER_MAX_WORKERS != 999
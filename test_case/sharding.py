@@ -0,0 +1,126 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.v1.models.user.user_auth import OTP, User
+from core.config import get_settings
+from db.sharding import ShardRouter, plan_rebalance, rebalance
+from utils.validators import generate_next_user_id
+
+
+def make_router(tmp_path, *names):
+    urls = ",".join(f"sqlite:///{tmp_path / name}" for name in names)
+    settings = get_settings().model_copy(update={
+        "DEV_SHARD_DATABASE_URLS": urls,
+        "PROD_SHARD_DATABASE_URLS": urls,
+        "SHARD_BUCKETS": 64,
+        "SHARD_MAP_REFRESH_SECONDS": 0,
+    })
+    router = ShardRouter()
+    router.configure(settings)
+    return router, settings
+
+
+def add_users(router, count):
+    db = router.session()
+    try:
+        for index in range(count):
+            db.add(User(user_id=generate_next_user_id(db), email=f"user{index}@example.com", phone_number=f"+9190000{index:05d}"))
+            db.commit()
+    finally:
+        db.close()
+
+
+def emails_by_shard(router):
+    result = {}
+    for shard_id in router.shard_ids:
+        with router.shard_session(shard_id) as db:
+            result[shard_id] = {email for (email,) in db.query(User.email)}
+    return result
+
+
+def test_rebalance_plan_moves_only_the_new_shares():
+    moves = plan_rebalance({}, ["0", "1"], 8)
+    assert sorted(moves.values()) == ["1"] * 4
+    current = {bucket: moves.get(bucket, "0") for bucket in range(8)}
+    # a third shard takes buckets from both, leaving everything else where it is
+    moves = plan_rebalance(current, ["0", "1", "2"], 8)
+    assert set(moves.values()) == {"2"} and len(moves) == 2
+
+
+def test_rows_are_routed_by_email_and_found_by_phone_or_id(tmp_path, engine):
+    router, settings = make_router(tmp_path, "shard1.db", "shard2.db")
+    rebalance(router, settings)
+    add_users(router, 12)
+
+    placed = emails_by_shard(router)
+    assert all(placed.values())
+    for shard_id, emails in placed.items():
+        assert all(router.shard_for_key(email) == shard_id for email in emails)
+
+    db = router.session()
+    try:
+        # user ids stay unique across shards, and a keyless query fans out to all of them
+        assert sorted(user_id for (user_id,) in db.query(User.user_id)) == [f"{n:05d}" for n in range(1, 13)]
+        user = db.query(User).filter(User.phone_number == "+919000000007").first()
+        assert user.email == "user7@example.com"
+        assert db.get(User, user.user_id).email == "user7@example.com"
+        # an SMS login OTP has no email; it follows the user's directory entry
+        db.add(OTP(phone_number=user.phone_number, purpose="login"))
+        db.commit()
+        with router.shard_session(router.shard_for_key(user.email)) as shard:
+            assert shard.query(OTP).filter(OTP.phone_number == user.phone_number).count() == 1
+    finally:
+        db.close()
+
+
+def test_rebalance_moves_existing_users_onto_new_shards(tmp_path, engine):
+    router, settings = make_router(tmp_path)
+    add_users(router, 20)
+    router, settings = make_router(tmp_path, "shard1.db")
+
+    moves = rebalance(router, settings)
+    assert moves
+    placed = emails_by_shard(router)
+    assert placed["0"] and placed["1"]
+    assert len(placed["0"] | placed["1"]) == 20
+
+    db = router.session()
+    try:
+        moved = sorted(placed["1"])[0]
+        user = db.query(User).filter(User.email == moved).first()
+        assert db.query(User).filter(User.phone_number == user.phone_number).one().email == moved
+    finally:
+        db.close()
+
+
+def test_dispose_drops_inherited_shard_connections(tmp_path, engine):
+    router, _ = make_router(tmp_path, "shard1.db")
+    router.create_tables()
+    shard_engine = router.engine("1")
+    pool = shard_engine.pool
+    assert pool.checkedin() == 1
+    # what post_fork does in every gunicorn worker
+    router.dispose(close=False)
+    assert shard_engine.pool is not pool and shard_engine.pool.checkedin() == 0
+
+
+def test_user_ids_come_from_one_counter(db):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from db import session as db_session
+
+    db.add(User(user_id="00041", email="existing@example.com"))
+    db.commit()
+
+    def allocate(_):
+        session = db_session.SessionLocal()
+        try:
+            return generate_next_user_id(session)
+        finally:
+            session.close()
+
+    # the counter starts after the ids already taken, and concurrent registrations never share one
+    with ThreadPoolExecutor(8) as pool:
+        ids = list(pool.map(allocate, range(40)))
+    assert sorted(ids) == [str(value).zfill(5) for value in range(42, 82)]
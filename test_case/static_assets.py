@@ -0,0 +1,65 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from core.static_assets import StaticAssets, build
+
+
+def make_client(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "app.css").write_text("body { color: #333; }\n" * 200)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + os.urandom(2048))
+    build(str(tmp_path))
+    assets = StaticAssets(str(tmp_path))
+    assets.load()
+    return assets, TestClient(Starlette(routes=[Mount("/static", app=assets)]))
+
+
+def test_negotiates_precompressed_variants(tmp_path):
+    assets, client = make_client(tmp_path)
+    assert (tmp_path / "css" / "app.css.gz").exists()
+    # random bytes do not compress, so no variant is kept
+    assert not (tmp_path / "logo.png.gz").exists()
+
+    gzipped = client.get("/static/css/app.css", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.status_code == 200
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+    assert gzipped.text == (tmp_path / "css" / "app.css").read_text()
+
+    plain = client.get("/static/css/app.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] != gzipped.headers["etag"]
+
+
+def test_fingerprinted_names_are_immutable_and_etags_revalidate(tmp_path):
+    assets, client = make_client(tmp_path)
+    url = assets.url_for("css/app.css")
+    assert url != "/static/css/app.css"
+    assert client.get(url).headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    plain = client.get("/static/logo.png")
+    assert "immutable" not in plain.headers["cache-control"]
+    not_modified = client.get("/static/logo.png", headers={"If-None-Match": plain.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert client.get("/static/missing.js").status_code == 404
+
+
+def test_workers_index_without_writing(tmp_path):
+    (tmp_path / "app.js").write_text("console.log('hi');\n" * 200)
+    assets = StaticAssets(str(tmp_path))
+    assets.load()
+    assert sorted(os.listdir(tmp_path)) == ["app.js"]
+
+    build(str(tmp_path))
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".tmp")) == []
+    # a source edited after the build is served as is until the next build
+    os.utime(tmp_path / "app.js", (os.stat(tmp_path / "app.js.gz").st_mtime + 10,) * 2)
+    assets.load()
+    asset, _ = assets._assets["app.js"]
+    assert list(asset.variants) == ["identity"]
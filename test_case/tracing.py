@@ -0,0 +1,48 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from core import tracing
+from core.config import get_settings
+from core.user_filter import user_filter
+from main import app
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+def test_login_spans_continue_the_upstream_trace(monkeypatch):
+    # a filter built by an earlier test would answer this login without a query
+    monkeypatch.setattr(user_filter, "might_exist", lambda value: True)
+    settings = get_settings().model_copy(update={"TRACING_ENABLED": True, "TRACING_EXPORTER": "none", "TRACING_SAMPLE_RATIO": 0.0})
+    assert tracing.configure_tracing(settings)
+    exporter = InMemorySpanExporter()
+    tracing._provider.add_span_processor(SimpleSpanProcessor(exporter))
+    try:
+        client = TestClient(app)
+        # sampled upstream, so the local ratio of 0 does not apply
+        client.post(
+            "/api/auth/v1/login",
+            json={"email_or_phone": "nobody@example.com", "password": "x"},
+            headers={"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"},
+        )
+        spans = exporter.get_finished_spans()
+        server = next(span for span in spans if span.name == "POST /api/auth/v1/login")
+        assert format(server.context.trace_id, "032x") == TRACE_ID
+        assert server.attributes["http.route"] == "/api/auth/v1/login"
+        queries = [span for span in spans if span.name.startswith("db ")]
+        assert queries and all(span.context.trace_id == server.context.trace_id for span in queries)
+
+        exporter.clear()
+        client.get("/api/users/v1/all-users")
+        # no upstream decision and a ratio of 0: nothing is recorded
+        assert exporter.get_finished_spans() == ()
+    finally:
+        tracing.shutdown_tracing()
@@ -0,0 +1,64 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime
+
+from api.v1.models.user.user_auth import User
+from core.user_filter import BloomFilter, UserExistenceFilter
+
+
+def add_user(db, user_id, email, phone):
+    db.add(User(user_id=user_id, username="Filter", email=email, phone_number=phone, created_at=datetime.utcnow()))
+    db.commit()
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(5000, 0.01)
+    members = [f"user{i}@example.com" for i in range(5000)]
+    for value in members:
+        bloom.add(value)
+    assert all(value in bloom for value in members)
+    false_positives = sum(f"other{i}@example.com" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+    assert 0.005 < bloom.false_positive_rate < 0.02
+
+
+def test_rebuild_and_sync_track_registered_users(db):
+    add_user(db, "F0001", "Filter.One@Example.com", "+919000000001")
+    existence = UserExistenceFilter()
+    assert existence.might_exist("nobody@example.com")  # not built yet: always ask the DB
+
+    existence.rebuild()
+    assert existence.might_exist("filter.one@example.com")
+    assert existence.might_exist("+919000000001")
+    assert not existence.might_exist("filter.two@example.com")
+
+    # registered through another worker: the filter is behind the table, so the miss goes to the DB until a sync
+    add_user(db, "F0002", "filter.two@example.com", "+919000000002")
+    assert existence.might_exist("filter.two@example.com")
+    assert existence.might_exist("filter.four@example.com")
+    assert existence.sync() >= 1
+    assert existence.might_exist("filter.two@example.com")
+
+    assert not existence.might_exist("filter.four@example.com")
+
+    existence.add("filter.three@example.com")
+    assert existence.might_exist("FILTER.THREE@example.com")
+
+
+def test_changes_a_sync_cannot_see_force_a_rebuild(db):
+    add_user(db, "F0001", "old@example.com", None)
+    existence = UserExistenceFilter()
+    existence.rebuild()
+
+    # a new email on an existing row, and a backdated import, are both outside the created_at window
+    db.get(User, "F0001").email = "new@example.com"
+    db.commit()
+    db.add(User(user_id="F0002", username="Imported", email="imported@example.com", created_at=datetime(2020, 1, 1)))
+    db.commit()
+    assert existence.might_exist("new@example.com")
+    existence.sync()
+    assert existence.might_exist("new@example.com")
+    assert existence.might_exist("imported@example.com")
+    assert not existence.might_exist("nobody@example.com")
@@ -0,0 +1,58 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.v1.models.user.user_auth import User
+from api.v1.schemas import StatusEnum
+from core import user_bulk
+from db import session as db_session
+from db.routing import get_read_db
+from main import app
+
+
+@pytest.fixture
+def db(db):
+    # reads go to the test database even when replicas are configured
+    def read_db():
+        session = db_session.SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_read_db] = read_db
+    yield db
+    app.dependency_overrides.pop(get_read_db, None)
+
+
+def test_unchanged_listing_is_answered_with_304(db):
+    client = TestClient(app)
+    db.add(User(user_id="00001", email="a@example.com", status=StatusEnum.active))
+    db.commit()
+
+    first = client.get("/api/users/v1/all-users")
+    assert first.status_code == 200 and len(first.json()) == 1
+    tag = first.headers["etag"]
+    assert "last-modified" in first.headers
+
+    cached = client.get("/api/users/v1/all-users", headers={"If-None-Match": tag})
+    assert cached.status_code == 304 and cached.content == b""
+
+    # a change the listing does not show keeps the tag
+    db.get(User, "00001").password_hash = "rehashed"
+    db.commit()
+    assert client.get("/api/users/v1/all-users", headers={"If-None-Match": tag}).status_code == 304
+
+    db.add(User(user_id="00002", email="b@example.com", status=StatusEnum.active))
+    db.commit()
+    changed = client.get("/api/users/v1/all-users", headers={"If-None-Match": tag})
+    assert changed.status_code == 200 and len(changed.json()) == 2
+    assert changed.headers["etag"] != tag
+
+    # set-based updates bump the version too
+    tag = changed.headers["etag"]
+    user_bulk.set_status(StatusEnum.locked, user_ids=["00002"])
+    assert client.get("/api/users/v1/all-users", headers={"If-None-Match": tag}).status_code == 200
@@ -0,0 +1,42 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from api.v1.models.user.user_auth import User
+from core.user_search import OrganizationIndex, organization_index, search_users
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    monkeypatch.setattr(organization_index, "_names", {})
+    monkeypatch.setattr(organization_index, "_grams", {})
+    return db
+
+
+def test_organization_index_ranks_substring_over_fuzzy_matches():
+    index = OrganizationIndex()
+    for name in ("Acme Corp", "ACME CORP", "Acme Corporation", "Northwind Traders", "Akme Co"):
+        index.add(name)
+    results = index.search("acme corp", 10, 0.3)
+    assert results[0][1] == ["ACME CORP", "Acme Corp"]
+    assert results[1][1] == ["Acme Corporation"]
+    assert ["Northwind Traders"] not in [spellings for _, spellings in results]
+    assert [spellings for _, spellings in index.search("wind", 10, 0.3)] == [["Northwind Traders"]]
+
+
+def test_search_ranks_email_then_username_then_organization_and_pages(db):
+    db.add_all([
+        User(user_id="00001", email="ann@example.com", username="zed", organization_name="Beta Labs"),
+        User(user_id="00002", email="bob@example.com", username="annika", organization_name="Beta Labs"),
+        User(user_id="00003", email="cy@example.com", username="cy", organization_name="Annex Holdings"),
+        User(user_id="00004", email="dee@example.com", username="dee", organization_name="Other"),
+    ])
+    db.commit()
+
+    assert [user.user_id for user in search_users(db, "Ann", 10, 0)] == ["00001", "00002", "00003"]
+    assert [user.user_id for user in search_users(db, "ann", 1, 1)] == ["00002"]
+    assert [user.user_id for user in search_users(db, "beta", 10, 0)] == ["00001", "00002"]
+    # LIKE wildcards in the query are literal
+    assert search_users(db, "%", 10, 0) == []
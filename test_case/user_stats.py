@@ -0,0 +1,64 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime
+
+from sqlalchemy import update
+
+from api.v1.models.user.user_auth import User
+from api.v1.schemas import StatusEnum
+from core.user_stats import UserStats, read_stats, user_stats
+
+
+def add_user(db, user_id, **fields):
+    values = dict(status=StatusEnum.active, user_type="user", is_verified=True, created_at=datetime(2026, 10, 1))
+    values.update(fields)
+    db.add(User(user_id=user_id, email=f"{user_id}@example.com", **values))
+    db.commit()
+
+
+def test_counters_follow_inserts_updates_and_deletes(db):
+    add_user(db, "00001")
+    add_user(db, "00002", is_verified=False, created_at=datetime(2026, 10, 2))
+    add_user(db, "00003", user_type="admin")
+
+    user = db.get(User, "00002")
+    user.status = StatusEnum.locked
+    user.is_verified = True
+    db.commit()
+    db.delete(db.get(User, "00003"))
+    db.commit()
+
+    stats = read_stats(db)
+    assert stats["total"] == 2
+    assert stats["status"] == {"active": 1, "locked": 1}
+    assert stats["user_type"] == {"user": 2}
+    assert stats["verified"] == {"true": 2}
+    assert stats["signup_day"] == {"2026-10-01": 1, "2026-10-02": 1}
+    # what the incremental path arrived at is what a full recount says
+    assert user_stats.reconcile() == 0
+
+
+def test_reconcile_repairs_drifted_counters(db):
+    add_user(db, "00001")
+    add_user(db, "00002", status=StatusEnum.inactive)
+    # a set-based update that did not adjust the counters
+    db.execute(update(User).where(User.user_id == "00001").values(status=StatusEnum.inactive))
+    db.commit()
+    assert read_stats(db)["status"]["active"] == 1
+
+    assert user_stats.reconcile() == 2
+    assert read_stats(db)["status"] == {"inactive": 2}
+    assert read_stats(db)["total"] == 2
+
+
+def test_one_worker_runs_each_reconciliation_pass(db):
+    add_user(db, "00001")
+    first, second = UserStats(), UserStats()
+    assert first.run_pass() == 0
+    # the lease is held for the interval; the holder renews it, everyone else skips
+    assert second.run_pass() is None
+    assert first.run_pass() == 0
+    # a recount a worker asked for itself is not held back
+    assert second.run_pass(requested=True) == 0
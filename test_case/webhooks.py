@@ -0,0 +1,118 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+
+from api.v1.models.user.user_auth import OutboxEvent, WebhookCursor
+from core import events
+from core.config import get_settings
+
+URL = "https://crm.example.com/hooks"
+
+
+def settings(**overrides):
+    values = {"WEBHOOK_URLS": URL, "WEBHOOK_SECRET": "s3cret", "WEBHOOK_BATCH_SIZE": 2, "WEBHOOK_MAX_IN_FLIGHT": 2}
+    values.update(overrides)
+    return get_settings().model_copy(update=values)
+
+
+def test_events_are_published_only_with_their_transaction(db):
+    events.publish(db, events.EMAIL_VERIFIED, {"email": "a@example.com"})
+    db.rollback()
+    events.publish(db, events.EMAIL_VERIFIED, {"email": "b@example.com"})
+    db.commit()
+    assert [row.payload for row in db.query(OutboxEvent)] == [{"email": "b@example.com"}]
+
+
+def test_batches_are_signed_and_the_cursor_stops_at_the_first_failure(db):
+    received, failing = [], {"first_id": 3}
+
+    def handler(request):
+        body = json.loads(request.content)
+        ids = [item["id"] for item in body["events"]]
+        signature = events.sign("s3cret", request.headers["x-webhook-timestamp"], request.content)
+        assert request.headers["x-webhook-signature"] == f"sha256={signature}"
+        if ids[0] == failing["first_id"]:
+            return httpx.Response(503)
+        received.append(ids)
+        return httpx.Response(200)
+
+    async def scenario():
+        dispatcher = events.WebhookDispatcher(transport=httpx.MockTransport(handler))
+        await dispatcher.start()
+        try:
+            subscriber = events.Subscriber(URL)
+            # a new subscriber starts at the end of the outbox
+            assert await dispatcher.deliver(subscriber, settings()) is False
+            for index in range(1, 7):
+                events.publish(db, events.USER_REGISTERED, {"user_id": f"{index:05d}"})
+            db.commit()
+
+            # batches [1, 2] and [3, 4] go out together; the second fails, so the cursor stays at 2
+            assert await dispatcher.deliver(subscriber, settings()) is False
+            assert subscriber.failures == 1 and subscriber.retry_at > 0
+            assert db.get(WebhookCursor, URL).last_event_id == 2
+
+            failing["first_id"] = None
+            assert await dispatcher.deliver(subscriber, settings()) is True
+            assert await dispatcher.deliver(subscriber, settings()) is False
+            db.expire_all()
+            assert db.get(WebhookCursor, URL).last_event_id == 6
+            assert subscriber.failures == 0
+
+            # another worker cannot deliver while the lease is held
+            other = events.WebhookDispatcher(transport=httpx.MockTransport(handler))
+            assert events.claim(URL, other.owner, 30) is None
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(scenario())
+    assert received == [[1, 2], [3, 4], [5, 6]]
+    # every subscriber is past every event, so all of them can go
+    assert events.purge([URL], retention_hours=0) == 6
+
+
+def test_events_committed_out_of_order_wait_for_the_missing_id(db):
+    received = []
+
+    def handler(request):
+        received.append([item["id"] for item in json.loads(request.content)["events"]])
+        return httpx.Response(200)
+
+    def commit_event(event_id, age_seconds=0):
+        # sqlite serialises writers, so the ids are set by hand to commit them out of order
+        db.add(OutboxEvent(id=event_id, event_type=events.USER_REGISTERED, payload={}, created_at=datetime.utcnow() - timedelta(seconds=age_seconds)))
+        db.commit()
+
+    async def scenario():
+        dispatcher = events.WebhookDispatcher(transport=httpx.MockTransport(handler))
+        await dispatcher.start()
+        try:
+            subscriber = events.Subscriber(URL)
+            assert await dispatcher.deliver(subscriber, settings()) is False
+
+            # 2 commits while 1 is still in flight: nothing goes out until 1 does
+            commit_event(2)
+            assert await dispatcher.deliver(subscriber, settings()) is False
+            assert received == []
+            commit_event(1)
+            assert await dispatcher.deliver(subscriber, settings()) is False
+            assert received == [[1, 2]]
+
+            # 3 never commits; 4 waits for the grace window, then goes out past the gap
+            commit_event(4)
+            assert await dispatcher.deliver(subscriber, settings()) is False
+            assert received == [[1, 2]]
+            assert await dispatcher.deliver(subscriber, settings(WEBHOOK_GAP_GRACE_SECONDS=0)) is False
+            assert received == [[1, 2], [4]]
+            db.expire_all()
+            assert db.get(WebhookCursor, URL).last_event_id == 4
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(scenario())
@@ -2,29 +2,26 @@ from datetime import datetime
 import re
 import uuid
 from typing import Optional, Dict, Any, Union, List
-import os
-from dotenv import load_dotenv
 from pathlib import Path
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from api.v1.models.user.user_auth import User
-
-load_dotenv()
+from api.v1.models.user.user_auth import IdSequence, User
+from core.config import get_settings
 
 # ------------------------------------------------- validate username -------------------------------------------------
 
-USERNAME_MIN_LEN = int(os.getenv("USERNAME_MIN_LEN", 3))  
-USERNAME_MAX_LEN = int(os.getenv("USERNAME_MAX_LEN", 30))  
-
 def validate_username(username: str) -> Dict[str, Any]:
     if not username:
         return {"valid": False, "message": "Username cannot be empty"}
     
-    if len(username) < USERNAME_MIN_LEN:
-        return {"valid": False, "message":f"Username must be at least {USERNAME_MIN_LEN} characters long."}
+    settings = get_settings()
+    if len(username) < settings.USERNAME_MIN_LEN:
+        return {"valid": False, "message":f"Username must be at least {settings.USERNAME_MIN_LEN} characters long."}
     
-    if len(username) > USERNAME_MAX_LEN:
-        return {"valid": False, "message": f"Username cannot exceed {USERNAME_MAX_LEN} characters."}
+    if len(username) > settings.USERNAME_MAX_LEN:
+        return {"valid": False, "message": f"Username cannot exceed {settings.USERNAME_MAX_LEN} characters."}
     
     if not re.match(r'^[a-zA-Z]+$', username):
         return {"valid": False, "message": "Username must contain only alphabets."}
@@ -101,10 +98,31 @@ def validate_password_strength(password: str) -> Dict[str, Any]:
  
 #------------------------------------------------- user_id format ------------------------------------------------
 
+USER_ID_SEQUENCE = "user_id"
+
+
 def generate_next_user_id(db: Session) -> str:
-    last_user = db.query(User).order_by(User.user_id.desc()).first()
-    next_id = int(last_user.user_id) + 1 if last_user else 1
-    return str(next_id).zfill(5)
+    # taken from a counter row on the primary in a transaction of its own: the row lock hands concurrent
+    # registrations on any worker or shard distinct ids, and is held only for the increment. An id whose
+    # registration then fails is skipped, not reused
+    from db import session as db_session
+
+    sequence = IdSequence.__table__
+    while True:
+        with db_session.engine.begin() as conn:
+            if conn.execute(update(sequence).where(sequence.c.name == USER_ID_SEQUENCE).values(value=sequence.c.value + 1)).rowcount:
+                return str(conn.execute(select(sequence.c.value).where(sequence.c.name == USER_ID_SEQUENCE)).scalar()).zfill(5)
+        # first id on this database: continue after the highest one taken (one row per shard when sharded).
+        # Ids are zero-padded, so the string max is the numeric max
+        last_ids = [user_id for (user_id,) in db.query(func.max(User.user_id)).select_from(User).all() if user_id]
+        next_id = int(max(last_ids)) + 1 if last_ids else 1
+        try:
+            with db_session.engine.begin() as conn:
+                conn.execute(insert(sequence).values(name=USER_ID_SEQUENCE, value=next_id))
+            return str(next_id).zfill(5)
+        except IntegrityError:
+            # another worker created the counter first; take the next value from it
+            continue
 
 #------------------------------------------------- validate date format -------------------------------------------------
 